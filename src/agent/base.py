@@ -1,13 +1,14 @@
 import asyncio
 import json
 import os
-import random
 from ctypes import Union
+from functools import partial
 from datetime import datetime, timedelta
 from typing import Literal, Optional, Type, cast
 from uu import Error
 from uuid import UUID, uuid4
 
+import numpy as np
 import pytz
 from colorama import Fore
 from langchain.output_parsers import OutputFixingParser, PydanticOutputParser
@@ -17,19 +18,22 @@ from pydantic import BaseModel
 from src.utils.database.base import Tables
 from src.utils.database.client import get_database
 from src.utils.discord import announce_bot_move
-from src.utils.logging import agent_logger
+from src.utils.logging import log_agent
 
 from ..event.base import Event, EventsManager, EventType, MessageEventSubtype
 from ..location.base import Location
 from ..memory.base import MemoryType, RelatedMemory, SingleMemory, get_relevant_memories
+from ..memory.index import MemoryIndex
 from ..tools.base import CustomTool, get_tools
 from ..tools.context import ToolContext
 from ..tools.name import ToolName
+from ..utils.bus import Topic, get_event_bus
+from ..utils.cache import DerivedCache
 from ..utils.colors import LogColor
-from ..utils.embeddings import get_embedding
+from ..utils.embeddings import get_embedding, get_embeddings
 from ..utils.formatting import print_to_console
 from ..utils.model_name import ChatModelName
-from ..utils.models import ChatModel
+from ..utils.models import ChatModel, Priority, llm_priority
 from ..utils.parameters import (
     DEFAULT_SMART_MODEL,
     DEFAULT_WORLD_ID,
@@ -40,7 +44,7 @@ from ..utils.parameters import (
 from ..utils.prompt import Prompter, PromptString
 from ..world.context import WorldContext
 from .executor import PlanExecutor, PlanExecutorResponse
-from .importance import ImportanceRatingResponse
+from .importance import ImportanceRatingResponse, ImportanceRatingsResponse
 from .message import (
     AgentMessage,
     LLMMessageResponse,
@@ -50,6 +54,7 @@ from .message import (
 from .plans import LLMPlanResponse, LLMSinglePlan, PlanStatus, SinglePlan
 from .react import LLMReactionResponse, Reaction
 from .reflection import ReflectionQuestions, ReflectionResponse
+from .step import StepGraph
 
 SUMMARIZE_ACTIVITY_INTERVAL = 20  # seconds
 
@@ -63,6 +68,7 @@ class Agent(BaseModel):
     last_checked_events: datetime
     last_summarized_activity: datetime
     memories: list[SingleMemory]
+    memory_index: MemoryIndex = None
     plans: list[SinglePlan]
     authorized_tools: list[ToolName]
     world_id: UUID
@@ -73,9 +79,12 @@ class Agent(BaseModel):
     discord_bot_token: str = None
     react_response: LLMReactionResponse = None
     recent_activity: str = ""
+    # Values derived from the agent's memories, like the activity summary
+    derived: DerivedCache = None
 
     class Config:
         allow_underscore_names = True
+        arbitrary_types_allowed = True
 
     def __init__(
         self,
@@ -123,6 +132,10 @@ class Agent(BaseModel):
             recent_activity=recent_activity,
         )
 
+        # keep the memory embeddings and scoring fields in contiguous arrays
+        self.memory_index = MemoryIndex(self.memories)
+        self.derived = DerivedCache()
+
         print("\n\nAGENT INITIALIZED --------------------------\n")
         print(self)
 
@@ -312,25 +325,71 @@ class Agent(BaseModel):
         related_memory_ids: list[UUID] = [],
         log: bool = True,
     ) -> SingleMemory:
-        memory = SingleMemory(
-            agent_id=self.id,
+        memories = await self._add_memories(
+            [description],
+            created_at=[created_at],
             type=type,
-            description=description,
-            importance=await self._calculate_importance(description),
-            embedding=await get_embedding(description),
             related_memory_ids=related_memory_ids,
-            created_at=created_at,
+            log=log,
+        )
+
+        return memories[0]
+
+    async def _add_memories(
+        self,
+        descriptions: list[str],
+        created_at: Optional[list[datetime]] = None,
+        type: MemoryType = MemoryType.OBSERVATION,
+        related_memory_ids: list[UUID] = [],
+        log: bool = True,
+        importances: Optional[list[int]] = None,
+        embeddings: Optional[list[np.ndarray]] = None,
+    ) -> list[SingleMemory]:
+        """Rates, embeds and stores several memories with one request of each kind"""
+        if len(descriptions) == 0:
+            return []
+
+        if created_at is None:
+            created_at = [datetime.now(pytz.utc)] * len(descriptions)
+
+        # callers can pass ratings or embeddings they already have
+        importances, embeddings = await asyncio.gather(
+            self._calculate_importances(descriptions)
+            if importances is None
+            else asyncio.sleep(0, importances),
+            get_embeddings(descriptions)
+            if embeddings is None
+            else asyncio.sleep(0, embeddings),
         )
 
-        self.memories.append(memory)
+        memories = [
+            SingleMemory(
+                agent_id=self.id,
+                type=type,
+                description=description,
+                importance=importance,
+                embedding=embedding,
+                related_memory_ids=related_memory_ids,
+                created_at=memory_created_at,
+            )
+            for description, importance, embedding, memory_created_at in zip(
+                descriptions, importances, embeddings, created_at
+            )
+        ]
+
+        # add to database, all rows in one insert
+        await (await get_database()).insert(
+            Tables.Memories, [memory.db_dict() for memory in memories]
+        )
 
-        # add to database
-        await (await get_database()).insert(Tables.Memories, memory.db_dict())
+        for memory in memories:
+            self.memories.append(memory)
+            self.memory_index.add(memory)
 
-        if log:
-            self._log("New Memory", f"{memory}")
+            if log:
+                self._log("New Memory", f"{memory}")
 
-        return memory
+        return memories
 
     async def _update_agent_row(self):
         row = {
@@ -345,9 +404,20 @@ class Agent(BaseModel):
         return await (await get_database()).update(Tables.Agents, str(self.id), row)
 
     async def _upsert_plan_rows(self, plans: list[SinglePlan]):
-        database = await get_database()
-        for plan in plans:
-            await database.insert(Tables.Plans, plan._db_dict(), upsert=True)
+        await (await get_database()).insert(
+            Tables.Plans, [plan._db_dict() for plan in plans], upsert=True
+        )
+
+    @property
+    def is_waiting(self) -> bool:
+        """Whether the current plan's last action was waiting for something"""
+        if len(self.plans) == 0 or self.plans[0].status != PlanStatus.IN_PROGRESS:
+            return False
+        scratchpad = self.plans[0].scratchpad
+        return (
+            len(scratchpad) > 0
+            and scratchpad[-1]["action"]["tool"].strip() == ToolName.WAIT.value
+        )
 
     def update_plan(self, new_plan: SinglePlan):
         old_plan = [
@@ -400,9 +470,7 @@ class Agent(BaseModel):
         }
 
     async def _summarize_activity(self, k: int = 20) -> str:
-        recent_memories = sorted(
-            self.memories, key=lambda memory: memory.created_at, reverse=True
-        )[:k]
+        recent_memories = self.memory_index.sorted_by_created_at(reverse=True)[:k]
 
         if len(recent_memories) == 0:
             return "I haven't done anything recently."
@@ -425,11 +493,37 @@ class Agent(BaseModel):
         )
 
         self.recent_activity = response
+        self.last_summarized_activity = datetime.now(pytz.utc)
 
         return response
 
+    async def _get_recent_activity(self) -> str:
+        """The summary of recent activity, redone when there are new memories,
+        and at most every SUMMARIZE_ACTIVITY_INTERVAL"""
+        if (
+            datetime.now(pytz.utc) - self.last_summarized_activity
+        ).total_seconds() <= SUMMARIZE_ACTIVITY_INTERVAL:
+            return self.recent_activity
+
+        return await self.derived.get(
+            "recent_activity",
+            self.id,
+            self.memory_index.version,
+            self._summarize_activity,
+        )
+
     def _log(self, title: str, description: str = ""):
-        agent_logger.info(f"[{self.full_name}] [{self.color}] [{title}] {description}")
+        log_agent(self.id, self.full_name, self.color, title, description)
+        get_event_bus().publish(
+            Topic.LOG,
+            {
+                "agent_id": str(self.id),
+                "agentName": self.full_name,
+                "color": self.color.name,
+                "title": title,
+                "description": description,
+            },
+        )
         print_to_console(f"[{self.full_name}] {title}", self.color, description)
 
     async def _calculate_importance(self, memory_description: str) -> int:
@@ -463,6 +557,49 @@ class Agent(BaseModel):
 
         return rating
 
+    async def _calculate_importances(self, memory_descriptions: list[str]) -> list[int]:
+        """Rates several memories in a single LLM request"""
+        if len(memory_descriptions) == 1:
+            return [await self._calculate_importance(memory_descriptions[0])]
+
+        complex_llm = ChatModel(DEFAULT_SMART_MODEL, temperature=0)
+
+        importance_parser = OutputFixingParser.from_llm(
+            parser=PydanticOutputParser(pydantic_object=ImportanceRatingsResponse),
+            llm=complex_llm.defaultModel,
+        )
+
+        importance_prompter = Prompter(
+            PromptString.IMPORTANCE_BATCH,
+            {
+                "full_name": self.full_name,
+                "private_bio": self.private_bio,
+                "memory_descriptions": "\n".join(
+                    f"{index}. {description}"
+                    for index, description in enumerate(memory_descriptions, start=1)
+                ),
+                "format_instructions": importance_parser.get_format_instructions(),
+            },
+        )
+
+        response = await complex_llm.get_chat_completion(
+            importance_prompter.prompt,
+            loading_text="🤔 Calculating memory importance...",
+        )
+
+        parsed_response: ImportanceRatingsResponse = importance_parser.parse(response)
+
+        # If the ratings don't line up with the memories, rate them one at a time
+        if len(parsed_response.ratings) != len(memory_descriptions):
+            return await asyncio.gather(
+                *[
+                    self._calculate_importance(description)
+                    for description in memory_descriptions
+                ]
+            )
+
+        return parsed_response.ratings
+
     def _get_current_tools(self) -> list[CustomTool]:
         location_tools = self.location.available_tools
 
@@ -513,24 +650,33 @@ class Agent(BaseModel):
         self.location = location
         self.context.update_agent(self._db_dict())
 
-        # update agent in db
-        await self._update_agent_row(),
+        async with (await get_database()).transaction():
+            # update agent in db
+            await self._update_agent_row()
+
+            # Add events to the events manager, which handles the DB updates
+            await self.context.add_event(departure_event)
+            await self.context.add_event(arrival_event)
+
+        get_event_bus().publish(
+            Topic.AGENT,
+            {
+                "id": str(self.id),
+                "full_name": self.full_name,
+                "location_id": str(location.id),
+                "location": location.name,
+            },
+        )
 
         if DISCORD_ENABLED:
             await announce_bot_move(
                 self.full_name, old_location.channel_id, location.channel_id
             )
 
-        # Add events to the events manager, which handles the DB updates
-        await self.context.add_event(departure_event)
-        await self.context.add_event(arrival_event)
-
     async def _reflect(self):
-        recent_memories = sorted(
-            self.memories,
-            key=lambda memory: memory.last_accessed or memory.created_at,
-            reverse=True,
-        )[:REFLECTION_MEMORY_COUNT]
+        recent_memories = self.memory_index.sorted_by_last_accessed(reverse=True)[
+            :REFLECTION_MEMORY_COUNT
+        ]
 
         self._log("Reflection", "Beginning reflection... 🤔")
 
@@ -566,7 +712,9 @@ class Agent(BaseModel):
         # For each question in the parsed questions...
         for question in parsed_questions_response.questions:
             # Get the related memories
-            related_memories = await get_relevant_memories(question, self.memories, 20)
+            related_memories = await get_relevant_memories(
+                question, self.memory_index, 20
+            )
 
             # Format them into a string
             memory_strings = [
@@ -662,11 +810,14 @@ class Agent(BaseModel):
 
         await self.context.add_event(event)
 
-    async def _plan(self, thought_process: str = "") -> list[SinglePlan]:
+    async def _plan(
+        self, thought_process: str = "", recent_activity: Optional[str] = None
+    ) -> list[SinglePlan]:
         """Trigger the agent's planning process
 
         Args:
             location_context (str): A description of the current location and list of the other agents in this location
+            recent_activity (str): The summary of recent activity, if it's already been fetched this step
         """
 
         self._log("Starting to Plan", "📝")
@@ -682,12 +833,8 @@ class Agent(BaseModel):
         )
 
         # Get a summary of the recent activity
-        if (
-            datetime.now(pytz.utc) - self.last_summarized_activity
-        ).total_seconds() > SUMMARIZE_ACTIVITY_INTERVAL:
-            recent_activity = await self._summarize_activity()
-        else:
-            recent_activity = self.recent_activity
+        if recent_activity is None:
+            recent_activity = await self._get_recent_activity()
 
         self._log("Recent Activity Summary", recent_activity)
 
@@ -779,11 +926,12 @@ class Agent(BaseModel):
         # update the local agent object
         self.plans = new_plans
 
-        # update the db agent row
-        await self._update_agent_row()
+        async with (await get_database()).transaction():
+            # update the db agent row
+            await self._update_agent_row()
 
-        # add the plans to the plan table
-        await self._upsert_plan_rows(new_plans)
+            # add the plans to the plan table
+            await self._upsert_plan_rows(new_plans)
 
         # Loop through each plan and print it to the console
         for index, plan in enumerate(new_plans):
@@ -794,7 +942,12 @@ class Agent(BaseModel):
 
         return new_plans
 
-    async def _react(self, events: list[Event]) -> LLMReactionResponse:
+    async def _react(
+        self,
+        events: list[Event],
+        recent_activity: Optional[str] = None,
+        conversation_history: Optional[str] = None,
+    ) -> LLMReactionResponse:
         """Get the recent activity and decide whether to replan to carry on"""
 
         self._log("React", "Deciding how to react to recent events...")
@@ -806,13 +959,12 @@ class Agent(BaseModel):
             llm=ChatModel(temperature=0).defaultModel,
         )
 
-        # Get a summary of the recent activity
-        if (
-            datetime.now(pytz.utc) - self.last_summarized_activity
-        ).total_seconds() > SUMMARIZE_ACTIVITY_INTERVAL:
-            recent_activity = await self._summarize_activity()
-        else:
-            recent_activity = self.recent_activity
+        # Get a summary of the recent activity and the conversations
+        if recent_activity is None:
+            recent_activity = await self._get_recent_activity()
+
+        if conversation_history is None:
+            conversation_history = await get_conversation_history(self.id, self.context)
 
         # Make the reaction prompter
         reaction_prompter = Prompter(
@@ -829,9 +981,7 @@ class Agent(BaseModel):
                     f"{index}. {event.description}"
                     for index, event in enumerate(events)
                 ],
-                "conversation_history": await get_conversation_history(
-                    self.id, self.context
-                ),
+                "conversation_history": conversation_history,
             },
         )
 
@@ -875,7 +1025,7 @@ class Agent(BaseModel):
             plan.related_message.get_event_message()
             if plan.related_message
             else plan.description,
-            memories=self.memories,
+            memories=self.memory_index,
             k=20,
         )
 
@@ -902,9 +1052,6 @@ class Agent(BaseModel):
             plan.status = resp.status
             self.update_plan(plan)
 
-            # update the plan in the db
-            await self._upsert_plan_rows([plan])
-
             # remove all plans with the same description
             self.plans = [p for p in self.plans if p.description != plan.description]
 
@@ -916,7 +1063,11 @@ class Agent(BaseModel):
                 location_id=self.location.id,
             )
 
-            event = await self.context.add_event(event)
+            async with (await get_database()).transaction():
+                # update the plan in the db
+                await self._upsert_plan_rows([plan])
+
+                event = await self.context.add_event(event)
 
         # If the plan is in progress
         elif resp.status == PlanStatus.IN_PROGRESS:
@@ -957,7 +1108,7 @@ class Agent(BaseModel):
 
         return resp.status
 
-    async def _do_first_plan(self) -> None:
+    async def _do_first_plan(self, recent_activity: Optional[str] = None) -> None:
         """Do the first plan in the list"""
 
         current_plan = None
@@ -966,7 +1117,7 @@ class Agent(BaseModel):
         # If we have no plans, make some
         if len(self.plans) == 0:
             print(f"{self.full_name} has no plans, making some...")
-            await self._plan()
+            await self._plan(recent_activity=recent_activity)
 
         current_plan = self.plans[0]
 
@@ -990,16 +1141,22 @@ class Agent(BaseModel):
         )
 
         if len(events) > 0:
+            # Importance depends on the agent, but the embeddings are shared
+            # with every other witness of the same events
+            importances, embeddings = await asyncio.gather(
+                self._calculate_importances([event.description for event in events]),
+                self.context.events_manager.get_event_embeddings(events),
+            )
+
             # Make new memories based on the events
-            new_memories = [
-                await self._add_memory(
-                    event.description,
-                    created_at=event.timestamp,
-                    type=MemoryType.OBSERVATION,
-                    log=False,
-                )
-                for event in events
-            ]
+            new_memories = await self._add_memories(
+                [event.description for event in events],
+                created_at=[event.timestamp for event in events],
+                type=MemoryType.OBSERVATION,
+                log=False,
+                importances=importances,
+                embeddings=embeddings,
+            )
 
         return events
 
@@ -1031,9 +1188,7 @@ class Agent(BaseModel):
         current_plans = "\n".join(plans_to_do) if len(plans_to_do) > 0 else "No plans"
 
         # Sort memories in reverse chronological order
-        sorted_memories = sorted(
-            self.memories, key=lambda m: m.created_at, reverse=True
-        )
+        sorted_memories = self.memory_index.sorted_by_created_at(reverse=True)
 
         memories = "\n".join(
             [
@@ -1048,31 +1203,69 @@ class Agent(BaseModel):
             )
 
     async def run_for_one_step(self):
-        await asyncio.sleep(random.random() * 3)
-
-        events = await self.observe()
-
-        # if there's no current plan, make some
-        if len(self.plans) == 0:
-            print(f"{self.full_name} has no plans, making some...")
-            await self._plan()
-
-        # Decide how to react to these events
-        self.react_response = await self._react(events)
-
-        # If the reaction calls to cancel the current plan, remove the first one
-        if self.react_response.reaction == Reaction.CANCEL:
-            self.plans = self.plans[1:]
-
-        # If the reaction calls to postpone the current plan, insert the new plan at the top
-        elif self.react_response.reaction == Reaction.POSTPONE:
-            self.plans.insert(0, self.react_response.new_plan)
+        # Each stage starts as soon as the ones it needs are done, so the
+        # activity summary (an LLM call) and the conversation history (a
+        # database read) are fetched together, and both are shared by
+        # planning and reacting
+        step = StepGraph()
+
+        async def plan_if_needed(recent_activity: str):
+            # if there's no current plan, make some
+            if len(self.plans) == 0:
+                print(f"{self.full_name} has no plans, making some...")
+                await self._plan(recent_activity=recent_activity)
+
+        async def react(
+            events: list[Event], recent_activity: str, conversation_history: str
+        ):
+            # Decide how to react to these events
+            with llm_priority(Priority.HIGH):
+                self.react_response = await self._react(
+                    events,
+                    recent_activity=recent_activity,
+                    conversation_history=conversation_history,
+                )
 
-        # Work through the plans
-        await self._do_first_plan()
+            # If the reaction calls to cancel the current plan, remove the first one
+            if self.react_response.reaction == Reaction.CANCEL:
+                self.plans = self.plans[1:]
+
+            # If the reaction calls to postpone the current plan, insert the new plan at the top
+            elif self.react_response.reaction == Reaction.POSTPONE:
+                self.plans.insert(0, self.react_response.new_plan)
+
+        async def act(recent_activity: str):
+            # Work through the plans
+            with llm_priority(Priority.HIGH):
+                await self._do_first_plan(recent_activity=recent_activity)
+
+        async def reflect_if_needed():
+            # Reflect, if we should. Nothing waits on it, so it yields the
+            # rate limits to agents that are reacting or acting
+            if await self._should_reflect():
+                with llm_priority(Priority.LOW):
+                    await self._reflect()
+
+        step.add("observe", self.observe)
+        step.add("recent_activity", self._get_recent_activity, after=["observe"])
+        step.add(
+            "conversation_history",
+            partial(get_conversation_history, self.id, self.context),
+            after=["observe"],
+        )
+        step.add("plan", plan_if_needed, "recent_activity")
+        step.add(
+            "react",
+            react,
+            "observe",
+            "recent_activity",
+            "conversation_history",
+            after=["plan"],
+        )
+        step.add("act", act, "recent_activity", after=["react"])
+        step.add("reflect", reflect_if_needed, after=["act"])
+        step.add("write_progress", self.write_progress_to_file, after=["reflect"])
 
-        # Reflect, if we should
-        if await self._should_reflect():
-            await self._reflect()
+        await step.run("write_progress")
 
-        await self.write_progress_to_file()
+        self._log("Step Timings", step.timings_summary())
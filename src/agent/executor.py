@@ -23,7 +23,7 @@ from langchain.tools import BaseTool
 from pydantic import BaseModel
 from typing_extensions import override
 
-from src.utils.logging import agent_logger
+from src.utils.logging import log_agent
 from src.world.context import WorldContext
 
 from ..memory.base import SingleMemory
@@ -255,7 +255,7 @@ class PlanExecutor(BaseModel):
 
         # Make the conversation history
         conversation_history = await get_conversation_history(
-            self.context.get_agent_location_id(self.agent_id), self.context
+            self.agent_id, self.context
         )
 
         # Make the relevant memories string
@@ -285,9 +285,7 @@ class PlanExecutor(BaseModel):
 
             log_color = self.context.get_agent_color(self.agent_id)
 
-            agent_logger.info(
-                f"[{agent_name}] [{log_color}] [{prefix_text}] {log_content}"
-            )
+            log_agent(self.agent_id, agent_name, log_color, prefix_text, log_content)
             print_to_console(
                 f"[{agent_name}] {prefix_text}: ",
                 log_color,
@@ -335,9 +333,7 @@ class PlanExecutor(BaseModel):
 
             log_color = self.context.get_agent_color(self.agent_id)
 
-            agent_logger.info(
-                f"[{agent_name}] [{log_color}] [Action Response] {result}"
-            )
+            log_agent(self.agent_id, agent_name, log_color, "Action Response", result)
 
             print_to_console(
                 f"[{agent_name}] Action Response: ",
@@ -361,7 +357,7 @@ class PlanExecutor(BaseModel):
 
         log_color = self.context.get_agent_color(self.agent_id)
 
-        agent_logger.info(f"[{agent_name}] [{log_color}] [Action Response] {result}")
+        log_agent(self.agent_id, agent_name, log_color, "Action Response", result)
 
         print_to_console(
             f"[{agent_name}] Action Response: ",
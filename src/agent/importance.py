@@ -10,3 +10,17 @@ class ImportanceRatingResponse(BaseModel):
             raise ValueError(f"rating must be between 1 and 10. Got: {rating}")
 
         return rating
+
+
+class ImportanceRatingsResponse(BaseModel):
+    ratings: list[int] = Field(
+        description="Importance integers from 1 to 10, one per memory, in order"
+    )
+
+    @validator("ratings")
+    def validate_ratings(cls, ratings):
+        for rating in ratings:
+            if rating < 1 or rating > 10:
+                raise ValueError(f"rating must be between 1 and 10. Got: {rating}")
+
+        return ratings
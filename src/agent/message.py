@@ -233,6 +233,19 @@ async def get_conversation_history(
     if isinstance(agent_id, str):
         agent_id = UUID(agent_id)
 
+    # only rebuilt once the events the agent witnessed have changed
+    events_manager = context.events_manager
+    await events_manager.refresh_if_stale()
+
+    return await events_manager.derived.get(
+        "conversation_history",
+        agent_id,
+        events_manager.event_store.witness_version(agent_id),
+        lambda: _format_conversation_history(agent_id, context),
+    )
+
+
+async def _format_conversation_history(agent_id: UUID, context: WorldContext) -> str:
     # get all the messages sent at the location witnessed by the agent_id
     (message_events, _) = await context.events_manager.get_events(
         type=EventType.MESSAGE,
@@ -0,0 +1,65 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Iterable
+
+
+class StepGraph:
+    """Runs the stages of an agent step, each as soon as the ones it needs are done.
+
+    A stage is an async function of the results of the stages it requires, and
+    it can also wait for stages whose results it doesn't take (after). Each
+    stage runs at most once per graph, so stages that need the same value
+    share one call, and the seconds each stage spent running (not waiting on
+    other stages) are kept in timings.
+    """
+
+    def __init__(self):
+        self.stages: dict[
+            str, tuple[Callable[..., Awaitable], tuple[str, ...], tuple[str, ...]]
+        ] = {}
+        self.tasks: dict[str, asyncio.Task] = {}
+        self.timings: dict[str, float] = {}
+
+    def add(
+        self,
+        name: str,
+        func: Callable[..., Awaitable],
+        *requires: str,
+        after: Iterable[str] = (),
+    ):
+        after = tuple(after)
+        for requirement in requires + after:
+            if requirement not in self.stages:
+                raise ValueError(f"Stage {name} requires unknown stage {requirement}")
+        self.stages[name] = (func, requires, after)
+
+    async def get(self, name: str) -> Any:
+        if name not in self.tasks:
+            self.tasks[name] = asyncio.create_task(self._run_stage(name))
+        # one caller being cancelled shouldn't cancel the stage for the others
+        return await asyncio.shield(self.tasks[name])
+
+    async def _run_stage(self, name: str) -> Any:
+        func, requires, after = self.stages[name]
+        results = await asyncio.gather(
+            *[self.get(requirement) for requirement in requires + after]
+        )
+
+        start = time.perf_counter()
+        try:
+            return await func(*results[: len(requires)])
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    async def run(self, *names: str) -> list[Any]:
+        """Runs the stages and everything they require, returns their results"""
+        try:
+            return await asyncio.gather(*[self.get(name) for name in names])
+        finally:
+            for task in self.tasks.values():
+                task.cancel()
+
+    def timings_summary(self) -> str:
+        return ", ".join(
+            f"{name} {seconds:.2f}s" for name, seconds in self.timings.items()
+        )
@@ -0,0 +1,131 @@
+"""Compares EventStore queries against the list comprehensions get_events used to run.
+
+Run with `poetry run bench-events -- --events 10000 100000`.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import numpy as np
+import pytz
+
+from ..event.base import Event, EventType
+from ..event.store import EventStore
+
+
+def make_events(count: int, agents: int, locations: int, seed: int):
+    rng = np.random.default_rng(seed)
+    agent_ids = [uuid4() for _ in range(agents)]
+    location_ids = [uuid4() for _ in range(locations)]
+    start = datetime.now(pytz.utc) - timedelta(seconds=count)
+
+    events = []
+    for i in range(count):
+        witnesses = rng.choice(agents, size=int(rng.integers(1, 6)), replace=False)
+        events.append(
+            Event(
+                type=EventType.MESSAGE if rng.random() < 0.3 else EventType.NON_MESSAGE,
+                description=f"event {i}",
+                location_id=location_ids[int(rng.integers(locations))],
+                agent_id=agent_ids[int(witnesses[0])],
+                witness_ids=[agent_ids[int(witness)] for witness in witnesses],
+                timestamp=start + timedelta(seconds=i),
+            )
+        )
+
+    return events, agent_ids, location_ids
+
+
+def scan(
+    events: list[Event],
+    location_id=None,
+    type=None,
+    after=None,
+    witness_ids=None,
+) -> list[Event]:
+    """The filters get_events ran before the store, kept as the baseline"""
+    filtered_events = events
+    if after is not None:
+        filtered_events = [
+            event for event in filtered_events if event.timestamp > after
+        ]
+
+    if location_id is not None:
+        filtered_events = [
+            event
+            for event in filtered_events
+            if str(event.location_id) == str(location_id)
+        ]
+
+    if type is not None:
+        filtered_events = [event for event in filtered_events if event.type == type]
+
+    if witness_ids is not None:
+        filtered_events = [
+            event
+            for event in filtered_events
+            if set(list(map(str, witness_ids))).issubset(
+                set(list(map(str, event.witness_ids)))
+            )
+        ]
+
+    return filtered_events
+
+
+def timed(func, repeats: int, **kwargs):
+    result = func(**kwargs)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func(**kwargs)
+    return result, (time.perf_counter() - start) / repeats
+
+
+def run(count: int, agents: int, locations: int, repeats: int):
+    events, agent_ids, location_ids = make_events(count, agents, locations, seed=0)
+
+    store = EventStore(capacity=count)
+    start = time.perf_counter()
+    for event in events:
+        store.add(event)
+    print(
+        f"{count} events, {agents} agents, {locations} locations: "
+        f"indexed in {time.perf_counter() - start:.2f}s"
+    )
+
+    queries = {
+        "observe (after, witness)": dict(
+            after=events[-200].timestamp, witness_ids=[agent_ids[0]]
+        ),
+        "conversation (type, witness)": dict(
+            type=EventType.MESSAGE, witness_ids=[agent_ids[0]]
+        ),
+        "location": dict(location_id=location_ids[0]),
+        "after only": dict(after=events[-200].timestamp),
+    }
+
+    print(f"{'query':<32}{'scan':>12}{'indexed':>12}{'matches':>10}")
+    for name, filters in queries.items():
+        expected, scan_seconds = timed(scan, repeats, events=events, **filters)
+        result, store_seconds = timed(store.query, repeats, **filters)
+        assert [event.id for event in result] == [event.id for event in expected]
+        print(
+            f"{name:<32}{1000 * scan_seconds:>9.3f} ms{1000 * store_seconds:>9.3f} ms"
+            f"{len(result):>10}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--agents", type=int, default=25)
+    parser.add_argument("--locations", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    for count in args.events:
+        run(count, args.agents, args.locations, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Compares approximate (IVF) memory retrieval against the exact scan.
+
+Run with `poetry run bench-memory -- --memories 100000`.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import numpy as np
+import pytz
+
+from ..memory.base import MemoryType, SingleMemory
+from ..memory.index import MemoryIndex
+
+
+def make_memories(count: int, dimensions: int, clusters: int, seed: int):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimensions))
+    agent_id = uuid4()
+    now = datetime.now(pytz.utc)
+
+    memories = []
+    for i in range(count):
+        center = centers[rng.integers(clusters)]
+        memories.append(
+            SingleMemory(
+                agent_id=agent_id,
+                type=MemoryType.OBSERVATION,
+                description=f"memory {i}",
+                importance=int(rng.integers(1, 11)),
+                embedding=center + rng.normal(scale=0.5, size=dimensions),
+                created_at=now - timedelta(seconds=int(rng.integers(0, 86400))),
+            )
+        )
+
+    return memories, centers
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run(memories: int, dimensions: int, queries: int, k: int, probes: list[int]):
+    data, centers = make_memories(memories, dimensions, clusters=256, seed=0)
+
+    index, build_seconds = timed(MemoryIndex, data, ann_threshold=None)
+    _, train_seconds = timed(index.build_ann)
+    print(
+        f"{memories} memories x {dimensions} dims: "
+        f"built in {build_seconds:.2f}s, IVF trained in {train_seconds:.2f}s"
+    )
+
+    rng = np.random.default_rng(1)
+    query_embeddings = [
+        centers[rng.integers(len(centers))] + rng.normal(scale=0.5, size=dimensions)
+        for _ in range(queries)
+    ]
+
+    exact_results = []
+    exact_seconds = 0.0
+    for query in query_embeddings:
+        rows, seconds = timed(index.top_k, query, k, exact=True)
+        exact_results.append(set(rows.tolist()))
+        exact_seconds += seconds
+
+    print(f"exact:        {1000 * exact_seconds / queries:8.2f} ms/query")
+
+    for n_probe in probes:
+        recall = 0.0
+        approximate_seconds = 0.0
+        for query, expected in zip(query_embeddings, exact_results):
+            rows, seconds = timed(index._approximate_top_k, query, k, n_probe)
+            recall += len(expected & set(rows.tolist())) / len(expected)
+            approximate_seconds += seconds
+
+        print(
+            f"n_probe={n_probe:<5} {1000 * approximate_seconds / queries:8.2f} ms/query"
+            f"  recall@{k}={recall / queries:.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--memories", type=int, default=100000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("-k", type=int, default=20)
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    run(args.memories, args.dimensions, args.queries, args.k, args.probes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""Simulates a world with each AgentScheduler and compares how fast agents answer messages.
+
+Agents are stand-ins that make a fixed number of API calls per step instead
+of real LLM calls, and a step takes --step-seconds of real time, which
+counts as one simulated minute. Visitors message random agents, an agent
+that reads a message answers it, and some conversations go back and forth.
+A share of the agents are waiting on something for the whole run, and the
+calls they make only to find they're still waiting are counted as idle.
+Like the wait tool, they park until a message wakes them or the wait times out.
+
+Agents step --concurrency at a time, AGENT_CONCURRENCY by default like
+World.run. Run with `poetry run bench-scheduling -- --agents 12`.
+"""
+import argparse
+import asyncio
+from datetime import datetime
+from uuid import uuid4
+
+import numpy as np
+import pytz
+
+from ..event.base import (
+    WAIT_TIMEOUT_SECONDS,
+    Event,
+    EventsManager,
+    EventType,
+    MessageEventSubtype,
+    WaitSubscription,
+)
+from ..world.scheduler import (
+    AGENT_CONCURRENCY,
+    AgentScheduler,
+    PriorityScheduler,
+    RoundRobinScheduler,
+)
+
+# API calls a step makes: observe, react and act
+CALLS_PER_STEP = 3
+# A waiting agent only checks whether what it waits for has happened
+CALLS_PER_WAITING_STEP = 1
+
+
+class SimulatedEventsManager(EventsManager):
+    """Events only come from the simulation, there's no database to refresh from"""
+
+    async def refresh_events(self) -> None:
+        return
+
+
+class SimulatedAgent:
+    def __init__(self, simulation: "Simulation", waiting: bool):
+        self.simulation = simulation
+        self.id = uuid4()
+        self.last_checked_events = datetime.now(pytz.utc)
+        self.is_waiting = waiting
+
+    async def run_for_one_step(self):
+        simulation = self.simulation
+        last_checked_events = self.last_checked_events
+        self.last_checked_events = datetime.now(pytz.utc)
+
+        events = [
+            event
+            for event in simulation.events_manager.event_store.query(
+                after=last_checked_events, type=EventType.MESSAGE, witness_ids=[self.id]
+            )
+            if event.agent_id != self.id
+        ]
+
+        if self.is_waiting and not events:
+            # a step that only finds it's still waiting
+            simulation.api_calls += CALLS_PER_WAITING_STEP
+            simulation.idle_calls += CALLS_PER_WAITING_STEP
+            simulation.events_manager.subscribe_wait(
+                WaitSubscription(
+                    self.id, "waiting", embedding=None, timeout=simulation.wait_timeout
+                )
+            )
+        else:
+            simulation.api_calls += CALLS_PER_STEP
+        await asyncio.sleep(simulation.step_seconds)
+
+        # answer every message read this step, in one reply each
+        for event in events:
+            simulation.latencies.append(
+                (datetime.now(pytz.utc) - event.timestamp).total_seconds()
+            )
+            turns = event.metadata["turns"] - 1
+            if turns > 0 and event.agent_id is not None:
+                simulation.send(self.id, event.agent_id, turns)
+
+
+class Simulation:
+    def __init__(
+        self,
+        scheduler_name: str,
+        agents: int,
+        waiting_share: float,
+        step_seconds: float,
+        seed: int,
+    ):
+        self.rng = np.random.default_rng(seed)
+        self.step_seconds = step_seconds
+        self.wait_timeout = WAIT_TIMEOUT_SECONDS * step_seconds
+        self.location_id = uuid4()
+        self.events_manager = SimulatedEventsManager(
+            world_id="simulation", recent_events=[]
+        )
+        self.agents = [
+            SimulatedAgent(self, waiting=i < agents * waiting_share)
+            for i in range(agents)
+        ]
+
+        if scheduler_name == "round_robin":
+            self.scheduler: AgentScheduler = RoundRobinScheduler()
+        else:
+            # the default backoffs, with a step standing in for a minute
+            self.scheduler = PriorityScheduler(
+                self.events_manager,
+                wait_backoff=5 * step_seconds,
+                max_wait_backoff=120 * step_seconds,
+            )
+        for agent in self.agents:
+            self.scheduler.add(agent)
+        self.api_calls = 0
+        self.idle_calls = 0
+        self.latencies: list[float] = []
+
+    def send(self, sender_id, recipient_id, turns: int):
+        self.events_manager.add_event(
+            Event(
+                type=EventType.MESSAGE,
+                subtype=MessageEventSubtype.AGENT_TO_AGENT
+                if sender_id
+                else MessageEventSubtype.HUMAN_AGENT_REPLY,
+                description="message",
+                location_id=self.location_id,
+                agent_id=sender_id,
+                witness_ids=[recipient_id] + ([sender_id] if sender_id else []),
+                timestamp=datetime.now(pytz.utc),
+                metadata={"turns": turns},
+            )
+        )
+
+    async def visitors(self, messages_per_minute: float, conversation_turns: int):
+        while True:
+            await asyncio.sleep(
+                self.rng.exponential(self.step_seconds / messages_per_minute)
+            )
+            recipient = self.agents[int(self.rng.integers(len(self.agents)))]
+            sender = self.agents[int(self.rng.integers(len(self.agents)))]
+            if sender is recipient:
+                self.send(None, recipient.id, 1)
+            else:
+                # a conversation between two agents, answered turn by turn
+                self.send(sender.id, recipient.id, conversation_turns)
+
+    async def agent_loop(self):
+        while True:
+            agent = await self.scheduler.next()
+            try:
+                await agent.run_for_one_step()
+            finally:
+                self.scheduler.done(agent)
+
+
+async def simulate(
+    name: str,
+    agents: int,
+    concurrency: int,
+    waiting_share: float,
+    messages_per_minute: float,
+    conversation_turns: int,
+    step_seconds: float,
+    seconds: float,
+):
+    simulation = Simulation(name, agents, waiting_share, step_seconds, seed=0)
+
+    tasks = [
+        asyncio.create_task(
+            simulation.visitors(messages_per_minute, conversation_turns)
+        )
+    ] + [asyncio.create_task(simulation.agent_loop()) for _ in range(concurrency)]
+
+    await asyncio.sleep(seconds)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    simulated_hours = seconds / step_seconds / 60
+    latencies = np.array(simulation.latencies) / step_seconds
+    return {
+        "replies": len(latencies),
+        "mean_latency": float(latencies.mean()) if len(latencies) else 0,
+        "p95_latency": float(np.percentile(latencies, 95)) if len(latencies) else 0,
+        "calls_per_hour": simulation.api_calls / simulated_hours,
+        "idle_calls_per_hour": simulation.idle_calls / simulated_hours,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--agents", type=int, default=12)
+    # as many at a time as World.run steps
+    parser.add_argument("--concurrency", type=int, default=AGENT_CONCURRENCY)
+    parser.add_argument("--waiting-share", type=float, default=0.5)
+    parser.add_argument("--messages-per-minute", type=float, default=0.5)
+    parser.add_argument("--conversation-turns", type=int, default=4)
+    parser.add_argument("--step-seconds", type=float, default=0.01)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    print(
+        f"{args.agents} agents ({args.waiting_share:.0%} waiting), "
+        f"{args.concurrency} at a time, {args.seconds / args.step_seconds / 60:.1f} "
+        "simulated hours"
+    )
+    print(
+        f"{'scheduler':<14}{'replies':>9}{'mean latency':>16}{'p95 latency':>16}"
+        f"{'calls/hour':>12}{'idle calls/hour':>17}"
+    )
+    for name in ["round_robin", "priority"]:
+        result = asyncio.run(
+            simulate(
+                name,
+                args.agents,
+                args.concurrency,
+                args.waiting_share,
+                args.messages_per_minute,
+                args.conversation_turns,
+                args.step_seconds,
+                args.seconds,
+            )
+        )
+        print(
+            f"{name:<14}{result['replies']:>9}{result['mean_latency']:>12.1f} min"
+            f"{result['p95_latency']:>12.1f} min{result['calls_per_hour']:>12.0f}"
+            f"{result['idle_calls_per_hour']:>17.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
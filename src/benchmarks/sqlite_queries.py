@@ -0,0 +1,206 @@
+"""Times the hot SQLite queries before and after the indexing migration.
+
+Run with `poetry run bench-sqlite -- --events 1000000`.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import aiosqlite
+import numpy as np
+import pytz
+
+from ..utils.database.base import Tables
+from ..utils.database.migrations import (
+    CACHED_STATEMENTS,
+    SCHEMA_VERSION,
+    configure,
+    migrate,
+)
+from ..utils.database.sqlite import SqliteDatabase, dict_factory
+
+INSERT_CHUNK_SIZE = 50000
+
+
+async def populate(
+    connection: aiosqlite.Connection,
+    worlds: int,
+    locations: int,
+    agents: int,
+    events: int,
+    memories: int,
+    seed: int,
+):
+    rng = np.random.default_rng(seed)
+    now = datetime.now(pytz.utc)
+
+    world_ids = [str(uuid4()) for _ in range(worlds)]
+    location_ids = [str(uuid4()) for _ in range(locations)]
+    agent_ids = [str(uuid4()) for _ in range(agents)]
+    location_worlds = [world_ids[i % worlds] for i in range(locations)]
+
+    await connection.executemany(
+        "INSERT INTO worlds (id, name) VALUES (?, ?)",
+        [(world_id, f"world {i}") for i, world_id in enumerate(world_ids)],
+    )
+    await connection.executemany(
+        "INSERT INTO locations (id, name, world_id) VALUES (?, ?, ?)",
+        [
+            (location_id, f"location {i}", location_worlds[i])
+            for i, location_id in enumerate(location_ids)
+        ],
+    )
+    await connection.executemany(
+        "INSERT INTO agents (id, full_name, world_id, location_id) VALUES (?, ?, ?, ?)",
+        [
+            (
+                agent_id,
+                f"agent {i}",
+                location_worlds[i % locations],
+                location_ids[i % locations],
+            )
+            for i, agent_id in enumerate(agent_ids)
+        ],
+    )
+    await connection.executemany(
+        "INSERT INTO documents (id, title, normalized_title, content) VALUES (?, ?, ?, ?)",
+        [(str(uuid4()), f"Doc {i}", f"doc {i}", "") for i in range(1000)],
+    )
+
+    for start in range(0, events, INSERT_CHUNK_SIZE):
+        count = min(INSERT_CHUNK_SIZE, events - start)
+        seconds_ago = rng.integers(0, 30 * 86400, count)
+        await connection.executemany(
+            "INSERT INTO events (id, timestamp, type, description, agent_id, location_id, witness_ids) VALUES (?, ?, 'non_message', ?, ?, ?, '[]')",
+            [
+                (
+                    str(uuid4()),
+                    str(now - timedelta(seconds=int(seconds_ago[i]))),
+                    f"event {start + i}",
+                    agent_ids[int(rng.integers(agents))],
+                    location_ids[int(rng.integers(locations))],
+                )
+                for i in range(count)
+            ],
+        )
+
+    for start in range(0, memories, INSERT_CHUNK_SIZE):
+        count = min(INSERT_CHUNK_SIZE, memories - start)
+        seconds_ago = rng.integers(0, 30 * 86400, count)
+        await connection.executemany(
+            "INSERT INTO memories (id, created_at, agent_id, type, description, importance) VALUES (?, ?, ?, 'observation', ?, 5)",
+            [
+                (
+                    str(uuid4()),
+                    str(now - timedelta(seconds=int(seconds_ago[i]))),
+                    agent_ids[int(rng.integers(agents))],
+                    f"memory {start + i}",
+                )
+                for i in range(count)
+            ],
+        )
+
+    await connection.commit()
+
+    return world_ids, agent_ids
+
+
+async def time_queries(
+    database: SqliteDatabase, world_id: str, agent_id: str, repeats: int
+) -> dict[str, float]:
+    since = str(datetime.now(pytz.utc) - timedelta(hours=1))
+
+    queries = {
+        "get_recent_events(500)": lambda: database.get_recent_events(world_id, 500),
+        "memories by agent_id": lambda: database.get_by_field(
+            Tables.Memories, "agent_id", agent_id
+        ),
+        "get_memories_since": lambda: database.get_memories_since(since, agent_id),
+        "locations by world_id": lambda: database.get_by_field(
+            Tables.Locations, "world_id", world_id
+        ),
+        "agents by world_id": lambda: database.get_by_field(
+            Tables.Agents, "world_id", world_id
+        ),
+        "documents by normalized_title": lambda: database.get_by_field(
+            Tables.Documents, "normalized_title", "doc 500"
+        ),
+    }
+
+    timings = {}
+    for name, query in queries.items():
+        await query()  # warm the page cache
+        start = time.perf_counter()
+        for _ in range(repeats):
+            await query()
+        timings[name] = (time.perf_counter() - start) / repeats
+
+    return timings
+
+
+async def run(events: int, memories: int, agents: int, repeats: int):
+    with tempfile.TemporaryDirectory() as directory:
+        connection = await aiosqlite.connect(
+            os.path.join(directory, "database.db"), cached_statements=CACHED_STATEMENTS
+        )
+        await configure(connection)
+        await migrate(connection, target=1)
+
+        start = time.perf_counter()
+        world_ids, agent_ids = await populate(
+            connection,
+            worlds=10,
+            locations=100,
+            agents=agents,
+            events=events,
+            memories=memories,
+            seed=0,
+        )
+        print(
+            f"{events} events, {memories} memories, {agents} agents: "
+            f"inserted in {time.perf_counter() - start:.1f}s"
+        )
+
+        connection.row_factory = dict_factory
+        SqliteDatabase.client = connection
+        database = SqliteDatabase()
+
+        before = await time_queries(database, world_ids[0], agent_ids[0], repeats)
+
+        connection.row_factory = None
+        start = time.perf_counter()
+        await migrate(connection)
+        print(
+            f"migrated to schema version {SCHEMA_VERSION} "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+        connection.row_factory = dict_factory
+
+        after = await time_queries(database, world_ids[0], agent_ids[0], repeats)
+
+        print(f"{'query':<32}{'no indexes':>14}{'indexed':>14}")
+        for name in before:
+            print(
+                f"{name:<32}{1000 * before[name]:>11.2f} ms{1000 * after[name]:>11.2f} ms"
+            )
+
+        await connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=1000000)
+    parser.add_argument("--memories", type=int, default=200000)
+    parser.add_argument("--agents", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.events, args.memories, args.agents, args.repeats))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,14 @@
 import asyncio
 import json
 import threading
-from datetime import datetime
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from enum import Enum
 from typing import Any, Optional
 from uuid import UUID, uuid4
 
+import numpy as np
 import pytz
 from pydantic import BaseModel, Field
 from sqlalchemy import desc
@@ -13,9 +16,13 @@ from sqlalchemy import desc
 from src.utils.database.base import Tables
 from src.utils.database.client import get_database
 
+from ..utils.bus import Topic, get_event_bus
+from ..utils.cache import DerivedCache
 from ..utils.colors import LogColor
+from ..utils.embeddings import cosine_similarity, get_embedding
 from ..utils.formatting import print_to_console
 from ..utils.parameters import DEFAULT_WORLD_ID
+from .store import EventStore
 
 # class DiscordMessage(BaseModel):
 #     content: str
@@ -137,86 +144,324 @@ class Event(BaseModel):
             metadata=event["metadata"],
         )
 
+    @classmethod
+    def from_row(cls, event: dict) -> "Event":
+        timestamp = datetime.fromisoformat(event["timestamp"])
+        # rows written with SQLite's CURRENT_TIMESTAMP have no timezone
+        if timestamp.tzinfo is None:
+            timestamp = pytz.utc.localize(timestamp)
+
+        return cls(
+            id=event["id"],
+            type=EventType(event["type"]),
+            subtype=event["subtype"],
+            description=event["description"],
+            location_id=event["location_id"]
+            if isinstance(event["location_id"], str)
+            else event["location_id"]["id"],
+            agent_id=event["agent_id"],
+            timestamp=timestamp,
+            witness_ids=event["witness_ids"],
+            metadata=event["metadata"],
+        )
+
 
 RECENT_EVENTS_BUFFER = 500
 
+# Events are timestamped before they are written, so one can land in the
+# database after a newer one. Each refresh looks back this far to catch them
+REFRESH_OVERLAP_SECONDS = 10
+
+# How many events keep their derived data (e.g. embeddings) cached
+DERIVED_EVENTS_BUFFER = 2 * RECENT_EVENTS_BUFFER
+
 REFRESH_INTERVAL_SECONDS = 5
 
+# A waiting agent is woken by a witnessed event at least this similar to what
+# it's waiting for, or by any message it witnesses
+WAIT_MATCH_SIMILARITY = 0.8
+# and after this long regardless, to check again
+WAIT_TIMEOUT_SECONDS = 600
+
+
+class WaitSubscription:
+    """What an agent in the wait tool is waiting for.
+
+    The agent is parked, and not scheduled, until a matching event wakes it
+    or the timeout passes. Without an embedding only messages wake it.
+    """
+
+    def __init__(
+        self,
+        agent_id: UUID,
+        description: str,
+        embedding: Optional[np.ndarray],
+        timeout: float = WAIT_TIMEOUT_SECONDS,
+    ):
+        self.agent_id = agent_id
+        self.description = description
+        self.embedding = embedding
+        self.expires_at = time.monotonic() + timeout
+        # The event that woke the agent
+        self.woken_by: Optional[Event] = None
+
+    @property
+    def parked(self) -> bool:
+        return self.woken_by is None and time.monotonic() < self.expires_at
+
+    def witnessed(self, event: Event) -> bool:
+        return str(event.agent_id) != str(self.agent_id) and str(self.agent_id) in [
+            str(witness_id) for witness_id in event.witness_ids
+        ]
+
 
 class EventsManager(BaseModel):
-    recent_events: list[Event] = []
+    # The most recent events, indexed for get_events
+    event_store: Any
     world_id: str
     last_refresh: datetime
-    refresh_lock: Any
+    # Newest event timestamp read from the database
+    high_water_mark: Optional[datetime] = None
+    # Ids of the buffered events and of the ones evicted recently, by age
+    seen_event_ids: Any
+    # The refresh in progress, which concurrent callers wait on
+    refresh_task: Any = None
+    # Data derived from an event that is the same for every witness, by event id
+    event_embeddings: Any
+    # Data derived from the events each agent witnessed, like conversation history
+    derived: Any
+    # Set when new events are added or a waiting agent is woken, then
+    # replaced with a fresh one
+    new_events_signal: Any
+    # What agents in the wait tool are waiting for, by agent id
+    wait_subscriptions: Any
+    # Wait subscriptions being matched against new events by embedding
+    wait_match_tasks: Any
 
     def __init__(self, world_id: str, recent_events: list[Event]):
         last_refresh = datetime.now(pytz.utc)
 
         super().__init__(
-            recent_events=recent_events,
+            event_store=EventStore(RECENT_EVENTS_BUFFER),
             world_id=world_id,
             last_refresh=last_refresh,
-            refresh_lock=asyncio.Lock(),
+            seen_event_ids=OrderedDict(),
+            event_embeddings=OrderedDict(),
+            derived=DerivedCache(),
+            new_events_signal=asyncio.Event(),
+            wait_subscriptions={},
+            wait_match_tasks=set(),
         )
 
+        self._merge_events(recent_events)
+
+    def _merge_events(self, events: list[Event]) -> list[Event]:
+        """Adds the events not seen before to the buffer, returns them"""
+        new_events = [event for event in events if event.id not in self.seen_event_ids]
+
+        for event in new_events:
+            self.event_store.add(event)
+            self.seen_event_ids[event.id] = None
+
+        if len(new_events) > 0:
+            self._wake_waiting_agents(new_events)
+            self._signal_new_events()
+
+        # remember a little more than the buffer holds, so events evicted from
+        # it aren't added again by the overlap window
+        while len(self.seen_event_ids) > 2 * RECENT_EVENTS_BUFFER:
+            self.seen_event_ids.popitem(last=False)
+
+        return new_events
+
+    def _signal_new_events(self) -> None:
+        self.new_events_signal.set()
+        self.new_events_signal = asyncio.Event()
+
+    def subscribe_wait(self, subscription: WaitSubscription) -> None:
+        """Parks an agent until an event it's waiting for comes in"""
+        self.wait_subscriptions[str(subscription.agent_id)] = subscription
+
+    def get_wait(self, agent_id: UUID) -> Optional[WaitSubscription]:
+        return self.wait_subscriptions.get(str(agent_id))
+
+    def cancel_wait(self, agent_id: UUID) -> None:
+        self.wait_subscriptions.pop(str(agent_id), None)
+
+    def _wake_waiting_agents(self, new_events: list[Event]) -> None:
+        for subscription in list(self.wait_subscriptions.values()):
+            if not subscription.parked:
+                continue
+
+            witnessed = [event for event in new_events if subscription.witnessed(event)]
+            if len(witnessed) == 0:
+                continue
+
+            message = next(
+                (event for event in witnessed if event.type == EventType.MESSAGE), None
+            )
+            if message is not None:
+                subscription.woken_by = message
+            elif subscription.embedding is not None:
+                task = asyncio.ensure_future(self._match_wait(subscription, witnessed))
+                self.wait_match_tasks.add(task)
+                task.add_done_callback(self.wait_match_tasks.discard)
+
+    async def _match_wait(
+        self, subscription: WaitSubscription, events: list[Event]
+    ) -> None:
+        try:
+            embeddings = await self.get_event_embeddings(events)
+        except Exception:
+            # let the wait tool check instead
+            embeddings = None
+
+        for i, event in enumerate(events):
+            if not subscription.parked:
+                return
+            if (
+                embeddings is None
+                or cosine_similarity(embeddings[i], subscription.embedding)
+                >= WAIT_MATCH_SIMILARITY
+            ):
+                subscription.woken_by = event
+                # so the scheduler picks the agent up
+                self._signal_new_events()
+                return
+
+    @property
+    def recent_events(self) -> list[Event]:
+        """Oldest first"""
+        return list(self.event_store)
+
+    def add_event(self, event: Event) -> None:
+        """Adds an event written by this process, without waiting for a refresh"""
+        self._merge_events([event])
+
+    async def listen(self) -> None:
+        """Adds the events other processes publish on the bus as they come in"""
+        with get_event_bus().subscribe(Topic.EVENT) as subscription:
+            async for _, row in subscription:
+                if row.get("world_id", self.world_id) != self.world_id:
+                    continue
+                try:
+                    self._merge_events([Event.from_row(row)])
+                except (KeyError, ValueError):
+                    # a refresh will pick it up from the db
+                    continue
+
+    async def wait_for_new_events(self, timeout: Optional[float] = None) -> bool:
+        """Waits until events are added or a waiting agent is woken, or the timeout
+        passes, returns which it was"""
+        # asyncio.wait rather than wait_for, which can swallow a cancellation
+        # that arrives as the signal is set
+        waiter = asyncio.ensure_future(self.new_events_signal.wait())
+        try:
+            done, _ = await asyncio.wait(
+                [waiter],
+                timeout=min(timeout, REFRESH_INTERVAL_SECONDS)
+                if timeout is not None
+                else REFRESH_INTERVAL_SECONDS,
+            )
+            return waiter in done
+        finally:
+            waiter.cancel()
+
+    async def get_event_embeddings(self, events: list[Event]) -> list[np.ndarray]:
+        """Embeds each event description once, no matter how many agents witnessed it"""
+        for event in events:
+            if event.id not in self.event_embeddings:
+                # store the task, so witnesses observing at the same time share it
+                self.event_embeddings[event.id] = asyncio.ensure_future(
+                    get_embedding(event.description)
+                )
+            self.event_embeddings.move_to_end(event.id)
+
+        tasks = [self.event_embeddings[event.id] for event in events]
+
+        while len(self.event_embeddings) > DERIVED_EVENTS_BUFFER:
+            self.event_embeddings.popitem(last=False)
+
+        try:
+            return await asyncio.gather(*[asyncio.shield(task) for task in tasks])
+        except Exception:
+            # don't keep failed embeddings around
+            for event, task in zip(events, tasks):
+                failed = task.done() and (task.cancelled() or task.exception())
+                if failed and self.event_embeddings.get(event.id) is task:
+                    del self.event_embeddings[event.id]
+            raise
+
     @classmethod
     async def from_world_id(cls, world_id: str):
         data = await (await get_database()).get_recent_events(
             world_id, RECENT_EVENTS_BUFFER
         )
-        recent_events = [
-            Event(
-                type=EventType(event["type"]),
-                subtype=event["subtype"],
-                description=event["description"],
-                location_id=event["location_id"] if isinstance(event["location_id"], str) else event["location_id"]["id"],
-                timestamp=datetime.fromisoformat(event["timestamp"]),
-                witness_ids=event["witness_ids"],
-                metadata=event["metadata"],
-                agent_id=event["agent_id"],
-            )
-            for event in data
-        ]
-        return cls(
+        recent_events = [Event.from_row(event) for event in data]
+
+        events_manager = cls(
             world_id=world_id,
             recent_events=recent_events,
         )
+        events_manager._update_high_water_mark(recent_events)
+
+        return events_manager
+
+    def _update_high_water_mark(self, events: list[Event]) -> None:
+        if len(events) == 0:
+            return
+        newest = max(event.timestamp for event in events)
+        if self.high_water_mark is None or newest > self.high_water_mark:
+            self.high_water_mark = newest
 
     async def refresh_events(self) -> None:
-        """Gathers the last RECENT_EVENTS_BUFFER events from the database and updates the self.recent_events list"""
+        """Fetches the events added to the database since the last refresh.
+        Concurrent callers share one query"""
+        if self.refresh_task is None:
+            self.refresh_task = asyncio.ensure_future(self._refresh_events())
+            self.refresh_task.add_done_callback(self._clear_refresh_task)
 
-        started_checking_events = datetime.now(pytz.utc)
+        await asyncio.shield(self.refresh_task)
 
-        async with self.refresh_lock:
-            # print("Refreshing events...")
-            data = await (await get_database()).get_recent_events(
-                self.world_id, RECENT_EVENTS_BUFFER
-            )
-            events = [
-                Event(
-                    id=event["id"],
-                    type=EventType(event["type"]),
-                    subtype=event["subtype"],
-                    description=event["description"],
-                    location_id=event["location_id"] if isinstance(event["location_id"], str) else event["location_id"]["id"],
-                    agent_id=event["agent_id"],
-                    timestamp=datetime.fromisoformat(event["timestamp"]),
-                    witness_ids=event["witness_ids"],
-                    metadata=event["metadata"],
-                )
-                for event in data
-            ]
-
-            self.recent_events = events
-            self.last_refresh = (
-                max(
-                    datetime.fromisoformat(data[0]["timestamp"]),
-                    started_checking_events,
-                )
-                if len(data) > 0
-                else started_checking_events
+    def _clear_refresh_task(self, task: asyncio.Future) -> None:
+        if self.refresh_task is task:
+            self.refresh_task = None
+
+    async def _refresh_events(self) -> None:
+        started_checking_events = datetime.now(pytz.utc)
+        database = await get_database()
+
+        if self.high_water_mark is None:
+            data = await database.get_recent_events(self.world_id, RECENT_EVENTS_BUFFER)
+        else:
+            data = await database.get_events_since(
+                self.world_id,
+                self.high_water_mark - timedelta(seconds=REFRESH_OVERLAP_SECONDS),
+                RECENT_EVENTS_BUFFER,
             )
 
+        events = [
+            Event.from_row(event)
+            for event in data
+            if UUID(str(event["id"])) not in self.seen_event_ids
+        ]
+
+        self._merge_events(events)
+        self._update_high_water_mark(events)
+
+        self.last_refresh = max(
+            self.high_water_mark or started_checking_events, started_checking_events
+        )
+
+    async def refresh_if_stale(self, force_refresh: bool = False) -> None:
+        # with the bus connected, new events are pushed to listen() and the
+        # periodic refresh is only a safety net
+        if (
+            (datetime.now(pytz.utc) - self.last_refresh).seconds
+            > REFRESH_INTERVAL_SECONDS
+        ) or (force_refresh and not get_event_bus().connected):
+            await self.refresh_events()
+
     async def get_events(
         self,
         agent_id: Optional[UUID] = None,
@@ -227,55 +472,19 @@ class EventsManager(BaseModel):
         witness_ids: Optional[list[UUID]] = None,
         force_refresh: Optional[bool] = False,
     ) -> tuple[list[Event], datetime]:
-        if (
-            (datetime.now(pytz.utc) - self.last_refresh).seconds
-            > REFRESH_INTERVAL_SECONDS
-        ) or force_refresh:
-            await self.refresh_events()
+        await self.refresh_if_stale(force_refresh)
 
-        filtered_events = self.recent_events
-        if after is not None:
-            if after.tzinfo is None:
-                after = pytz.utc.localize(after)
-            filtered_events = [
-                event for event in filtered_events if event.timestamp > after
-            ]
-
-        if location_id is not None:
-            filtered_events = [
-                event
-                for event in filtered_events
-                if str(event.location_id) == str(location_id)
-            ]
-
-        if agent_id is not None:
-            filtered_events = [
-                event
-                for event in filtered_events
-                if str(event.agent_id) == str(agent_id)
-            ]
-
-        if type is not None:
-            filtered_events = [event for event in filtered_events if event.type == type]
-
-        if description is not None:
-            filtered_events = [
-                event for event in filtered_events if event.description == description
-            ]
-
-        if witness_ids is not None:
-            filtered_events = [
-                event
-                for event in filtered_events
-                if set(list(map(str, witness_ids))).issubset(
-                    set(list(map(str, event.witness_ids)))
-                )
-            ]
+        filtered_events = self.event_store.query(
+            agent_id=agent_id,
+            location_id=location_id,
+            type=type,
+            description=description,
+            after=after,
+            witness_ids=witness_ids,
+        )
 
         return (filtered_events, self.last_refresh)
 
     def remove_event(self, event_id: UUID):
-        self.recent_events = [
-            event for event in self.recent_events if event.id != event_id
-        ]
+        self.event_store.remove(event_id)
         return self.recent_events
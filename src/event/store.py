@@ -0,0 +1,174 @@
+from bisect import bisect_right, insort
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Iterator, Optional
+from uuid import UUID
+
+import pytz
+
+if TYPE_CHECKING:
+    from .base import Event, EventType
+
+INDEXED_FIELDS = ["location_id", "agent_id", "type", "witness_id"]
+
+
+def to_uuid(value: UUID | str | None) -> Optional[UUID]:
+    if value is None or isinstance(value, UUID):
+        return value
+    return UUID(str(value))
+
+
+def to_timestamp(date: datetime) -> float:
+    if date.tzinfo is None:
+        date = pytz.utc.localize(date)
+    return date.timestamp()
+
+
+class EventStore:
+    """A bounded set of events with secondary indexes for the get_events filters.
+
+    Every event gets a sequence number. The events are kept ordered by
+    (timestamp, seq), and each indexed field maps a value to the set of
+    sequence numbers that have it. A filtered query intersects those sets,
+    smallest first, and a time filter is a bisect on the ordering. When the
+    store is over capacity the event with the oldest timestamp is dropped.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._next_seq = 0
+        self._events: dict[int, "Event"] = {}
+        self._timestamps: dict[int, float] = {}
+        self._seqs: dict[UUID, int] = {}
+        self._order: list[tuple[float, int]] = []
+        self._indexes: dict[str, dict[Any, set[int]]] = {
+            field: {} for field in INDEXED_FIELDS
+        }
+        # Bumped for a witness whenever one of their events is added or removed
+        self._witness_versions: dict[UUID, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def __iter__(self) -> Iterator["Event"]:
+        """Oldest first"""
+        return (self._events[seq] for _, seq in self._order)
+
+    def __contains__(self, event_id: UUID) -> bool:
+        return event_id in self._seqs
+
+    def _index_keys(self, event: "Event") -> list[tuple[str, Any]]:
+        keys = [
+            ("location_id", to_uuid(event.location_id)),
+            ("agent_id", to_uuid(event.agent_id)),
+            ("type", event.type),
+        ]
+        keys.extend(
+            ("witness_id", to_uuid(witness_id)) for witness_id in set(event.witness_ids)
+        )
+        return keys
+
+    def add(self, event: "Event") -> bool:
+        """Adds an event, returns False if it's already in the store"""
+        if event.id in self._seqs:
+            return False
+
+        seq = self._next_seq
+        self._next_seq += 1
+
+        timestamp = to_timestamp(event.timestamp)
+        self._events[seq] = event
+        self._timestamps[seq] = timestamp
+        self._seqs[event.id] = seq
+
+        # events almost always arrive in order, so this is usually an append
+        if len(self._order) == 0 or self._order[-1] < (timestamp, seq):
+            self._order.append((timestamp, seq))
+        else:
+            insort(self._order, (timestamp, seq))
+
+        for field, value in self._index_keys(event):
+            self._indexes[field].setdefault(value, set()).add(seq)
+        self._bump_witness_versions(event)
+
+        while len(self._events) > self.capacity:
+            self._remove_seq(self._order[0][1])
+
+        return True
+
+    def remove(self, event_id: UUID) -> None:
+        seq = self._seqs.get(event_id)
+        if seq is not None:
+            self._remove_seq(seq)
+
+    def _remove_seq(self, seq: int) -> None:
+        event = self._events.pop(seq)
+        timestamp = self._timestamps.pop(seq)
+        del self._seqs[event.id]
+
+        position = bisect_right(self._order, (timestamp, seq)) - 1
+        del self._order[position]
+
+        for field, value in self._index_keys(event):
+            seqs = self._indexes[field][value]
+            seqs.discard(seq)
+            if len(seqs) == 0:
+                del self._indexes[field][value]
+        self._bump_witness_versions(event)
+
+    def _bump_witness_versions(self, event: "Event") -> None:
+        for witness_id in set(map(to_uuid, event.witness_ids)):
+            self._witness_versions[witness_id] = (
+                self._witness_versions.get(witness_id, 0) + 1
+            )
+
+    def witness_version(self, witness_id: UUID | str) -> int:
+        """Changes whenever the events witnessed by witness_id change"""
+        return self._witness_versions.get(to_uuid(witness_id), 0)
+
+    def query(
+        self,
+        agent_id: Optional[UUID | str] = None,
+        location_id: Optional[UUID | str] = None,
+        type: Optional["EventType"] = None,
+        description: Optional[str] = None,
+        after: Optional[datetime] = None,
+        witness_ids: Optional[list[UUID | str]] = None,
+    ) -> list["Event"]:
+        """Events matching every given filter, oldest first"""
+        filters = []
+        if location_id is not None:
+            filters.append(("location_id", to_uuid(location_id)))
+        if agent_id is not None:
+            filters.append(("agent_id", to_uuid(agent_id)))
+        if type is not None:
+            filters.append(("type", type))
+        if witness_ids is not None:
+            filters.extend(
+                ("witness_id", to_uuid(witness_id)) for witness_id in witness_ids
+            )
+
+        after_timestamp = to_timestamp(after) if after is not None else None
+
+        if len(filters) > 0:
+            postings = [
+                self._indexes[field].get(value, set()) for field, value in filters
+            ]
+            postings.sort(key=len)
+            seqs = postings[0].intersection(*postings[1:])
+
+            if after_timestamp is not None:
+                seqs = [seq for seq in seqs if self._timestamps[seq] > after_timestamp]
+
+            ordered = sorted(seqs, key=lambda seq: (self._timestamps[seq], seq))
+        else:
+            start = 0
+            if after_timestamp is not None:
+                start = bisect_right(self._order, (after_timestamp, float("inf")))
+            ordered = [seq for _, seq in self._order[start:]]
+
+        events = [self._events[seq] for seq in ordered]
+
+        if description is not None:
+            events = [event for event in events if event.description == description]
+
+        return events
@@ -13,10 +13,14 @@ from src.utils.database.client import get_database
 from src.utils.discord import discord_listener
 from src.world.base import World
 
+from .utils.bus import run_broker
+from .utils.cache import cache_stats, derived_stats
 from .utils.colors import LogColor
+from .utils.console import console
 from .utils.database.base import Tables
 from .utils.formatting import print_to_console
 from .utils.logging import init_logging
+from .utils.models import get_llm_scheduler
 from .utils.parameters import DISCORD_ENABLED
 from .web import get_server
 
@@ -47,7 +51,16 @@ async def run_world_async():
     except Exception:
         print(traceback.format_exc())
     finally:
+        print_to_console("LLM Cache", LogColor.ANNOUNCEMENT, cache_stats.summary())
+        print_to_console(
+            "Derived State Cache", LogColor.ANNOUNCEMENT, derived_stats.summary()
+        )
+        print_to_console(
+            "LLM Scheduler", LogColor.ANNOUNCEMENT, get_llm_scheduler().summary()
+        )
         await (await get_database()).close()
+        # the process exits without running atexit, so print what's left now
+        console.flush()
 
 
 def run_world():
@@ -69,10 +82,13 @@ def run_in_new_loop(coro):
 
 
 def run():
+    # the other processes connect to the bus broker, and retry until it's up
+    process_bus = Process(target=run_broker, daemon=True)
     process_discord = Process(target=discord_listener)
     process_world = Process(target=run_world)
     process_server = Process(target=run_server)
 
+    process_bus.start()
     process_discord.start()
     process_world.start()
     process_server.start()
@@ -0,0 +1,98 @@
+import math
+from typing import Optional
+
+import numpy as np
+
+KMEANS_ITERATIONS = 10
+TRAINING_POINTS_PER_LIST = 64
+ASSIGNMENT_CHUNK_SIZE = 8192
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class IVFIndex:
+    """Inverted-file approximate nearest neighbour index, in pure NumPy.
+
+    Vectors are bucketed by their closest centroid (cosine). A search only
+    scans the rows in the n_probe closest buckets, so n_probe is the
+    recall/latency knob: more probes, better recall, slower search.
+    """
+
+    def __init__(
+        self,
+        n_lists: Optional[int] = None,
+        n_probe: int = 8,
+        retrain_growth: float = 4.0,
+        seed: int = 0,
+    ):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.retrain_growth = retrain_growth
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: list[list[int]] = []
+        self.trained_size = 0
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), ASSIGNMENT_CHUNK_SIZE):
+            chunk = _normalize(vectors[start : start + ASSIGNMENT_CHUNK_SIZE])
+            assignments[start : start + len(chunk)] = np.argmax(
+                chunk @ self.centroids.T, axis=1
+            )
+        return assignments
+
+    def train(self, vectors: np.ndarray):
+        """(Re)builds the centroids with spherical k-means and re-buckets every row."""
+        n_lists = self.n_lists or max(1, int(math.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+
+        sample_size = min(len(vectors), n_lists * TRAINING_POINTS_PER_LIST)
+        sample = _normalize(
+            vectors[self._rng.choice(len(vectors), sample_size, replace=False)]
+        )
+
+        centroids = sample[self._rng.choice(sample_size, n_lists, replace=False)]
+        for _ in range(KMEANS_ITERATIONS):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=n_lists)
+
+            # keep the previous centroid for empty buckets
+            empty = counts == 0
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+
+        self.centroids = centroids.astype(np.float32)
+        self.lists = [[] for _ in range(n_lists)]
+        for row, bucket in enumerate(self._assign(vectors)):
+            self.lists[bucket].append(row)
+
+        self.trained_size = len(vectors)
+
+    def add(self, row: int, vector: np.ndarray):
+        bucket = int(np.argmax(self.centroids @ _normalize(vector)))
+        self.lists[bucket].append(row)
+
+    def needs_retraining(self, size: int) -> bool:
+        return size >= self.trained_size * self.retrain_growth
+
+    def search(self, query: np.ndarray, n_probe: Optional[int] = None) -> np.ndarray:
+        """Rows in the buckets closest to the query."""
+        n_probe = min(n_probe or self.n_probe, len(self.lists))
+
+        scores = self.centroids @ _normalize(query)
+        buckets = np.argpartition(-scores, n_probe - 1)[:n_probe]
+
+        return np.fromiter(
+            (row for bucket in buckets for row in self.lists[bucket]),
+            dtype=np.int64,
+        )
@@ -16,6 +16,7 @@ from ..utils.parameters import (
     SIMILARITY_WEIGHT,
     TIME_SPEED_MULTIPLIER,
 )
+from .index import MemoryIndex
 
 
 class MemoryType(Enum):
@@ -71,7 +72,7 @@ class SingleMemory(BaseModel):
         if isinstance(embedding, str):
             embedding = parse_array(embedding)
         else:
-            embedding = np.array(embedding)
+            embedding = np.asarray(embedding)
 
         if not isinstance(embedding, np.ndarray):
             raise ValueError("Embedding must be a numpy array")
@@ -94,7 +95,7 @@ class SingleMemory(BaseModel):
             "agent_id": str(self.agent_id),
             "type": self.type.value,
             "description": self.description,
-            "embedding": str(self.embedding.tolist()),
+            "embedding": self.embedding,
             "importance": self.importance,
             "created_at": self.created_at.isoformat(),
             "last_accessed": self.last_accessed.isoformat()
@@ -133,26 +134,27 @@ class RelatedMemory(BaseModel):
 
 
 async def get_relevant_memories(
-    query: str, memories: list[SingleMemory], k: int = 5
+    query: str, memories: list[SingleMemory] | MemoryIndex, k: int = 5
 ) -> list[SingleMemory]:
     """Returns a list of the top k most relevant NON MESSAGE memories, based on the query string"""
 
-    memories_with_relevance = [
-        RelatedMemory(memory=memory, relevance=await memory.relevance(query))
-        for memory in memories
-    ]
+    # Agents pass their own index, plain lists get a throwaway one
+    if isinstance(memories, MemoryIndex):
+        index = memories
+    else:
+        index = MemoryIndex(memories, share_embeddings=False, ann_threshold=None)
+
+    if len(index) == 0:
+        return []
 
-    # Sort the list of dictionaries based on the 'relevance' key in descending order
-    sorted_by_relevance = sorted(
-        memories_with_relevance, key=lambda x: x.relevance, reverse=True
-    )
+    # Embed the query once, then score every memory against it in a single pass
+    query_embedding = await get_embedding(query)
 
-    # get the top k memories, as a list of SingleMemory object
-    top_memories = [memory.memory for memory in sorted_by_relevance[:k]]
+    top_rows = index.top_k(query_embedding, k)
 
-    # now sort the list based on the created_at field, with the oldest memories first
-    sorted_by_created_at = sorted(
-        top_memories, key=lambda x: x.created_at, reverse=False
-    )
+    # now sort the rows based on the created_at field, with the oldest memories first
+    sorted_by_created_at = top_rows[
+        np.argsort(index.created_at[top_rows], kind="stable")
+    ]
 
-    return sorted_by_created_at
+    return index.get(sorted_by_created_at)
@@ -0,0 +1,289 @@
+import asyncio
+from datetime import datetime
+from typing import TYPE_CHECKING, Optional
+from uuid import UUID
+
+import numpy as np
+import pytz
+
+from ..utils.parameters import (
+    IMPORTANCE_WEIGHT,
+    MEMORY_ANN_CANDIDATES_PER_RESULT,
+    MEMORY_ANN_PROBES,
+    MEMORY_ANN_THRESHOLD,
+    RECENCY_WEIGHT,
+    SIMILARITY_WEIGHT,
+    TIME_SPEED_MULTIPLIER,
+)
+from .ann import IVFIndex
+
+if TYPE_CHECKING:
+    from .base import SingleMemory
+
+INITIAL_CAPACITY = 64
+GROWTH_FACTOR = 2
+
+
+def to_timestamp(date: datetime) -> float:
+    if date.tzinfo is None:
+        date = pytz.utc.localize(date)
+    return date.timestamp()
+
+
+class MemoryIndex:
+    """Keeps an agent's memories in contiguous, preallocated NumPy arrays.
+
+    Row i of every array belongs to self.memories[i]. The arrays grow
+    geometrically, so appending a memory is amortized O(1) and scoring all
+    memories against a query is a handful of vectorized operations.
+
+    Once the index holds ann_threshold memories it also maintains an IVF
+    index, and top_k only computes similarities for the rows it returns.
+    The IVF index is trained on a worker thread when there's an event loop,
+    and top_k keeps using the previous one (or every row) until it's done.
+    """
+
+    memories: list["SingleMemory"]
+
+    def __init__(
+        self,
+        memories: list["SingleMemory"] = [],
+        capacity: int = INITIAL_CAPACITY,
+        share_embeddings: bool = True,
+        ann_threshold: Optional[int] = MEMORY_ANN_THRESHOLD,
+    ):
+        # When sharing, each memory's embedding becomes a view into the matrix,
+        # so the vectors are only stored once
+        self.share_embeddings = share_embeddings
+        self.ann_threshold = ann_threshold
+        self.ann: Optional[IVFIndex] = None
+        # The IVF index being trained to replace self.ann
+        self._training: Optional[asyncio.Future] = None
+        self.memories = []
+        # Bumped whenever a memory is added, for values derived from the memories
+        self.version = 0
+        self._rows: dict[UUID, int] = {}
+        self._capacity = max(capacity, len(memories), 1)
+        self._embeddings: Optional[np.ndarray] = None
+        self._norms = np.empty(self._capacity, dtype=np.float32)
+        self._importance = np.empty(self._capacity, dtype=np.float32)
+        # Timestamps are kept in float64, float32 would round them to minutes
+        self._created_at = np.empty(self._capacity, dtype=np.float64)
+        self._last_accessed = np.empty(self._capacity, dtype=np.float64)
+
+        for memory in memories:
+            self.add(memory)
+
+    def __len__(self) -> int:
+        return len(self.memories)
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        if self._embeddings is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._embeddings[: len(self)]
+
+    @property
+    def importance(self) -> np.ndarray:
+        return self._importance[: len(self)]
+
+    @property
+    def created_at(self) -> np.ndarray:
+        return self._created_at[: len(self)]
+
+    @property
+    def last_accessed(self) -> np.ndarray:
+        return self._last_accessed[: len(self)]
+
+    def _grow(self, capacity: int):
+        size = len(self)
+
+        def resize(array: np.ndarray) -> np.ndarray:
+            resized = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+            resized[:size] = array[:size]
+            return resized
+
+        self._norms = resize(self._norms)
+        self._importance = resize(self._importance)
+        self._created_at = resize(self._created_at)
+        self._last_accessed = resize(self._last_accessed)
+
+        if self._embeddings is not None:
+            self._embeddings = resize(self._embeddings)
+
+            if self.share_embeddings:
+                for row, memory in enumerate(self.memories):
+                    memory.embedding = self._embeddings[row]
+
+        self._capacity = capacity
+
+    def add(self, memory: "SingleMemory") -> int:
+        """Appends a memory and returns its row."""
+        row = len(self)
+
+        if row == self._capacity:
+            self._grow(self._capacity * GROWTH_FACTOR)
+
+        if self._embeddings is None:
+            self._embeddings = np.empty(
+                (self._capacity, len(memory.embedding)), dtype=np.float32
+            )
+
+        self._embeddings[row] = memory.embedding
+        self._norms[row] = np.linalg.norm(self._embeddings[row])
+        self._importance[row] = memory.importance
+        self._created_at[row] = to_timestamp(memory.created_at)
+        self._last_accessed[row] = to_timestamp(
+            memory.last_accessed or memory.created_at
+        )
+
+        if self.share_embeddings:
+            memory.embedding = self._embeddings[row]
+
+        self.memories.append(memory)
+        self._rows[memory.id] = row
+        self.version += 1
+
+        self._update_ann(row)
+
+        return row
+
+    def _update_ann(self, row: int):
+        if self.ann is not None:
+            self.ann.add(row, self._embeddings[row])
+
+        if self._training is not None:
+            return
+
+        if self.ann is not None:
+            if self.ann.needs_retraining(len(self)):
+                self._train_ann(self.ann.n_probe)
+        elif self.ann_threshold and len(self) >= self.ann_threshold:
+            self._train_ann(MEMORY_ANN_PROBES)
+
+    def build_ann(self, n_probe: int = MEMORY_ANN_PROBES):
+        """Trains the IVF index on this thread, right away"""
+        self.ann = IVFIndex(n_probe=n_probe)
+        self.ann.train(self.embeddings)
+
+    def _train_ann(self, n_probe: int):
+        ann = IVFIndex(n_probe=n_probe)
+        size = len(self)
+        # rows never change once added, so the worker can read them in place
+        embeddings = self._embeddings[:size]
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            ann.train(embeddings)
+            self._swap_ann(ann, size)
+            return
+
+        # k-means takes seconds at this size, keep it off the event loop
+        self._training = loop.run_in_executor(None, ann.train, embeddings)
+        self._training.add_done_callback(
+            lambda training: self._finish_training(training, ann, size)
+        )
+
+    def _finish_training(self, training: asyncio.Future, ann: IVFIndex, size: int):
+        self._training = None
+        if training.cancelled() or training.exception() is not None:
+            # keep the index there was, the next memory added trains again
+            return
+        self._swap_ann(ann, size)
+
+    def _swap_ann(self, ann: IVFIndex, size: int):
+        # bucket the rows added while it was training
+        for row in range(size, len(self)):
+            ann.add(row, self._embeddings[row])
+        self.ann = ann
+
+    async def wait_for_ann(self):
+        """Waits for the IVF index being trained, if there is one"""
+        if self._training is not None:
+            await asyncio.shield(self._training)
+
+    def update_last_accessed(self, memory: "SingleMemory"):
+        memory.update_last_accessed()
+        row = self._rows.get(memory.id)
+        if row is not None:
+            self._last_accessed[row] = to_timestamp(memory.last_accessed)
+
+    def recency(self) -> np.ndarray:
+        last_retrieved_hours_ago = (
+            datetime.now(pytz.utc).timestamp() - self.last_accessed
+        ) / (3600 / TIME_SPEED_MULTIPLIER)
+
+        decay_factor = 0.99
+        return np.power(decay_factor, last_retrieved_hours_ago)
+
+    def similarity(
+        self, query_embedding: np.ndarray, rows: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        query = np.asarray(query_embedding, dtype=np.float32)
+
+        if rows is None:
+            norms = self._norms[: len(self)] * np.linalg.norm(query)
+            dot_products = self.embeddings @ query
+        else:
+            norms = self._norms[rows] * np.linalg.norm(query)
+            dot_products = self._embeddings[rows] @ query
+
+        return np.divide(
+            dot_products, norms, out=np.zeros_like(dot_products), where=norms > 0
+        )
+
+    def relevance(self, query_embedding: np.ndarray) -> np.ndarray:
+        return (
+            IMPORTANCE_WEIGHT * self.importance
+            + SIMILARITY_WEIGHT * self.similarity(query_embedding)
+            + RECENCY_WEIGHT * self.recency()
+        )
+
+    def top_k(
+        self, query_embedding: np.ndarray, k: int, exact: bool = False
+    ) -> np.ndarray:
+        """Rows of the k most relevant memories, in no particular order."""
+        if self.ann is not None and not exact:
+            return self._approximate_top_k(query_embedding, k)
+
+        relevance = self.relevance(query_embedding)
+
+        if k >= len(relevance):
+            return np.arange(len(relevance))
+
+        return np.argpartition(-relevance, k - 1)[:k]
+
+    def _approximate_top_k(
+        self, query_embedding: np.ndarray, k: int, n_probe: Optional[int] = None
+    ) -> np.ndarray:
+        # Importance and recency are cheap to score for every row, similarity is
+        # only computed for the IVF candidates and the best rows on the rest
+        prior = IMPORTANCE_WEIGHT * self.importance + RECENCY_WEIGHT * self.recency()
+
+        prior_count = min(len(prior), k * MEMORY_ANN_CANDIDATES_PER_RESULT)
+        prior_rows = np.argpartition(-prior, prior_count - 1)[:prior_count]
+
+        candidates = np.union1d(
+            self.ann.search(query_embedding, n_probe=n_probe), prior_rows
+        )
+
+        relevance = prior[candidates] + SIMILARITY_WEIGHT * self.similarity(
+            query_embedding, candidates
+        )
+
+        if k >= len(candidates):
+            return candidates
+
+        return candidates[np.argpartition(-relevance, k - 1)[:k]]
+
+    def get(self, rows: np.ndarray) -> list["SingleMemory"]:
+        return [self.memories[row] for row in rows]
+
+    def sorted_by_created_at(self, reverse: bool = False) -> list["SingleMemory"]:
+        rows = np.argsort(self.created_at, kind="stable")
+        return self.get(rows[::-1] if reverse else rows)
+
+    def sorted_by_last_accessed(self, reverse: bool = False) -> list["SingleMemory"]:
+        rows = np.argsort(self.last_accessed, kind="stable")
+        return self.get(rows[::-1] if reverse else rows)
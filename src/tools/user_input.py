@@ -2,6 +2,7 @@ from colorama import Fore
 from langchain.agents import Tool
 
 from ..utils.colors import LogColor
+from ..utils.console import console
 from ..utils.formatting import print_to_console
 
 
@@ -16,5 +17,6 @@ class UserInputTool(Tool):
     @staticmethod
     def get_user_input(question):
         print_to_console("\nQuestion", LogColor.CLI_INPUT, question)
+        console.flush()
         i = input()
         return i
@@ -6,6 +6,8 @@ from src.utils.database.base import Tables
 from src.utils.database.client import get_database
 from src.utils.prompt import Prompter, PromptString
 
+from ..event.base import WaitSubscription
+from ..utils.embeddings import get_embedding
 from ..utils.models import ChatModel
 from ..utils.parameters import DEFAULT_FAST_MODEL, DEFAULT_SMART_MODEL
 
@@ -18,11 +20,31 @@ class HasHappenedLLMResponse(BaseModel):
 
 
 async def wait_async(agent_input: str, tool_context: ToolContext) -> str:
-    """Wait for a specified event to occur."""
+    """Wait for a specified event to occur.
+
+    The memories are checked when the wait starts, and then only once an event
+    that may be the awaited one wakes the agent, or the wait times out. In
+    between the agent is parked and this returns without calling the LLM.
+    """
+
+    events_manager = tool_context.context.events_manager
+    subscription = events_manager.get_wait(tool_context.agent_id)
+    if subscription is not None and subscription.description != agent_input:
+        # waiting for something else now
+        subscription = None
+
+    if subscription is not None and subscription.parked:
+        return "The event I was waiting for has not happened yet. Waiting..."
 
     # Get the memories
     memories = [f"{m.description} @ {m.created_at}" for m in tool_context.memories]
 
+    # The event that woke the agent may not be a memory yet
+    if subscription is not None and subscription.woken_by is not None:
+        event = subscription.woken_by
+        if f"{event.description} @ {event.timestamp}" not in memories:
+            memories.append(f"{event.description} @ {event.timestamp}")
+
     # Set up the LLM, Parser, and Prompter
     llm = ChatModel(temperature=0)
     parser = OutputFixingParser.from_llm(
@@ -49,9 +71,19 @@ async def wait_async(agent_input: str, tool_context: ToolContext) -> str:
     parsed_response: HasHappenedLLMResponse = parser.parse(response)
 
     if parsed_response.has_happened:
+        events_manager.cancel_wait(tool_context.agent_id)
         return f"The event I was waiting for occured at {parsed_response.date_occured}. No need to wait anymore."
-    else:
-        return "The event I was waiting for has not happened yet. Waiting..."
+
+    # Park the agent until an event that may be the awaited one comes in
+    events_manager.subscribe_wait(
+        WaitSubscription(
+            agent_id=tool_context.agent_id,
+            description=agent_input,
+            embedding=await get_embedding(agent_input),
+        )
+    )
+
+    return "The event I was waiting for has not happened yet. Waiting..."
 
 
 def wait_sync(agent_input: str, tool_context: ToolContext) -> str:
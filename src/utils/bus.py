@@ -0,0 +1,205 @@
+"""Publish/subscribe messaging between the world, web server and Discord processes.
+
+A message published in a process is delivered to that process's subscribers
+straight away. If the broker is running (`run` in src/main.py starts it in its
+own process), it's also forwarded to every other process connected to it.
+
+The bus only carries notifications. The database is still the source of truth,
+so a message published while the broker is unreachable is simply not
+forwarded, and subscribers that fall behind lose their oldest messages.
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import weakref
+from enum import Enum
+from typing import Any, Optional
+
+# Unix socket path, or a localhost port on platforms without Unix sockets
+BUS_SOCKET_PATH = os.getenv(
+    "EVENT_BUS_SOCKET", os.path.join(tempfile.gettempdir(), "gpteam-bus.sock")
+)
+BUS_TCP_PORT = int(os.getenv("EVENT_BUS_PORT", "5001"))
+USE_UNIX_SOCKET = sys.platform != "win32"
+
+SUBSCRIBER_QUEUE_SIZE = 1000
+MAX_FRAME_BYTES = 2**20
+# Stop forwarding to a connection once this much is waiting to be sent to it
+MAX_PENDING_BYTES = 2**22
+MAX_RECONNECT_DELAY_SECONDS = 5
+
+
+class Topic(Enum):
+    EVENT = "event"
+    AGENT = "agent"
+    LOG = "log"
+
+
+class Subscription:
+    """Messages on some topics, oldest first. Drops the oldest when full"""
+
+    def __init__(self, bus: "EventBus", topics: set[Topic], maxsize: int):
+        self.bus = bus
+        self.topics = topics
+        self.queue: asyncio.Queue[tuple[Topic, Any]] = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def deliver(self, topic: Topic, payload: Any):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait((topic, payload))
+
+    async def get(self) -> tuple[Topic, Any]:
+        return await self.queue.get()
+
+    def get_nowait(self) -> tuple[Topic, Any]:
+        return self.queue.get_nowait()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> tuple[Topic, Any]:
+        return await self.get()
+
+    def close(self):
+        self.bus.subscriptions.discard(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def encode_frame(topic: Topic, payload: Any) -> bytes:
+    return (
+        json.dumps({"topic": topic.value, "payload": payload}, default=str) + "\n"
+    ).encode("utf-8")
+
+
+class EventBus:
+    def __init__(self):
+        self.subscriptions: set[Subscription] = set()
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connection_task: Optional[asyncio.Task] = None
+
+    @property
+    def connected(self) -> bool:
+        """Whether messages are reaching the other processes"""
+        return self._writer is not None
+
+    def subscribe(
+        self, *topics: Topic, maxsize: int = SUBSCRIBER_QUEUE_SIZE
+    ) -> Subscription:
+        self._ensure_connection()
+        subscription = Subscription(self, set(topics), maxsize)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def publish(self, topic: Topic, payload: Any):
+        """Never blocks, must be called from the bus's event loop"""
+        self._deliver(topic, payload)
+
+        self._ensure_connection()
+        writer = self._writer
+        if (
+            writer is not None
+            and writer.transport.get_write_buffer_size() < MAX_PENDING_BYTES
+        ):
+            writer.write(encode_frame(topic, payload))
+
+    def _deliver(self, topic: Topic, payload: Any):
+        for subscription in list(self.subscriptions):
+            if topic in subscription.topics:
+                subscription.deliver(topic, payload)
+
+    def _ensure_connection(self):
+        if self._connection_task is None:
+            self._connection_task = asyncio.get_running_loop().create_task(
+                self._maintain_connection()
+            )
+
+    async def _maintain_connection(self):
+        delay = 0.1
+        while True:
+            try:
+                if USE_UNIX_SOCKET:
+                    reader, writer = await asyncio.open_unix_connection(
+                        BUS_SOCKET_PATH, limit=MAX_FRAME_BYTES
+                    )
+                else:
+                    reader, writer = await asyncio.open_connection(
+                        "127.0.0.1", BUS_TCP_PORT, limit=MAX_FRAME_BYTES
+                    )
+            except OSError:
+                # the broker isn't up (yet), messages stay in this process
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY_SECONDS)
+                continue
+
+            self._writer = writer
+            delay = 0.1
+            try:
+                while line := await reader.readline():
+                    frame = json.loads(line)
+                    self._deliver(Topic(frame["topic"]), frame["payload"])
+            except (OSError, ValueError):
+                pass
+            finally:
+                self._writer = None
+                writer.close()
+
+
+# Streams and queues belong to a single event loop, so each loop gets its own bus
+_buses = weakref.WeakKeyDictionary()
+
+
+def get_event_bus() -> EventBus:
+    loop = asyncio.get_running_loop()
+    if loop not in _buses:
+        _buses[loop] = EventBus()
+    return _buses[loop]
+
+
+async def serve_broker():
+    """Forwards every message to every connected process but its sender"""
+    clients: set[asyncio.StreamWriter] = set()
+
+    async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        clients.add(writer)
+        try:
+            while line := await reader.readline():
+                for client in list(clients):
+                    # a client that stopped reading misses messages instead of
+                    # growing the broker's memory
+                    if (
+                        client is not writer
+                        and client.transport.get_write_buffer_size() < MAX_PENDING_BYTES
+                    ):
+                        client.write(line)
+        except (OSError, ValueError):
+            pass
+        finally:
+            clients.discard(writer)
+            writer.close()
+
+    if USE_UNIX_SOCKET:
+        if os.path.exists(BUS_SOCKET_PATH):
+            os.remove(BUS_SOCKET_PATH)
+        server = await asyncio.start_unix_server(
+            handle_client, BUS_SOCKET_PATH, limit=MAX_FRAME_BYTES
+        )
+    else:
+        server = await asyncio.start_server(
+            handle_client, "127.0.0.1", BUS_TCP_PORT, limit=MAX_FRAME_BYTES
+        )
+
+    async with server:
+        await server.serve_forever()
+
+
+def run_broker():
+    asyncio.run(serve_broker())
@@ -3,33 +3,206 @@ import hashlib
 import json
 import os
 import random
+import sqlite3
+import threading
 import time
 from functools import wraps
+from typing import Any, Awaitable, Callable, Hashable
 
 from langchain.schema import messages_to_dict
 
 from .spinner import Spinner
 
-CACHE_FILE = "cache.json"
+CACHE_DB_FILE = "cache.db"
+LEGACY_CACHE_FILE = "cache.json"
+CACHE_MAX_ENTRIES = 100000
+# Eviction runs once every this many writes
+EVICTION_INTERVAL = 1000
 
 
 def get_hash(string: str):
     return hashlib.sha256(string.encode("utf-8")).hexdigest()
 
 
-def save_cache(cache):
-    with open(CACHE_FILE, "w") as f:
-        json.dump(cache, f)
+class LLMCache:
+    """SQLite-backed store for cached LLM responses.
 
+    The database runs in WAL mode, so the world, web and Discord processes can
+    read and write it concurrently, and each write only touches one row. The
+    connection is opened on first use, and the least recently used entries
+    are evicted once there are more than max_entries.
+    """
 
-def load_cache():
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, "r") as f:
-            return json.load(f)
-    return {}
+    def __init__(self, path: str = CACHE_DB_FILE, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._connection: sqlite3.Connection = None
+        self._lock = threading.Lock()
+        self._writes = 0
 
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                """
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS cache_last_used ON cache (last_used)"
+            )
+            self._connection = connection
+            self._import_legacy_cache()
+        return self._connection
 
-cache = load_cache()
+    def _import_legacy_cache(self):
+        """Copies entries from the old cache.json the first time the store is opened."""
+        (version,) = self._connection.execute("PRAGMA user_version").fetchone()
+        if version > 0:
+            return
+
+        if os.path.exists(LEGACY_CACHE_FILE):
+            with open(LEGACY_CACHE_FILE, "r") as f:
+                legacy_cache = json.load(f)
+
+            now = time.time()
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO cache (key, value, last_used) VALUES (?, ?, ?)",
+                [(key, json.dumps(value), now) for key, value in legacy_cache.items()],
+            )
+            self._connection.execute("COMMIT")
+
+        self._connection.execute("PRAGMA user_version = 1")
+
+    def get(self, key: str):
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT value FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            self.connection.execute(
+                "UPDATE cache SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            return json.loads(row[0])
+
+    def set(self, key: str, value):
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, last_used) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time()),
+            )
+
+            self._writes += 1
+            if self._writes % EVICTION_INTERVAL == 0:
+                self._evict()
+
+    def _evict(self):
+        (count,) = self.connection.execute("SELECT COUNT(*) FROM cache").fetchone()
+        if count > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+
+cache = LLMCache()
+
+
+class CacheStats:
+    def __init__(self):
+        self.api_calls = 0
+        self.cache_hits = 0
+        self.deduplicated = 0
+
+    @property
+    def saved_calls(self) -> int:
+        return self.cache_hits + self.deduplicated
+
+    def summary(self) -> str:
+        return (
+            f"{self.api_calls} LLM calls made, {self.saved_calls} saved "
+            f"({self.cache_hits} cache hits, {self.deduplicated} shared in-flight)"
+        )
+
+
+cache_stats = CacheStats()
+
+
+class DerivedCacheStats:
+    def __init__(self):
+        self.hits: dict[str, int] = {}
+        self.misses: dict[str, int] = {}
+
+    def hit_rate(self, name: str) -> float:
+        total = self.hits.get(name, 0) + self.misses.get(name, 0)
+        return self.hits.get(name, 0) / total if total > 0 else 0.0
+
+    def summary(self) -> str:
+        return ", ".join(
+            f"{name}: {self.hits.get(name, 0)} reused, {misses} recomputed "
+            f"({self.hit_rate(name):.0%} hit rate)"
+            for name, misses in self.misses.items()
+        )
+
+
+derived_stats = DerivedCacheStats()
+
+
+class DerivedCache:
+    """Values derived from other state, kept until that state's version changes.
+
+    An entry is a name, the key it was computed for (an agent id, say) and
+    the version of its inputs at the time. Callers that ask for the same
+    version while it's being computed share the result.
+    """
+
+    def __init__(self):
+        self.entries: dict[tuple[str, Hashable], tuple[Hashable, asyncio.Future]] = {}
+
+    async def get(
+        self,
+        name: str,
+        key: Hashable,
+        version: Hashable,
+        compute: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        entry = self.entries.get((name, key))
+        if entry is not None and entry[0] == version:
+            derived_stats.hits[name] = derived_stats.hits.get(name, 0) + 1
+            return await asyncio.shield(entry[1])
+
+        derived_stats.misses[name] = derived_stats.misses.get(name, 0) + 1
+        task = asyncio.ensure_future(compute())
+        self.entries[(name, key)] = (version, task)
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            # don't keep failed values around
+            failed = task.done() and (task.cancelled() or task.exception())
+            if failed and self.entries.get((name, key), (None, None))[1] is task:
+                del self.entries[(name, key)]
+            raise
+
+
+# Requests that are still waiting on the API, keyed by cache key
+in_flight: dict[str, asyncio.Future] = {}
+
+
+class InFlightCancelled(Exception):
+    """The caller making a request others were waiting on was cancelled"""
 
 
 def json_cache(sleep_range=(0, 0)):
@@ -42,11 +215,11 @@ def json_cache(sleep_range=(0, 0)):
             with Spinner(loading_text):
                 time.sleep(sleep_seconds)
             key = f"{func.__name__}_{args}_{kwargs}"
-            if key in cache:
-                return cache[key]
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
             result = func(*args, **kwargs)
-            cache[key] = result
-            save_cache(cache)
+            cache.set(key, result)
             return result
 
         return wrapper
@@ -68,11 +241,42 @@ def chat_json_cache(sleep_range=(0, 0)):
             key_string = f"{func.__name__}_{temp_args}_{kwargs}"
             # set key to a consistent hash of key_string across runs
             key = get_hash(key_string)
-            if key in cache:
-                return cache[key]
-            result = await func(*args, **kwargs)
-            cache[key] = result
-            save_cache(cache)
+            cached = cache.get(key)
+            if cached is not None:
+                cache_stats.cache_hits += 1
+                return cached
+
+            # If an identical request is already running, wait for its result
+            while key in in_flight:
+                cache_stats.deduplicated += 1
+                try:
+                    return await asyncio.shield(in_flight[key])
+                except InFlightCancelled:
+                    # make the request again, the first of the waiters to get
+                    # here makes it for the others
+                    continue
+
+            future = asyncio.get_running_loop().create_future()
+            in_flight[key] = future
+            try:
+                result = await func(*args, **kwargs)
+                future.set_result(result)
+            except Exception as e:
+                future.set_exception(e)
+                # the caller gets the exception, so don't warn if nobody else awaits it
+                future.exception()
+                raise
+            finally:
+                if not future.done():
+                    # cancelled, but the waiters weren't
+                    future.set_exception(InFlightCancelled())
+                    future.exception()
+                if in_flight.get(key) is future:
+                    del in_flight[key]
+
+            # the waiters already have the result, even if caching it fails
+            cache_stats.api_calls += 1
+            cache.set(key, result)
             return result
 
         return wrapper
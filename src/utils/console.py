@@ -0,0 +1,162 @@
+"""Console output for the world, printed on its own thread.
+
+print_to_console and Spinner only put an item on a queue, so they never block
+the event loop. The renderer thread types lines out word by word, and prints
+them whole while more are waiting so it never falls behind. Set CONSOLE_MODE
+to "fast" to always print lines whole, or "headless" to print nothing.
+"""
+import atexit
+import itertools
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from enum import Enum
+from typing import Any, Optional
+
+from colorama import Style
+
+from .colors import LogColor
+
+
+class ConsoleMode(Enum):
+    TYPING = "typing"
+    FAST = "fast"
+    HEADLESS = "headless"
+
+
+CONSOLE_MODE = ConsoleMode(os.getenv("CONSOLE_MODE", ConsoleMode.TYPING.value))
+
+SPINNER_DELAY_SECONDS = 0.1
+
+# How long flush waits for the renderer to print what's queued
+FLUSH_TIMEOUT_SECONDS = 5
+
+
+class ConsoleRenderer:
+    def __init__(self, mode: ConsoleMode = CONSOLE_MODE):
+        self.mode = mode
+        self.queue: queue.SimpleQueue[tuple[str, Any]] = queue.SimpleQueue()
+        self.pending = 0
+        self.printed = threading.Condition()
+        self.statuses: list[str] = []
+        self.spinner = itertools.cycle(["-", "/", "|", "\\"])
+        self.status_width = 0
+        self._pid: Optional[int] = None
+
+    def _submit(self, kind: str, item: Any):
+        if self.mode == ConsoleMode.HEADLESS:
+            return
+
+        # the world, web server and Discord processes are forked from the one
+        # that imported this, and threads don't survive a fork
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self.queue = queue.SimpleQueue()
+            self.pending = 0
+            self.printed = threading.Condition()
+            threading.Thread(target=self.run, name="console", daemon=True).start()
+
+        with self.printed:
+            self.pending += 1
+        self.queue.put((kind, item))
+
+    def print(
+        self,
+        title: str,
+        title_color: LogColor,
+        content: Any,
+        min_typing_speed: float,
+        max_typing_speed: float,
+    ):
+        self._submit(
+            "print",
+            (title, title_color, content, min_typing_speed, max_typing_speed),
+        )
+
+    def start_status(self, message: str):
+        self._submit("start_status", message)
+
+    def end_status(self, message: str):
+        self._submit("end_status", message)
+
+    def flush(self, timeout: float = FLUSH_TIMEOUT_SECONDS):
+        """Waits for everything queued so far to be printed"""
+        if self._pid == os.getpid():
+            with self.printed:
+                self.printed.wait_for(lambda: self.pending == 0, timeout)
+
+    def run(self):
+        while True:
+            try:
+                kind, item = self.queue.get(
+                    timeout=SPINNER_DELAY_SECONDS if self.statuses else None
+                )
+            except queue.Empty:
+                self._draw_status()
+                continue
+
+            self._clear_status()
+            if kind == "print":
+                self._print(*item)
+            elif kind == "start_status":
+                self.statuses.append(item)
+            elif kind == "end_status" and item in self.statuses:
+                self.statuses.remove(item)
+
+            with self.printed:
+                self.pending -= 1
+                if self.pending == 0:
+                    self._draw_status()
+                    self.printed.notify_all()
+
+    def _draw_status(self):
+        if not self.statuses or not sys.stdout.isatty():
+            return
+        line = f"{next(self.spinner)} {self.statuses[-1]}"
+        sys.stdout.write("\r" + line.ljust(self.status_width) + "\r")
+        sys.stdout.flush()
+        self.status_width = len(line)
+
+    def _clear_status(self):
+        if self.status_width:
+            sys.stdout.write("\r" + " " * self.status_width + "\r")
+            self.status_width = 0
+
+    def _print(
+        self,
+        title: str,
+        title_color: LogColor,
+        content: Any,
+        min_typing_speed: float,
+        max_typing_speed: float,
+    ):
+        print(title_color.value + title + " " + Style.RESET_ALL, end="")
+        if content:
+            if isinstance(content, list):
+                content = " ".join(content)
+            lines = str(content).split("\n")
+            for line in lines:
+                words = line.split()
+                for i, word in enumerate(words):
+                    # type the rest at once if more lines are waiting
+                    if self.mode == ConsoleMode.FAST or not self.queue.empty():
+                        print(" ".join(words[i:]), end="")
+                        break
+                    print(word, end="", flush=True)
+                    if i < len(words) - 1:
+                        print(" ", end="", flush=True)
+                    typing_speed = random.uniform(min_typing_speed, max_typing_speed)
+                    time.sleep(typing_speed)
+                    # type faster after each word
+                    min_typing_speed = min_typing_speed * 0.97
+                    max_typing_speed = max_typing_speed * 0.97
+                print()
+        sys.stdout.flush()
+
+
+console = ConsoleRenderer()
+
+atexit.register(console.flush)
@@ -1,8 +1,9 @@
 """Base class for database providers."""
 import abc
 import datetime
+from contextlib import asynccontextmanager
 from enum import Enum
-from typing import Any
+from typing import Any, AsyncIterator, Callable
 
 from numpy import ndarray
 
@@ -60,14 +61,23 @@ class DatabaseProviderSingleton(AbstractSingleton):
         """get the most recent events"""
         pass
 
+    @abc.abstractmethod
+    async def get_events_since(
+        self, world_id: str, timestamp: datetime.datetime, limit: int
+    ) -> list[dict[str, Any]]:
+        """get the most recent events at or after timestamp, oldest first"""
+        pass
+
     @abc.abstractmethod
     async def get_messages_by_discord_id(self, discord_id: str) -> list[dict[str, Any]]:
         """get messages by discord id"""
         pass
 
     @abc.abstractmethod
-    async def insert(self, table: Tables, data: dict, upsert=False) -> None:
-        """insert a row"""
+    async def insert(
+        self, table: Tables, data: dict | list[dict], upsert=False
+    ) -> None:
+        """insert one or more rows"""
         pass
 
     @abc.abstractmethod
@@ -90,6 +100,17 @@ class DatabaseProviderSingleton(AbstractSingleton):
         """search for rows with embeddings"""
         pass
 
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[None]:
+        """group the writes made inside the block into a single commit.
+        providers without transactions write each statement as it comes"""
+        yield
+
+    def after_commit(self, callback: Callable[[], None]) -> None:
+        """run callback once the current transaction commits, dropped if it rolls back.
+        providers without transactions run it right away"""
+        callback()
+
     @abc.abstractmethod
     async def close(self) -> None:
         """close the database"""
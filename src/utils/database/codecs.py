@@ -0,0 +1,86 @@
+"""Per-table column decoders for rows read from SQLite.
+
+Only the columns declared here are decoded, every other value is returned as
+SQLite gave it. Lists and dicts are stored as JSON text, embeddings as
+little-endian float32 BLOBs that decode to a NumPy array without a copy.
+"""
+import json
+from typing import Any, Callable
+
+import numpy as np
+
+from src.utils.database.base import Tables
+
+Decoder = Callable[[Any], Any]
+
+EMBEDDING_DTYPE = np.dtype("<f4")
+
+
+def encode_embedding(embedding: np.ndarray) -> bytes:
+    return np.asarray(embedding, dtype=EMBEDDING_DTYPE).tobytes()
+
+
+def encode_value(value: Any) -> Any:
+    """Converts a value from a row dict into something SQLite can store"""
+    if isinstance(value, np.ndarray):
+        return encode_embedding(value)
+    if isinstance(value, list) or isinstance(value, dict):
+        return json.dumps(value)
+    return value
+
+
+def decode_json(value: Any) -> Any:
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def decode_embedding(value: Any) -> Any:
+    if isinstance(value, bytes):
+        # read-only view of the row's buffer
+        return np.frombuffer(value, dtype=EMBEDDING_DTYPE)
+    # rows written before embeddings were stored as BLOBs
+    if isinstance(value, str):
+        return np.array(json.loads(value), dtype=np.float32)
+    return value
+
+
+COLUMN_CODECS: dict[Tables, dict[str, Decoder]] = {
+    Tables.Locations: {
+        "available_tools": decode_json,
+        "allowed_agent_ids": decode_json,
+    },
+    Tables.Agents: {
+        "authorized_tools": decode_json,
+        "directives": decode_json,
+        "ordered_plan_ids": decode_json,
+    },
+    Tables.Plans: {
+        "scratchpad": decode_json,
+    },
+    Tables.Events: {
+        "witness_ids": decode_json,
+        "metadata": decode_json,
+    },
+    Tables.Memories: {
+        "related_memory_ids": decode_json,
+        "embedding": decode_embedding,
+    },
+    Tables.Documents: {
+        "embedding": decode_embedding,
+    },
+}
+
+
+def _decoders_by_column() -> dict[str, Decoder]:
+    # A cursor only knows column names, not which table they came from (joins
+    # mix tables), so a name has to mean the same thing in every table
+    decoders: dict[str, Decoder] = {}
+    for table, codecs in COLUMN_CODECS.items():
+        for column, decoder in codecs.items():
+            if decoders.setdefault(column, decoder) is not decoder:
+                raise ValueError(
+                    f"Column {column} of {table.value} conflicts with another table's decoder"
+                )
+    return decoders
+
+
+COLUMN_DECODERS = _decoders_by_column()
@@ -0,0 +1,235 @@
+"""Versioned schema for the SQLite database.
+
+Each entry in MIGRATIONS upgrades the schema by one version, and the version a
+database is at is kept in SQLite's user_version pragma. A step is either a list
+of statements or a coroutine that gets the connection. Add new steps to the
+end of the list, never edit one that has shipped.
+
+Run `poetry run db-migrate` to upgrade database.db without starting a world.
+"""
+import asyncio
+import json
+import os
+from typing import Awaitable, Callable, Optional, Union
+
+import aiosqlite
+
+from src.utils.database.codecs import encode_embedding
+
+# Applied on every connection, these aren't stored in the database file
+CONNECTION_PRAGMAS = [
+    # readers don't block the writer, and commits are an append to the WAL
+    "PRAGMA journal_mode = WAL",
+    # in WAL mode this is still safe against corruption, it only skips an fsync
+    "PRAGMA synchronous = NORMAL",
+    # 64MB of page cache, a negative size is in KiB
+    "PRAGMA cache_size = -65536",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA busy_timeout = 5000",
+]
+
+# How many prepared statements each connection keeps around
+CACHED_STATEMENTS = 256
+
+CREATE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS worlds (
+        id TEXT PRIMARY KEY,
+        name TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS locations (
+        id TEXT PRIMARY KEY,
+        name TEXT,
+        world_id TEXT,
+        available_tools TEXT,
+        description TEXT,
+        channel_id TEXT,
+        allowed_agent_ids TEXT,
+        FOREIGN KEY (world_id) REFERENCES worlds (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS agents (
+        id TEXT PRIMARY KEY,
+        full_name TEXT,
+        private_bio TEXT,
+        public_bio TEXT,
+        authorized_tools TEXT,
+        directives TEXT,
+        last_checked_events TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        ordered_plan_ids TEXT,
+        location_id TEXT,
+        discord_bot_token TEXT,
+        world_id TEXT,
+        FOREIGN KEY (world_id) REFERENCES worlds (id),
+        FOREIGN KEY (location_id) REFERENCES locations (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS plans (
+        id TEXT PRIMARY KEY,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        agent_id TEXT,
+        description TEXT,
+        location_id TEXT,
+        max_duration_hrs REAL,
+        stop_condition TEXT,
+        completed_at TIMESTAMP,
+        scratchpad TEXT,
+        status TEXT DEFAULT 'todo' CHECK(status IN ('failed', 'in_progress', 'todo', 'done')),
+        related_event_id TEXT,
+        FOREIGN KEY (agent_id) REFERENCES agents (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS events (
+        id TEXT PRIMARY KEY,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        type TEXT CHECK (type IN ('non_message', 'message')),
+        subtype TEXT,
+        description TEXT,
+        agent_id TEXT,
+        location_id TEXT,
+        witness_ids TEXT,
+        metadata TEXT,
+        FOREIGN KEY (agent_id) REFERENCES agents (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS memories (
+        id TEXT PRIMARY KEY,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        agent_id TEXT,
+        type TEXT CHECK (type IN ('reflection', 'observation')),
+        description TEXT,
+        related_memory_ids TEXT,
+        embedding TEXT,
+        importance INTEGER,
+        last_accessed TIMESTAMP,
+        FOREIGN KEY (agent_id) REFERENCES agents (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS documents (
+        id TEXT PRIMARY KEY,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        agent_id TEXT,
+        title TEXT,
+        normalized_title TEXT,
+        content TEXT,
+        embedding TEXT,
+        FOREIGN KEY (agent_id) REFERENCES agents (id)
+    )
+    """,
+]
+
+CREATE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS memories_agent_id_created_at ON memories (agent_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS events_timestamp ON events (timestamp)",
+    "CREATE INDEX IF NOT EXISTS events_location_id_timestamp ON events (location_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS events_agent_id_timestamp ON events (agent_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS locations_world_id ON locations (world_id)",
+    "CREATE INDEX IF NOT EXISTS agents_world_id ON agents (world_id)",
+    "CREATE INDEX IF NOT EXISTS plans_agent_id ON plans (agent_id)",
+    "CREATE INDEX IF NOT EXISTS documents_normalized_title ON documents (normalized_title)",
+    "ANALYZE",
+]
+
+EMBEDDING_CONVERSION_BATCH_SIZE = 1000
+
+
+async def convert_embeddings_to_blobs(connection: aiosqlite.Connection) -> None:
+    """Rewrites JSON text embeddings as float32 BLOBs, in place.
+    The columns keep their declared TEXT type, SQLite stores BLOBs in them as is"""
+    for table in ["memories", "documents"]:
+        while True:
+            async with connection.execute(
+                f"SELECT rowid, embedding FROM {table} WHERE typeof(embedding) = 'text' LIMIT ?",
+                (EMBEDDING_CONVERSION_BATCH_SIZE,),
+            ) as cursor:
+                cursor.row_factory = None
+                rows = await cursor.fetchall()
+
+            if len(rows) == 0:
+                break
+
+            await connection.executemany(
+                f"UPDATE {table} SET embedding = ? WHERE rowid = ?",
+                [(encode_embedding(json.loads(text)), rowid) for rowid, text in rows],
+            )
+
+
+Migration = Union[list[str], Callable[[aiosqlite.Connection], Awaitable[None]]]
+
+MIGRATIONS: list[Migration] = [
+    CREATE_TABLES,
+    CREATE_INDEXES,
+    convert_embeddings_to_blobs,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+async def configure(connection: aiosqlite.Connection) -> None:
+    for pragma in CONNECTION_PRAGMAS:
+        await connection.execute(pragma)
+
+
+async def get_schema_version(connection: aiosqlite.Connection) -> int:
+    async with connection.execute("PRAGMA user_version") as cursor:
+        row = await cursor.fetchone()
+    return row[0] if isinstance(row, tuple) else row["user_version"]
+
+
+async def migrate(
+    connection: aiosqlite.Connection, target: Optional[int] = None
+) -> int:
+    """Brings the schema up to the target version (the latest by default).
+    Each step commits on its own, so a failed step leaves the database at the
+    last version that succeeded. Returns the version the database is at."""
+    target = SCHEMA_VERSION if target is None else target
+    version = await get_schema_version(connection)
+
+    while version < target:
+        await connection.execute("BEGIN")
+        try:
+            step = MIGRATIONS[version]
+            if callable(step):
+                await step(connection)
+            else:
+                for statement in step:
+                    await connection.execute(statement)
+            version += 1
+            # pragmas don't take parameters
+            await connection.execute(f"PRAGMA user_version = {version}")
+        except BaseException:
+            await connection.rollback()
+            raise
+        await connection.commit()
+
+    return version
+
+
+async def migrate_file(path: str = "database.db") -> None:
+    size_before = os.path.getsize(path)
+
+    async with aiosqlite.connect(path) as connection:
+        await configure(connection)
+        version_before = await get_schema_version(connection)
+        version = await migrate(connection)
+
+        if version != version_before:
+            # hand the space freed by the migration back to the filesystem
+            await connection.execute("VACUUM")
+
+    print(
+        f"{path}: schema version {version_before} -> {version}, "
+        f"{size_before / 1e6:.1f}MB -> {os.path.getsize(path) / 1e6:.1f}MB"
+    )
+
+
+def main():
+    asyncio.run(migrate_file())
@@ -16,8 +16,9 @@ async def reset():
     if DATABASE_PROVIDER == "supabase":
         subprocess.run(["supabase", "db", "reset"])
     else:
-        if os.path.exists("database.db"):
-            os.remove("database.db")
+        for path in ["database.db", "database.db-wal", "database.db-shm"]:
+            if os.path.exists(path):
+                os.remove(path)
 
         if os.path.exists("vectors.pickle.gz"):
             os.remove("vectors.pickle.gz")
@@ -1,8 +1,11 @@
+import asyncio
 import datetime
 import json
 import uuid
+import weakref
+from contextlib import asynccontextmanager
 from sqlite3 import Cursor
-from typing import Any, Coroutine
+from typing import Any, AsyncIterator, Callable, Coroutine, Optional
 
 import aiosqlite
 from genericpath import isfile
@@ -10,6 +13,9 @@ from hyperdb import HyperDB
 from numpy import ndarray
 
 from src.utils.database.base import DatabaseProviderSingleton, Tables
+from src.utils.database.codecs import COLUMN_DECODERS, encode_value
+from src.utils.database.migrations import CACHED_STATEMENTS, configure, migrate
+from src.utils.embeddings import get_embedding
 
 
 class NumpyArrayEncoder(json.JSONEncoder):
@@ -19,21 +25,84 @@ class NumpyArrayEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
+# The column names and decoders of each cursor's current result set
+row_layouts: "weakref.WeakKeyDictionary[Cursor, RowLayout]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+class RowLayout:
+    def __init__(self, description: tuple):
+        self.description = description
+        self.fields = [column[0] for column in description]
+        self.decoders = [
+            (index, field, COLUMN_DECODERS[field])
+            for index, field in enumerate(self.fields)
+            if field in COLUMN_DECODERS
+        ]
+
+
 def dict_factory(cursor: Cursor, row: Any) -> dict[str, Any]:
-    fields = [column[0] for column in cursor.description]
-    row = [
-        json.loads(value)
-        if isinstance(value, str) and (value.startswith("[") or value.startswith("{"))
-        else value
-        for value in row
-    ]
-    return {key: value for key, value in zip(fields, row)}
+    layout = row_layouts.get(cursor)
+    # a cursor gets a new description object each time it runs a query
+    if layout is None or layout.description is not cursor.description:
+        layout = row_layouts[cursor] = RowLayout(cursor.description)
+
+    result = dict(zip(layout.fields, row))
+    for index, field, decode in layout.decoders:
+        if row[index] is not None:
+            result[field] = decode(row[index])
+    return result
 
 
 class SqliteDatabase(DatabaseProviderSingleton):
     client: aiosqlite.Connection = None
     documents = []
     vector_db: HyperDB = None
+    # every agent shares the one connection, so only one transaction can be open
+    write_lock: asyncio.Lock = None
+    # The task whose transaction is open
+    transaction_owner: Optional[asyncio.Task] = None
+    # Run once the open transaction commits
+    commit_callbacks: list[Callable[[], None]] = []
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[None]:
+        """Commits the writes made inside the block together, or rolls them all back.
+
+        Nested blocks in the same task join the outermost one. Every other
+        task's writes wait until the block exits, including tasks started
+        inside it, so don't await those in the block, and keep slow work like
+        LLM calls out of it.
+        """
+        if self.transaction_owner is asyncio.current_task():
+            yield
+            return
+
+        async with self.write_lock:
+            self.transaction_owner = asyncio.current_task()
+            callbacks = self.commit_callbacks = []
+            try:
+                yield
+            except BaseException:
+                await self.client.rollback()
+                raise
+            else:
+                await self.client.commit()
+            finally:
+                self.transaction_owner = None
+                self.commit_callbacks = []
+
+        for callback in callbacks:
+            callback()
+
+    def after_commit(self, callback: Callable[[], None]) -> None:
+        """Runs callback once the current task's transaction commits, or right away
+        outside one. It's dropped if the transaction rolls back"""
+        if self.transaction_owner is asyncio.current_task():
+            self.commit_callbacks.append(callback)
+        else:
+            callback()
 
     async def get_by_id(self, table: Tables, id: str) -> list[dict[str, Any]]:
         async with self.client.execute(
@@ -110,6 +179,16 @@ class SqliteDatabase(DatabaseProviderSingleton):
         ) as cursor:
             return await cursor.fetchall()
 
+    async def get_events_since(
+        self, world_id: str, timestamp: datetime, limit: int
+    ) -> list[dict[str, Any]]:
+        # the newest `limit` events, returned oldest first
+        async with self.client.execute(
+            f"SELECT * FROM (SELECT Events.*, Locations.world_id FROM Events INNER JOIN locations ON Events.location_id = locations.id WHERE Locations.world_id = ? AND Events.timestamp >= ? ORDER BY Events.timestamp DESC, Events.id DESC LIMIT ?) ORDER BY timestamp, id",
+            (world_id, str(timestamp), limit),
+        ) as cursor:
+            return await cursor.fetchall()
+
     async def get_messages_by_discord_id(self, discord_id: str) -> list[dict[str, Any]]:
         async with self.client.execute(
             f"select * from events where metadata is not null and metadata->>'$.discord_id' = ?",
@@ -122,37 +201,38 @@ class SqliteDatabase(DatabaseProviderSingleton):
     ) -> None:
         if isinstance(data, dict):
             data = [data]
+
+        # rows with the same columns share a statement, sent with one executemany
+        rows_by_columns: dict[tuple[str, ...], list[tuple]] = {}
         for item in data:
             if "id" not in item:
                 item["id"] = uuid.uuid4().hex
             for key, value in item.items():
-                if isinstance(value, list) or isinstance(value, dict):
-                    item[key] = json.dumps(value)
-            if upsert:
-                await self.client.execute(
-                    f"INSERT OR REPLACE INTO {table.value} ({','.join(item.keys())}) VALUES ({','.join(['?'] * len(item))})",
-                    tuple(item.values()),
-                )
-            else:
-                await self.client.execute(
-                    f"INSERT INTO {table.value} ({','.join(item.keys())}) VALUES ({','.join(['?'] * len(item))})",
-                    tuple(item.values()),
+                item[key] = encode_value(value)
+            rows_by_columns.setdefault(tuple(item.keys()), []).append(
+                tuple(item.values())
+            )
+
+        verb = "INSERT OR REPLACE" if upsert else "INSERT"
+        async with self.transaction():
+            for columns, rows in rows_by_columns.items():
+                await self.client.executemany(
+                    f"{verb} INTO {table.value} ({','.join(columns)}) VALUES ({','.join(['?'] * len(columns))})",
+                    rows,
                 )
-            await self.client.commit()
 
     async def update(self, table: Tables, id: str, data: dict) -> None:
         for key, value in data.items():
-            if isinstance(value, list) or isinstance(value, dict):
-                data[key] = json.dumps(value)
-        await self.client.execute(
-            f"UPDATE {table.value} SET {','.join([f'{key} = ?' for key in data.keys()])} WHERE id = ?",
-            tuple(data.values()) + (id,),
-        )
-        await self.client.commit()
+            data[key] = encode_value(value)
+        async with self.transaction():
+            await self.client.execute(
+                f"UPDATE {table.value} SET {','.join([f'{key} = ?' for key in data.keys()])} WHERE id = ?",
+                tuple(data.values()) + (id,),
+            )
 
     async def delete(self, table: Tables, id: str) -> None:
-        await self.client.execute(f"DELETE FROM {table.value} WHERE id = ?", (id,))
-        await self.client.commit()
+        async with self.transaction():
+            await self.client.execute(f"DELETE FROM {table.value} WHERE id = ?", (id,))
         if table == Tables.Documents:
             indexes = [
                 i for i, x in enumerate(self.vector_db.documents) if x["id"] == id
@@ -168,7 +248,7 @@ class SqliteDatabase(DatabaseProviderSingleton):
                 await self.delete(Tables.Documents, data["id"])
         await self.insert(Tables.Documents, data)
         data["embedding_text"] = embedding_text
-        self.vector_db.add_document(data)
+        self.vector_db.add_document(data, await get_embedding(embedding_text))
 
     async def search_document_embeddings(
         self, embedding_text: str, limit: int = 10
@@ -186,7 +266,10 @@ class SqliteDatabase(DatabaseProviderSingleton):
 
     @classmethod
     async def create(cls):
-        cls.client = await aiosqlite.connect("database.db")
+        cls.client = await aiosqlite.connect(
+            "database.db", cached_statements=CACHED_STATEMENTS
+        )
+        cls.write_lock = asyncio.Lock()
         cls.documents = []
         cls.vector_db = HyperDB(cls.documents, key="embedding_text")
         try:
@@ -197,111 +280,8 @@ class SqliteDatabase(DatabaseProviderSingleton):
             cls.vector_db = HyperDB(cls.documents, key="embedding_text")
             pass
 
-        await cls.client.execute(
-            """
-        CREATE TABLE IF NOT EXISTS worlds (
-            id TEXT PRIMARY KEY,
-            name TEXT
-        )
-        """
-        )
-        await cls.client.execute(
-            """
-        CREATE TABLE IF NOT EXISTS locations (
-            id TEXT PRIMARY KEY,
-            name TEXT,
-            world_id TEXT,
-            available_tools TEXT,
-            description TEXT,
-            channel_id TEXT,
-            allowed_agent_ids TEXT,
-            FOREIGN KEY (world_id) REFERENCES worlds (id)
-        )
-        """
-        )
-        await cls.client.execute(
-            """
-        CREATE TABLE IF NOT EXISTS agents (
-            id TEXT PRIMARY KEY,
-            full_name TEXT,
-            private_bio TEXT,
-            public_bio TEXT,
-            authorized_tools TEXT,
-            directives TEXT,
-            last_checked_events TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            ordered_plan_ids TEXT,
-            location_id TEXT,
-            discord_bot_token TEXT,
-            world_id TEXT,
-            FOREIGN KEY (world_id) REFERENCES worlds (id),
-            FOREIGN KEY (location_id) REFERENCES locations (id)
-        )
-        """
-        )
-        await cls.client.execute(
-            """
-        CREATE TABLE IF NOT EXISTS plans (
-            id TEXT PRIMARY KEY,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            agent_id TEXT,
-            description TEXT,
-            location_id TEXT,
-            max_duration_hrs REAL,
-            stop_condition TEXT,
-            completed_at TIMESTAMP,
-            scratchpad TEXT,
-            status TEXT DEFAULT 'todo' CHECK(status IN ('failed', 'in_progress', 'todo', 'done')),
-            related_event_id TEXT,
-            FOREIGN KEY (agent_id) REFERENCES agents (id)
-        )
-        """
-        )
-        await cls.client.execute(
-            """
-        CREATE TABLE IF NOT EXISTS events (
-            id TEXT PRIMARY KEY,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            type TEXT CHECK (type IN ('non_message', 'message')),
-            subtype TEXT,
-            description TEXT,
-            agent_id TEXT,
-            location_id TEXT,
-            witness_ids TEXT,
-            metadata TEXT,
-            FOREIGN KEY (agent_id) REFERENCES agents (id)
-        )
-        """
-        )
-        await cls.client.execute(
-            """
-        CREATE TABLE IF NOT EXISTS memories (
-            id TEXT PRIMARY KEY,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            agent_id TEXT,
-            type TEXT CHECK (type IN ('reflection', 'observation')),
-            description TEXT,
-            related_memory_ids TEXT,
-            embedding TEXT,
-            importance INTEGER,
-            last_accessed TIMESTAMP,
-            FOREIGN KEY (agent_id) REFERENCES agents (id)
-        )
-        """
-        )
-        await cls.client.execute(
-            """
-        CREATE TABLE IF NOT EXISTS documents (
-            id TEXT PRIMARY KEY,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            agent_id TEXT,
-            title TEXT,
-            normalized_title TEXT,
-            content TEXT,
-            embedding TEXT,
-            FOREIGN KEY (agent_id) REFERENCES agents (id)
-        )
-        """
-        )
-        await cls.client.commit()
+        await configure(cls.client)
+        await migrate(cls.client)
+
         cls.client.row_factory = dict_factory
         return cls()
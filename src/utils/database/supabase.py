@@ -9,9 +9,18 @@ from src.utils.colors import LogColor
 from src.utils.database.base import DatabaseProviderSingleton, Tables
 from src.utils.database.clients.supabase_client import Client, create_client
 from src.utils.embeddings import get_embedding
+from src.utils.console import console
 from src.utils.formatting import print_to_console
 
 
+def encode_row(row: dict) -> dict:
+    # pgvector columns take the "[1,2,3]" text format
+    return {
+        key: str(value.tolist()) if isinstance(value, ndarray) else value
+        for key, value in row.items()
+    }
+
+
 class SupabaseDatabase(DatabaseProviderSingleton):
     client: Client
 
@@ -99,6 +108,20 @@ class SupabaseDatabase(DatabaseProviderSingleton):
             .execute()
         ).data
 
+    async def get_events_since(
+        self, world_id: str, timestamp: datetime, limit: int
+    ) -> List[Dict[str, Any]]:
+        data = (
+            await self.client.table("Events")
+            .select("*, location_id(*)")
+            .eq("location_id.world_id", world_id)
+            .gte("timestamp", str(timestamp))
+            .order("timestamp", desc=True)
+            .limit(limit)
+            .execute()
+        ).data
+        return data[::-1]
+
     async def get_messages_by_discord_id(self, discord_id: str) -> list[dict[str, Any]]:
         return (
             await self.client.table("Events")
@@ -110,12 +133,21 @@ class SupabaseDatabase(DatabaseProviderSingleton):
     async def insert(
         self, table: Tables, data: dict | list[dict], upsert=False
     ) -> None:
+        if isinstance(data, dict):
+            data = encode_row(data)
+        else:
+            data = [encode_row(item) for item in data]
         return (
             await self.client.table(table.value).insert(data, upsert=upsert).execute()
         )
 
     async def update(self, table: Tables, id: str, data: dict) -> None:
-        return await self.client.table(table.value).update(data).eq("id", id).execute()
+        return (
+            await self.client.table(table.value)
+            .update(encode_row(data))
+            .eq("id", id)
+            .execute()
+        )
 
     async def delete(self, table: Tables, id: str) -> None:
         return await self.client.table(table.value).delete().eq("id", id).execute()
@@ -133,7 +165,7 @@ class SupabaseDatabase(DatabaseProviderSingleton):
                 await self.client.rpc(
                     "match_documents",
                     {
-                        "query_embedding": list(embedding),
+                        "query_embedding": embedding.tolist(),
                         "match_threshold": 0.78,
                         "match_count": limit,
                     },
@@ -160,6 +192,7 @@ class SupabaseDatabase(DatabaseProviderSingleton):
                 LogColor.ERROR,
                 "Either there was an issue with your database connection or the tables do not exist. Please check your database connection and try again.",
             )
+            console.flush()
             print(e)
             exit(1)
 
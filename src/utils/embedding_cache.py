@@ -0,0 +1,135 @@
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Relative paths are from the working directory, like the LLM cache's cache.db
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "embedding_cache")
+HOT_CACHE_SIZE = 4096
+
+
+def get_text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Disk-backed embedding cache keyed by (model, sha256(text)).
+
+    Vectors are appended as float32 to a data file that is read through a
+    memory map. A text index file maps each key to its offset and length, and
+    recently used vectors are also kept in an in-memory LRU tier.
+    """
+
+    def __init__(
+        self, directory: str = EMBEDDING_CACHE_DIR, hot_size: int = HOT_CACHE_SIZE
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.data_path = os.path.join(directory, "embeddings.f32")
+        self.index_path = os.path.join(directory, "embeddings.idx")
+        self.hot_size = hot_size
+
+        self.hot_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._hot: OrderedDict[tuple[str, str], np.ndarray] = OrderedDict()
+        self._offsets: dict[tuple[str, str], tuple[int, int]] = {}
+        self._index_position = 0
+        self._map: Optional[np.memmap] = None
+
+        open(self.data_path, "ab").close()
+        open(self.index_path, "ab").close()
+        self._read_index()
+
+    def _read_index(self):
+        """Picks up entries appended since the last read, including other processes'."""
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            f.seek(self._index_position)
+            for line in f:
+                # a partially written last line is read again next time
+                if not line.endswith("\n"):
+                    break
+                self._index_position += len(line.encode("utf-8"))
+                model, text_hash, offset, length = line.rstrip("\n").split("\t")
+                self._offsets[(model, text_hash)] = (int(offset), int(length))
+
+    def _read_vector(self, offset: int, length: int) -> np.ndarray:
+        end = offset + length
+        if self._map is None or len(self._map) < end:
+            self._map = np.memmap(self.data_path, dtype=np.float32, mode="r")
+        return self._map[offset:end].view(np.ndarray)
+
+    def _remember(self, key: tuple[str, str], embedding: np.ndarray):
+        self._hot[key] = embedding
+        self._hot.move_to_end(key)
+        if len(self._hot) > self.hot_size:
+            self._hot.popitem(last=False)
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        key = (model, get_text_hash(text))
+
+        embedding = self._hot.get(key)
+        if embedding is not None:
+            self._hot.move_to_end(key)
+            self.hot_hits += 1
+            return embedding
+
+        if key not in self._offsets:
+            self._read_index()
+
+        if key in self._offsets:
+            embedding = self._read_vector(*self._offsets[key])
+            self._remember(key, embedding)
+            self.disk_hits += 1
+            return embedding
+
+        self.misses += 1
+        return None
+
+    def put(self, model: str, text: str, embedding: np.ndarray) -> np.ndarray:
+        key = (model, get_text_hash(text))
+        embedding = np.asarray(embedding, dtype=np.float32)
+
+        if key not in self._offsets:
+            with open(self.data_path, "ab") as data_file:
+                if fcntl is not None:
+                    fcntl.flock(data_file, fcntl.LOCK_EX)
+
+                # offsets are in float32 elements, not bytes
+                offset = data_file.seek(0, os.SEEK_END) // 4
+                data_file.write(embedding.tobytes())
+                data_file.flush()
+
+                with open(self.index_path, "a", encoding="utf-8") as index_file:
+                    index_file.write(f"{model}\t{key[1]}\t{offset}\t{len(embedding)}\n")
+
+            self._offsets[key] = (offset, len(embedding))
+
+        self._remember(key, embedding)
+
+        return embedding
+
+    def stats(self) -> dict:
+        return {
+            "hot_hits": self.hot_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "entries": len(self._offsets),
+        }
+
+
+embedding_cache: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global embedding_cache
+    if embedding_cache is None:
+        embedding_cache = EmbeddingCache()
+    return embedding_cache
@@ -1,9 +1,22 @@
+import asyncio
+import time
+import weakref
+from typing import Optional
+
 import numpy as np
 import openai
 import openai.error
-import asyncio
 
 from ..utils.cache import json_cache
+from .embedding_cache import get_embedding_cache
+from .models import estimate_tokens, get_llm_scheduler
+
+DEFAULT_EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# How long to wait for more texts before sending a batch
+EMBEDDING_BATCH_WINDOW_SECONDS = 0.005
+EMBEDDING_MAX_BATCH_SIZE = 256
+EMBEDDING_MAX_BATCH_TOKENS = 100000
 
 
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
@@ -15,18 +28,170 @@ def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
     return similarity
 
 
-async def get_embedding(text: str, model="text-embedding-ada-002", max_retries=3) -> np.ndarray:
-    for attempt in range(max_retries):
-        try:
-            response: list[float] = await openai.Embedding.acreate(
-                input=[text.replace("\n", " ")], model=model
-            )
+class EmbeddingBatcherStats:
+    def __init__(self):
+        self.requests = 0
+        self.texts = 0
+        self.coalesced = 0
+        self.tokens = 0
+        self.max_batch_size = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, batch_size: int, tokens: int, latency: float):
+        self.requests += 1
+        self.texts += batch_size
+        self.tokens += tokens
+        self.max_batch_size = max(self.max_batch_size, batch_size)
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def summary(self) -> dict:
+        return {
+            "requests": self.requests,
+            "texts": self.texts,
+            "coalesced": self.coalesced,
+            "tokens": self.tokens,
+            "mean_batch_size": self.texts / self.requests if self.requests else 0,
+            "max_batch_size": self.max_batch_size,
+            "mean_latency": self.total_latency / self.requests if self.requests else 0,
+            "max_latency": self.max_latency,
+        }
+
+
+class EmbeddingBatcher:
+    """Collects concurrent embedding requests and sends them as one API call.
+
+    Texts that arrive within EMBEDDING_BATCH_WINDOW_SECONDS of each other are
+    sent together, up to max_batch_size texts or max_batch_tokens tokens.
+    Identical texts in the same batch share a single input.
+    """
+
+    def __init__(
+        self,
+        model: str = DEFAULT_EMBEDDING_MODEL,
+        window: float = EMBEDDING_BATCH_WINDOW_SECONDS,
+        max_batch_size: int = EMBEDDING_MAX_BATCH_SIZE,
+        max_batch_tokens: int = EMBEDDING_MAX_BATCH_TOKENS,
+        max_retries: int = 3,
+    ):
+        self.model = model
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_retries = max_retries
+        self.stats = EmbeddingBatcherStats()
+        self._pending: dict[str, asyncio.Future] = {}
+        self._pending_tokens = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    async def embed(self, text: str) -> np.ndarray:
+        text = text.replace("\n", " ")
+
+        future = self._pending.get(text)
+        if future is not None:
+            self.stats.coalesced += 1
+            return await asyncio.shield(future)
+
+        tokens = estimate_tokens(text)
+        if self._pending and self._pending_tokens + tokens > self.max_batch_tokens:
+            self._flush()
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending[text] = future
+        self._pending_tokens += tokens
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, {}
+        tokens, self._pending_tokens = self._pending_tokens, 0
 
-            embedding = response["data"][0]["embedding"]
+        asyncio.get_running_loop().create_task(self._send(batch, tokens))
 
-            return np.array(embedding)
+    async def _send(self, batch: dict[str, asyncio.Future], tokens: int):
+        texts = list(batch.keys())
+        started = time.perf_counter()
+
+        try:
+            embeddings = await self._request(texts)
         except Exception as e:
-            if attempt < max_retries - 1:
-                await asyncio.sleep(1)  # Wait for 1 second before retrying
-            else:
-                raise e  # If all retries failed, raise the exception
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.stats.record(len(texts), tokens, time.perf_counter() - started)
+
+        for text, embedding in zip(texts, embeddings):
+            if not batch[text].done():
+                batch[text].set_result(embedding)
+
+    async def _request(self, texts: list[str]) -> list[np.ndarray]:
+        tokens = sum(estimate_tokens(text) for text in texts)
+
+        for attempt in range(self.max_retries):
+            try:
+                # rate limits are waited out and retried by the scheduler
+                response = await get_llm_scheduler().run(
+                    self.model,
+                    tokens,
+                    lambda: openai.Embedding.acreate(input=texts, model=self.model),
+                )
+
+                data = sorted(response["data"], key=lambda item: item["index"])
+
+                return [np.array(item["embedding"]) for item in data]
+            except Exception as e:
+                if attempt < self.max_retries - 1:
+                    await asyncio.sleep(1)  # Wait for 1 second before retrying
+                else:
+                    raise e  # If all retries failed, raise the exception
+
+
+# Futures belong to a single event loop, so each loop gets its own batchers
+_batchers = weakref.WeakKeyDictionary()
+
+
+def get_embedding_batcher(model: str = DEFAULT_EMBEDDING_MODEL) -> EmbeddingBatcher:
+    batchers = _batchers.setdefault(asyncio.get_running_loop(), {})
+    if model not in batchers:
+        batchers[model] = EmbeddingBatcher(model)
+    return batchers[model]
+
+
+def get_embedding_stats() -> dict[str, dict]:
+    """Batch size and latency stats for every model used on the running loop."""
+    batchers = _batchers.get(asyncio.get_running_loop(), {})
+    return {model: batcher.stats.summary() for model, batcher in batchers.items()}
+
+
+async def get_embedding(text: str, model=DEFAULT_EMBEDDING_MODEL) -> np.ndarray:
+    cache = get_embedding_cache()
+
+    embedding = cache.get(model, text)
+    if embedding is None:
+        embedding = await get_embedding_batcher(model).embed(text)
+        embedding = cache.put(model, text, embedding)
+
+    return embedding
+
+
+async def get_embeddings(
+    texts: list[str], model=DEFAULT_EMBEDDING_MODEL
+) -> list[np.ndarray]:
+    """Embeds several texts, which the batcher sends together."""
+    return await asyncio.gather(*[get_embedding(text, model) for text in texts])
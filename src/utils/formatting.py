@@ -1,12 +1,11 @@
-import random
+import json
 import re
-import time
 from enum import Enum
 
 import numpy as np
-from colorama import Fore, Style
 
 from .colors import LogColor
+from .console import console
 
 
 def print_to_console(
@@ -16,30 +15,10 @@ def print_to_console(
     min_typing_speed=0.06,
     max_typing_speed=0.04,
 ):
-    print(title_color.value + title + " " + Style.RESET_ALL, end="")
-    if content:
-        if isinstance(content, list):
-            content = " ".join(content)
-        lines = str(content).split("\n")
-        for line in lines:
-            words = line.split()
-            for i, word in enumerate(words):
-                print(word, end="", flush=True)
-                if i < len(words) - 1:
-                    print(" ", end="", flush=True)
-                typing_speed = random.uniform(min_typing_speed, max_typing_speed)
-                time.sleep(typing_speed)
-                # type faster after each word
-                min_typing_speed = min_typing_speed * 0.97
-                max_typing_speed = max_typing_speed * 0.97
-            print()
+    """Queues a line for the console thread, returns straight away"""
+    console.print(title, title_color, content, min_typing_speed, max_typing_speed)
 
 
 def parse_array(s: str) -> np.ndarray:
-    # Split the string by comma
-    elements = s.strip()[1:-1].split(",")
-
-    # Convert each element to a float and create a NumPy array
-    arr = np.array([float(e) for e in elements])
-
-    return arr
+    # pgvector and JSON both write vectors as "[1,2,3]"
+    return np.array(json.loads(s), dtype=np.float32)
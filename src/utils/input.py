@@ -2,9 +2,11 @@ from colorama import Fore
 
 from ..utils.formatting import print_to_console
 from .colors import LogColor
+from .console import console
 
 
 def get_user_input(question: str):
     print_to_console("Question", LogColor.CLI_INPUT, question)
+    console.flush()
     i = input()
     return i
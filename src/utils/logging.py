@@ -2,14 +2,36 @@ import atexit
 import json
 import logging
 import os
+import queue
 import re
+from bisect import bisect_right
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
-from typing import List
+from typing import TYPE_CHECKING, Iterator, List, Optional
+from uuid import UUID
 
 import openai
 import pytz
 
+if TYPE_CHECKING:
+    from .colors import LogColor
+
+AGENT_LOG_DIR = os.getenv("AGENT_LOG_DIR", "src/web/logs/agent")
+
+# A new segment is started once the current one would grow past this
+AGENT_LOG_SEGMENT_BYTES = int(os.getenv("AGENT_LOG_SEGMENT_BYTES", str(8 * 2**20)))
+
+# The oldest segments are deleted once there are more than this
+AGENT_LOG_MAX_SEGMENTS = int(os.getenv("AGENT_LOG_MAX_SEGMENTS", "16"))
+
+# The time index gets an entry at the start of each segment and about this often
+AGENT_LOG_INDEX_INTERVAL_BYTES = 2**16
+
+AGENT_LOG_INDEX_FILE = "index.jsonl"
+
+SEGMENT_NAME_PATTERN = re.compile(r"(\d{20})\.jsonl")
+
 
 def clean_json_string(json_string):
     cleaned_string = re.sub(r"\\\'", r"'", json_string)  # replace \' with '
@@ -86,7 +108,229 @@ class LoggingFilter(logging.Filter):
 
 def init_logging():
     openai.util.logger.setLevel(logging.WARNING)
-    open("src/web/logs/agent.txt", "w").close()
+
+
+def segment_path(base_offset: int, directory: str = AGENT_LOG_DIR) -> str:
+    return os.path.join(directory, f"{base_offset:020d}.jsonl")
+
+
+def list_segments(directory: str = AGENT_LOG_DIR) -> list[int]:
+    """The base offsets of the log's segments, oldest first"""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+
+    return sorted(
+        int(matches.group(1))
+        for matches in map(SEGMENT_NAME_PATTERN.fullmatch, names)
+        if matches
+    )
+
+
+def agent_log_end(directory: str = AGENT_LOG_DIR) -> int:
+    """The offset the next record will be written at"""
+    segments = list_segments(directory)
+    if not segments:
+        return 0
+    return segments[-1] + os.path.getsize(segment_path(segments[-1], directory))
+
+
+def _read_lines(start: int, directory: str) -> Iterator[tuple[int, Optional[bytes]]]:
+    """Each complete line from offset start with the offset it starts at, then the
+    offset after the last one with None"""
+    segments = list_segments(directory)
+    position = start
+
+    for base in segments[max(bisect_right(segments, start) - 1, 0) :]:
+        position = max(position, base)
+        with open(segment_path(base, directory), "rb") as segment:
+            segment.seek(position - base)
+            for line in segment:
+                # a line that's still being written is read next time
+                if not line.endswith(b"\n"):
+                    yield position, None
+                    return
+                yield position, line
+                position += len(line)
+
+    yield position, None
+
+
+def read_agent_records(
+    start: int, end: Optional[int] = None, directory: str = AGENT_LOG_DIR
+) -> tuple[list[dict], int]:
+    """The complete records from offset start up to end, and the offset after them.
+
+    Every record gets the offset it starts at. Offsets count bytes across all
+    the segments ever written, so they stay valid after older segments are
+    deleted, and a start before the oldest segment reads from its beginning.
+    """
+    records = []
+
+    for position, line in _read_lines(start, directory):
+        if line is None or (end is not None and position >= end):
+            return records, position
+        record = json.loads(line)
+        record["offset"] = position
+        records.append(record)
+
+
+def find_agent_log_offset(since: datetime, directory: str = AGENT_LOG_DIR) -> int:
+    """The offset of the first record logged at or after since"""
+    if since.tzinfo is None:
+        since = pytz.utc.localize(since)
+
+    try:
+        with open(os.path.join(directory, AGENT_LOG_INDEX_FILE)) as index_file:
+            index = [json.loads(line) for line in index_file]
+    except FileNotFoundError:
+        index = []
+
+    # start from the last indexed record before since, and scan from there
+    timestamps = [datetime.fromisoformat(entry["timestamp"]) for entry in index]
+    position = bisect_right(timestamps, since) - 1
+    start = index[position]["offset"] if position >= 0 else 0
+
+    for position, line in _read_lines(start, directory):
+        if (
+            line is None
+            or datetime.fromisoformat(json.loads(line)["timestamp"]) >= since
+        ):
+            return position
+
+
+class AgentLogHandler(logging.Handler):
+    """Writes agent records as JSON lines to size-rotated segments.
+
+    Each segment is named after the offset of its first byte, and the index
+    file maps timestamps to offsets so readers can seek by time.
+    """
+
+    def __init__(
+        self,
+        directory: str = AGENT_LOG_DIR,
+        segment_bytes: int = AGENT_LOG_SEGMENT_BYTES,
+        max_segments: int = AGENT_LOG_MAX_SEGMENTS,
+    ):
+        super().__init__()
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.segment = None
+        self.index = None
+
+    def _open(self):
+        Path(self.directory).mkdir(parents=True, exist_ok=True)
+        segments = list_segments(self.directory)
+        self.base_offset = segments[-1] if segments else 0
+        self.segment = open(segment_path(self.base_offset, self.directory), "ab")
+        self.offset = self.base_offset + self.segment.tell()
+        self.index = open(os.path.join(self.directory, AGENT_LOG_INDEX_FILE), "a")
+        self.indexed_offset = None
+
+    def _rotate(self):
+        self.segment.close()
+        self.base_offset = self.offset
+        self.segment = open(segment_path(self.base_offset, self.directory), "ab")
+        self.indexed_offset = None
+
+        segments = list_segments(self.directory)
+        if len(segments) <= self.max_segments:
+            return
+
+        for base in segments[: -self.max_segments]:
+            os.remove(segment_path(base, self.directory))
+
+        # drop the index entries that point into the deleted segments
+        first_offset = segments[-self.max_segments]
+        index_path = os.path.join(self.directory, AGENT_LOG_INDEX_FILE)
+        self.index.close()
+        with open(index_path) as index_file:
+            entries = [
+                line
+                for line in index_file
+                if json.loads(line)["offset"] >= first_offset
+            ]
+        with open(index_path + ".tmp", "w") as index_file:
+            index_file.writelines(entries)
+        os.replace(index_path + ".tmp", index_path)
+        self.index = open(index_path, "a")
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            timestamp = datetime.fromtimestamp(record.created, pytz.utc).isoformat()
+            line = (
+                json.dumps(
+                    {
+                        "timestamp": timestamp,
+                        "agent_id": record.agent_id,
+                        "agentName": record.agent_name,
+                        "color": record.color,
+                        "title": record.title,
+                        "description": record.getMessage(),
+                    }
+                )
+                + "\n"
+            ).encode("utf-8")
+
+            if self.segment is None:
+                self._open()
+            if (
+                self.offset > self.base_offset
+                and self.offset + len(line) > self.base_offset + self.segment_bytes
+            ):
+                self._rotate()
+
+            if (
+                self.indexed_offset is None
+                or self.offset - self.indexed_offset >= AGENT_LOG_INDEX_INTERVAL_BYTES
+            ):
+                self.index.write(
+                    json.dumps({"timestamp": timestamp, "offset": self.offset}) + "\n"
+                )
+                self.index.flush()
+                self.indexed_offset = self.offset
+
+            self.segment.write(line)
+            self.segment.flush()
+            self.offset += len(line)
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.acquire()
+        try:
+            if self.segment is not None:
+                self.segment.close()
+                self.index.close()
+                self.segment = None
+        finally:
+            self.release()
+        super().close()
+
+
+class AgentLogQueueHandler(QueueHandler):
+    """Hands records to a thread that writes them, so logging never waits on disk.
+
+    The thread is started in the process that logs, since the world, web
+    server and Discord processes are all forked from one that imported this.
+    """
+
+    def __init__(self, handler: logging.Handler):
+        super().__init__(queue.SimpleQueue())
+        self.handler = handler
+        self.listener: Optional[QueueListener] = None
+        self.pid: Optional[int] = None
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.queue = queue.SimpleQueue()
+            self.listener = QueueListener(self.queue, self.handler)
+            self.listener.start()
+            atexit.register(self.listener.stop)
+        super().enqueue(record)
 
 
 def get_agent_logger():
@@ -101,10 +345,7 @@ def get_agent_logger():
     for handler in logger.handlers[:]:
         logger.removeHandler(handler)
 
-    # Create a file handler
-    Path("src/web/logs/").mkdir(parents=True, exist_ok=True)
-
-    handler = logging.FileHandler("src/web/logs/agent.txt")
+    handler = AgentLogQueueHandler(AgentLogHandler())
     handler.setLevel(logging.INFO)
 
     # Add the handlers to the logger
@@ -114,3 +355,21 @@ def get_agent_logger():
 
 
 agent_logger = get_agent_logger()
+
+
+def log_agent(
+    agent_id: UUID | str,
+    agent_name: str,
+    color: "LogColor",
+    title: str,
+    description: str = "",
+):
+    agent_logger.info(
+        description,
+        extra={
+            "agent_id": str(agent_id),
+            "agent_name": agent_name,
+            "color": color.name,
+            "title": title,
+        },
+    )
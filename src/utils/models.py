@@ -1,5 +1,16 @@
-from enum import Enum
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import Enum, IntEnum
+from typing import Awaitable, Callable, Optional, TypeVar
 
+import openai.error
 from dotenv import load_dotenv
 from langchain.chat_models import ChatAnthropic, ChatOpenAI
 from langchain.chat_models.base import BaseChatModel
@@ -13,6 +24,289 @@ from .spinner import Spinner
 
 load_dotenv()
 
+T = TypeVar("T")
+
+# Requests and tokens per minute for each model, overridable with a JSON object
+# like LLM_RATE_LIMITS='{"gpt-4": [200, 40000]}'
+MODEL_RATE_LIMITS: dict[str, tuple[int, int]] = {
+    ChatModelName.GPT4.value: (200, 40000),
+    ChatModelName.TURBO.value: (3500, 90000),
+    ChatModelName.CLAUDE.value: (1000, 100000),
+    ChatModelName.CLAUDE_INSTANT.value: (1000, 100000),
+    "text-embedding-ada-002": (3000, 1000000),
+}
+MODEL_RATE_LIMITS.update(
+    {
+        model: tuple(limits)
+        for model, limits in json.loads(os.getenv("LLM_RATE_LIMITS", "{}")).items()
+    }
+)
+DEFAULT_RATE_LIMITS = (500, 60000)
+
+# Tokens reserved for a chat completion's response, on top of the prompt
+COMPLETION_TOKEN_ESTIMATE = 500
+
+# Attempts at a call that keeps being rate limited, or keeps failing on the
+# API's side, before giving up on it
+RATE_LIMIT_RETRIES = 5
+MIN_BACKOFF_SECONDS = 1
+MAX_BACKOFF_SECONDS = 60
+# After a rate limit, the model's budget is cut to this fraction of its limits,
+# and it grows back by RATE_RECOVERY after each successful call
+RATE_CUT = 0.5
+RATE_RECOVERY = 0.05
+MIN_RATE_SCALE = 0.1
+
+
+def estimate_tokens(text: str) -> int:
+    # roughly 4 characters per token for English text
+    return len(text) // 4 + 1
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    return (
+        isinstance(error, openai.error.RateLimitError)
+        or getattr(error, "http_status", None) == 429
+        or getattr(error, "status_code", None) == 429
+    )
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Server errors and timeouts, which are worth retrying as they are"""
+    status = getattr(error, "http_status", None) or getattr(error, "status_code", None)
+    return isinstance(
+        error,
+        (
+            openai.error.APIError,
+            openai.error.APIConnectionError,
+            openai.error.ServiceUnavailableError,
+            openai.error.Timeout,
+            openai.error.TryAgain,
+            asyncio.TimeoutError,
+        ),
+    ) or (isinstance(status, int) and status >= 500)
+
+
+class Priority(IntEnum):
+    """Which calls go first when a model's rate limit is the bottleneck"""
+
+    # reacting to the world and acting on plans
+    HIGH = 0
+    NORMAL = 1
+    # reflection and other work nobody is waiting on
+    LOW = 2
+
+
+current_priority: ContextVar[Priority] = ContextVar(
+    "current_priority", default=Priority.NORMAL
+)
+
+
+@contextmanager
+def llm_priority(priority: Priority):
+    """Schedules the LLM and embedding calls made inside at this priority"""
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float, scale: float):
+        self.level = min(
+            self.capacity * scale,
+            self.level + (now - self.updated) * self.per_minute * scale / 60,
+        )
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float, scale: float) -> float:
+        """Seconds until amount is available, amounts over capacity only need it full"""
+        self._refill(now, scale)
+        amount = min(amount, self.capacity * scale)
+        if self.level >= amount:
+            return 0
+        return (amount - self.level) * 60 / (self.per_minute * scale)
+
+    def take(self, amount: float):
+        self.level -= amount
+
+
+class ModelLimiterStats:
+    def __init__(self):
+        self.calls: dict[Priority, int] = {priority: 0 for priority in Priority}
+        self.rate_limited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.max_queue_depth = 0
+
+    def summary(self) -> dict:
+        calls = sum(self.calls.values())
+        return {
+            "calls": {priority.name: count for priority, count in self.calls.items()},
+            "rate_limited": self.rate_limited,
+            "mean_wait": self.total_wait / calls if calls else 0,
+            "max_wait": self.max_wait,
+            "max_queue_depth": self.max_queue_depth,
+        }
+
+
+class ModelLimiter:
+    """Admits one model's calls in priority order within its request and token buckets"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.rate_scale = 1.0
+        self.backoff = MIN_BACKOFF_SECONDS
+        self.backoff_until = 0.0
+        self.stats = ModelLimiterStats()
+        self._waiters: list[tuple[Priority, int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, tokens: int, priority: Priority):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), tokens, future))
+        self.stats.max_queue_depth = max(self.stats.max_queue_depth, self.queue_depth)
+
+        started = time.monotonic()
+        self._dispatch()
+        await future
+
+        waited = time.monotonic() - started
+        self.stats.calls[priority] += 1
+        self.stats.total_wait += waited
+        self.stats.max_wait = max(self.stats.max_wait, waited)
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                # the caller was cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+
+            now = time.monotonic()
+            delay = max(
+                self.backoff_until - now,
+                self.requests.wait_time(1, now, self.rate_scale),
+                self.tokens.wait_time(tokens, now, self.rate_scale),
+            )
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(
+                    delay, self._dispatch
+                )
+                return
+
+            heapq.heappop(self._waiters)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            future.set_result(None)
+
+    def rate_limited(self):
+        self.stats.rate_limited += 1
+        self.rate_scale = max(self.rate_scale * RATE_CUT, MIN_RATE_SCALE)
+        self.backoff_until = max(self.backoff_until, time.monotonic() + self.backoff)
+        self.backoff = min(self.backoff * 2, MAX_BACKOFF_SECONDS)
+
+    def succeeded(self):
+        self.rate_scale = min(self.rate_scale + RATE_RECOVERY, 1.0)
+        self.backoff = MIN_BACKOFF_SECONDS
+
+
+class LLMScheduler:
+    """Runs every chat and embedding API call within the model's rate limits.
+
+    Each model has token buckets for its requests and tokens per minute.
+    Calls wait in a queue until both have room, highest priority first, and
+    calls of the same priority in the order they came in. When the API
+    answers with a rate limit error anyway, the model stops admitting calls
+    for a backoff that doubles each time, its budget is cut, and the call is
+    retried. The budget grows back with each call that succeeds. Server errors
+    and timeouts only back off the call that failed before it is retried.
+    """
+
+    def __init__(self):
+        self.limiters: dict[str, ModelLimiter] = {}
+
+    def limiter(self, model: str) -> ModelLimiter:
+        if model not in self.limiters:
+            self.limiters[model] = ModelLimiter(
+                *MODEL_RATE_LIMITS.get(model, DEFAULT_RATE_LIMITS)
+            )
+        return self.limiters[model]
+
+    async def run(
+        self,
+        model: str,
+        tokens: int,
+        call: Callable[[], Awaitable[T]],
+        priority: Optional[Priority] = None,
+    ) -> T:
+        limiter = self.limiter(model)
+        if priority is None:
+            priority = current_priority.get()
+
+        for attempt in range(RATE_LIMIT_RETRIES):
+            await limiter.acquire(tokens, priority)
+            try:
+                result = await call()
+            except Exception as e:
+                if attempt == RATE_LIMIT_RETRIES - 1:
+                    raise
+                if is_rate_limit_error(e):
+                    limiter.rate_limited()
+                elif is_transient_error(e):
+                    await asyncio.sleep(
+                        min(MIN_BACKOFF_SECONDS * 2**attempt, MAX_BACKOFF_SECONDS)
+                    )
+                else:
+                    raise
+                continue
+
+            limiter.succeeded()
+            return result
+
+    def stats(self) -> dict[str, dict]:
+        return {
+            model: {**limiter.stats.summary(), "queue_depth": limiter.queue_depth}
+            for model, limiter in self.limiters.items()
+        }
+
+    def summary(self) -> str:
+        return "\n".join(
+            f"{model}: {stats['rate_limited']} rate limited, "
+            f"waited {stats['mean_wait']:.2f}s on average ({stats['max_wait']:.2f}s max), "
+            f"queue depth up to {stats['max_queue_depth']}"
+            for model, stats in self.stats().items()
+        )
+
+
+# Futures belong to a single event loop, so each loop gets its own scheduler
+_schedulers = weakref.WeakKeyDictionary()
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    loop = asyncio.get_running_loop()
+    if loop not in _schedulers:
+        _schedulers[loop] = LLMScheduler()
+    return _schedulers[loop]
+
 
 def get_chat_model(name: ChatModelName, **kwargs) -> BaseChatModel:
     if "model_name" in kwargs:
@@ -30,6 +324,13 @@ def get_chat_model(name: ChatModelName, **kwargs) -> BaseChatModel:
         raise ValueError(f"Invalid model name: {name}")
 
 
+def without_retries(model: BaseChatModel) -> BaseChatModel:
+    """A copy of the model for calls the scheduler retries itself"""
+    if "max_retries" not in model.__fields__:
+        return model
+    return model.copy(update={"max_retries": 1})
+
+
 class ChatModel:
     """Wrapper around the ChatModel class."""
     defaultModel: BaseChatModel
@@ -41,15 +342,34 @@ class ChatModel:
         backup_model_name: ChatModelName = DEFAULT_FAST_MODEL,
         **kwargs,
     ):
+        self.default_model_name = default_model_name
+        self.backup_model_name = backup_model_name
         self.defaultModel = get_chat_model(default_model_name, **kwargs)
         self.backupModel = get_chat_model(backup_model_name, **kwargs)
+        # chains and parsers call the models directly and keep langchain's retries,
+        # get_chat_completion goes through the scheduler, which does the retrying
+        self._scheduled_default = without_retries(self.defaultModel)
+        self._scheduled_backup = without_retries(self.backupModel)
 
     @chat_json_cache(sleep_range=(0, 0))
     async def get_chat_completion(self, messages: list[BaseMessage], **kwargs) -> str:
+        scheduler = get_llm_scheduler()
+        tokens = COMPLETION_TOKEN_ESTIMATE + sum(
+            estimate_tokens(message.content) for message in messages
+        )
+
         try:
-            resp = await self.defaultModel.agenerate([messages])
+            resp = await scheduler.run(
+                self.default_model_name.value,
+                tokens,
+                lambda: self._scheduled_default.agenerate([messages]),
+            )
         except Exception:
-            resp = await self.backupModel.agenerate([messages])
+            resp = await scheduler.run(
+                self.backup_model_name.value,
+                tokens,
+                lambda: self._scheduled_backup.agenerate([messages]),
+            )
 
         return resp.generations[0][0].text
 
@@ -15,6 +15,12 @@ RECENCY_WEIGHT = 1
 SIMILARITY_WEIGHT = 1
 IMPORTANCE_WEIGHT = 1
 REFLECTION_MEMORY_COUNT = 50
+# Above this many memories, retrieval scans an IVF index instead of every memory
+MEMORY_ANN_THRESHOLD = 50000
+# Buckets scanned per query, more is slower but closer to the exact results
+MEMORY_ANN_PROBES = 8
+# Memories ranked by importance and recency alone that are always rescored
+MEMORY_ANN_CANDIDATES_PER_RESULT = 10
 PLAN_LENGTH = "24 hours"
 DEFAULT_LOCATION_ID = config.default_location_id
 DEFAULT_WORLD_ID = config.world_id
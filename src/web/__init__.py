@@ -1,13 +1,11 @@
-import asyncio
-import json
 import os
-import re
+from datetime import datetime
 
 from dotenv import load_dotenv
 from quart import Quart, abort, make_response, send_file, websocket
 
-from src.utils.database.base import Tables
-from src.utils.database.client import get_database
+from .follower import LogFollower
+from .hub import WorldHub
 
 load_dotenv()
 
@@ -18,6 +16,9 @@ def get_server():
     app.config["ENV"] = "development"
     app.config["DEBUG"] = True
 
+    world_hub = WorldHub()
+    log_follower = LogFollower()
+
     @app.route("/")
     async def index():
         file_path = os.path.join(os.path.dirname(__file__), "templates/logs.html")
@@ -25,68 +26,31 @@ def get_server():
 
     @app.websocket("/logs")
     async def logs_websocket():
-        file_path = os.path.join(os.path.dirname(__file__), "logs/agent.txt")
-        position = 0
-        while True:
-            await asyncio.sleep(0.25)
-            with open(file_path, "r") as log_file:
-                log_file.seek(position)
-                line = log_file.readline()
-                if line:
-                    position = log_file.tell()
-                    matches = re.match(r"\[(.*?)\] \[(.*?)\] \[(.*?)\] (.*)$", line)
-                    if matches:
-                        agentName = matches.group(1).strip()
-                        color = matches.group(2).strip().split(".")[1]
-                        title = matches.group(3).strip()
-                        description = matches.group(4).strip()
+        # a browser that reconnects passes the offset of the last batch it got,
+        # and one that wants the records from a point in time passes since
+        offset = websocket.args.get("offset", type=int)
+        since = websocket.args.get("since", type=datetime.fromisoformat)
+        if offset is None and since is not None:
+            offset = await log_follower.offset_at(since)
+
+        client = await log_follower.subscribe(offset)
 
-                        data = {
-                            "agentName": agentName,
-                            "color": color,
-                            "title": title,
-                            "description": description,
-                        }
-                        await websocket.send_json(data)
+        try:
+            while True:
+                await websocket.send_json(await client.get())
+        finally:
+            log_follower.unsubscribe(client)
 
     @app.websocket("/world")
     async def world_websocket():
-        while True:
-            await asyncio.sleep(0.25)
-            database = await get_database()
-            worlds = await database.get_all(Tables.Worlds)
-
-            if not worlds:
-                abort(404, "No worlds found")
-
-            id = worlds[0]["id"]
-
-            # get all locations
-            locations = await database.get_by_field(
-                Tables.Locations, "world_id", str(id)
-            )
-
-            # get all agents
-            agents = await database.get_by_field(Tables.Agents, "world_id", str(id))
-
-            location_mapping = {
-                location["id"]: location["name"] for location in locations
-            }
-
-            agents_state = [
-                {
-                    "full_name": agent["full_name"],
-                    "location": location_mapping.get(
-                        agent["location_id"], "Unknown Location"
-                    ),
-                }
-                for agent in agents
-            ]
-
-            sorted_agents = sorted(agents_state, key=lambda k: k["full_name"])
-
-            await websocket.send_json(
-                {"agents": sorted_agents, "name": worlds[0]["name"]}
-            )
+        client = await world_hub.subscribe()
+        if client is None:
+            abort(404, "No worlds found")
+
+        try:
+            while True:
+                await websocket.send_json(await client.queue.get())
+        finally:
+            world_hub.unsubscribe(client)
 
     return app
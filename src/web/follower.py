@@ -0,0 +1,135 @@
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+from src.utils.bus import Subscription, Topic, get_event_bus
+from src.utils.logging import (
+    AGENT_LOG_DIR,
+    agent_log_end,
+    find_agent_log_offset,
+    list_segments,
+    read_agent_records,
+)
+
+from .hub import FALLBACK_POLL_SECONDS, wait_for_messages
+
+# Records kept in memory for browsers that reconnect or fall behind
+LOG_HISTORY_SIZE = 5000
+
+# Batches a browser can fall behind by before it's caught up from the history
+CLIENT_QUEUE_SIZE = 64
+
+
+class LogClient:
+    def __init__(self, follower: "LogFollower", offset: int):
+        self.follower = follower
+        # where the first record this client hasn't received starts
+        self.offset = offset
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(CLIENT_QUEUE_SIZE)
+
+    def send(self, batch: dict):
+        if self.queue.full():
+            # too far behind, replace the backlog with one catch-up batch
+            reset = batch.get("reset", False)
+            while not self.queue.empty():
+                reset = self.queue.get_nowait().get("reset", False) or reset
+            if reset:
+                batch = {"reset": True, **self.follower.batch_since(0)}
+            else:
+                batch = self.follower.batch_since(self.offset)
+        self.queue.put_nowait(batch)
+
+    async def get(self) -> dict:
+        batch = await self.queue.get()
+        self.offset = batch["offset"]
+        return batch
+
+
+class LogFollower:
+    """Follows the agent log for every /logs websocket of a server.
+
+    New records are read when the world announces one on the bus, or every
+    FALLBACK_POLL_SECONDS, and go out to every browser as one batch. Every
+    record carries the offset it starts at, and a batch carries the offset
+    after its last record, so a browser that reconnects can ask to continue
+    from there. Recent records are kept in memory, older ones are read from
+    the log's segments.
+    """
+
+    def __init__(self, directory: str = AGENT_LOG_DIR):
+        self.directory = directory
+        self.position = 0
+        self.history: deque[dict] = deque(maxlen=LOG_HISTORY_SIZE)
+        self.clients: set[LogClient] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def read_new_records(self) -> list[dict]:
+        if agent_log_end(self.directory) < self.position:
+            # the log was deleted since it was last read
+            self.position = 0
+            self.history.clear()
+            for client in self.clients:
+                client.send({"reset": True, "records": [], "offset": 0})
+
+        records, self.position = read_agent_records(
+            self.position, directory=self.directory
+        )
+        return records
+
+    def batch_since(self, offset: int) -> dict:
+        if len(self.history) > 0 and offset < self.history[0]["offset"]:
+            records, _ = read_agent_records(
+                offset, self.history[0]["offset"], directory=self.directory
+            )
+            records.extend(self.history)
+        else:
+            records = [record for record in self.history if record["offset"] >= offset]
+
+        return {"records": records, "offset": self.position}
+
+    async def offset_at(self, since: datetime) -> int:
+        return await asyncio.to_thread(find_agent_log_offset, since, self.directory)
+
+    async def subscribe(self, offset: Optional[int] = None) -> LogClient:
+        """A client that has been sent every record from offset.
+
+        By default that's the records from the start of the latest segment.
+        """
+        if self._task is None:
+            # subscribed before the backlog is read, so no record is announced unseen
+            subscription = get_event_bus().subscribe(Topic.LOG)
+            segments = list_segments(self.directory)
+            self.position = segments[-1] if segments else 0
+            self.history.extend(self.read_new_records())
+            self._task = asyncio.get_running_loop().create_task(self.run(subscription))
+
+        if offset is None:
+            offset = self.history[0]["offset"] if self.history else self.position
+
+        client = LogClient(self, offset)
+        if client.offset > self.position:
+            # an offset from before the log was deleted
+            client.offset = 0
+            client.send({"reset": True, "records": [], "offset": 0})
+        client.send(self.batch_since(client.offset))
+        self.clients.add(client)
+
+        return client
+
+    def unsubscribe(self, client: LogClient):
+        self.clients.discard(client)
+
+    async def run(self, subscription: Subscription):
+        with subscription:
+            while True:
+                await wait_for_messages(subscription, FALLBACK_POLL_SECONDS)
+
+                records = self.read_new_records()
+                if not records:
+                    continue
+
+                self.history.extend(records)
+                batch = {"records": records, "offset": self.position}
+                for client in list(self.clients):
+                    client.send(batch)
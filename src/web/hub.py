@@ -0,0 +1,153 @@
+import asyncio
+import os
+from typing import Optional
+
+from src.utils.bus import Subscription, Topic, get_event_bus
+from src.utils.database.base import Tables
+from src.utils.database.client import get_database
+
+# If the bus is down or a message was missed, check for changes this often anyway
+FALLBACK_POLL_SECONDS = 5
+
+# Changes closer together than this are sent to the browsers as one update
+WORLD_MAX_UPDATES_PER_SECOND = float(os.getenv("WORLD_MAX_UPDATES_PER_SECOND", "4"))
+
+# Updates a browser can fall behind by before it's sent a snapshot instead
+CLIENT_QUEUE_SIZE = 16
+
+
+async def wait_for_messages(subscription: Subscription, timeout: float) -> None:
+    """Waits for a message, then takes every message already queued with it"""
+    try:
+        await asyncio.wait_for(subscription.get(), timeout)
+    except asyncio.TimeoutError:
+        return
+    while not subscription.queue.empty():
+        subscription.get_nowait()
+
+
+async def load_world_state() -> Optional[dict]:
+    database = await get_database()
+    worlds = await database.get_all(Tables.Worlds)
+
+    if not worlds:
+        return None
+
+    id = worlds[0]["id"]
+
+    # get all locations
+    locations = await database.get_by_field(Tables.Locations, "world_id", str(id))
+
+    # get all agents
+    agents = await database.get_by_field(Tables.Agents, "world_id", str(id))
+
+    location_mapping = {location["id"]: location["name"] for location in locations}
+
+    agents_state = [
+        {
+            "full_name": agent["full_name"],
+            "location": location_mapping.get(agent["location_id"], "Unknown Location"),
+        }
+        for agent in agents
+    ]
+
+    sorted_agents = sorted(agents_state, key=lambda k: k["full_name"])
+
+    return {"agents": sorted_agents, "name": worlds[0]["name"]}
+
+
+def diff_world_states(old: dict, new: dict) -> Optional[dict]:
+    """The changes from old to new, or None if there are none"""
+    old_agents = {agent["full_name"]: agent for agent in old["agents"]}
+    new_agents = {agent["full_name"]: agent for agent in new["agents"]}
+
+    diff = {
+        "type": "diff",
+        "updated": [
+            agent for name, agent in new_agents.items() if old_agents.get(name) != agent
+        ],
+        "removed": [name for name in old_agents if name not in new_agents],
+    }
+    if old["name"] != new["name"]:
+        diff["name"] = new["name"]
+
+    if not diff["updated"] and not diff["removed"] and "name" not in diff:
+        return None
+
+    return diff
+
+
+class WorldClient:
+    def __init__(self, hub: "WorldHub"):
+        self.hub = hub
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(CLIENT_QUEUE_SIZE)
+
+    def send(self, message: dict):
+        if self.queue.full():
+            # too far behind for diffs, catch it up in one message
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            message = self.hub.snapshot()
+        self.queue.put_nowait(message)
+
+
+class WorldHub:
+    """Loads the world state once per change and sends the diff to every browser.
+
+    Changes are announced on the bus. Ones that arrive while an update is
+    being sent, or sooner than 1 / max_rate seconds after it, are folded into
+    the next update. The database is only queried while a browser is connected.
+    """
+
+    def __init__(self, max_rate: float = WORLD_MAX_UPDATES_PER_SECOND):
+        self.min_interval = 1 / max_rate
+        self.state: Optional[dict] = None
+        self.clients: set[WorldClient] = set()
+        self._has_clients = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def snapshot(self) -> dict:
+        return {"type": "snapshot", **self.state}
+
+    async def subscribe(self) -> Optional[WorldClient]:
+        """A client that has been sent the current state, None if there's no world"""
+        if not self.clients:
+            # nothing kept the state up to date while no one was watching
+            self.state = await load_world_state()
+            if self.state is None:
+                return None
+
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+        client = WorldClient(self)
+        client.send(self.snapshot())
+        self.clients.add(client)
+        self._has_clients.set()
+
+        return client
+
+    def unsubscribe(self, client: WorldClient):
+        self.clients.discard(client)
+        if not self.clients:
+            self._has_clients.clear()
+
+    async def run(self):
+        with get_event_bus().subscribe(Topic.AGENT, Topic.EVENT) as subscription:
+            while True:
+                await self._has_clients.wait()
+                await self.update()
+                await asyncio.sleep(self.min_interval)
+                await wait_for_messages(subscription, FALLBACK_POLL_SECONDS)
+
+    async def update(self):
+        state = await load_world_state()
+        if state is None:
+            return
+
+        diff = diff_world_states(self.state, state) if self.state else None
+        self.state = state
+
+        if diff is not None:
+            for client in list(self.clients):
+                client.send(diff)
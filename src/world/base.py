@@ -15,6 +15,7 @@ from src.utils.database.client import get_database
 from ..agent.base import Agent
 from ..location.base import Location
 from .context import WorldContext, WorldData
+from .scheduler import AGENT_CONCURRENCY, AgentScheduler, get_agent_scheduler
 
 
 class World(BaseModel):
@@ -23,7 +24,8 @@ class World(BaseModel):
     locations: list[Location]
     agents: list[Agent]
     context: WorldContext
-    agent_queue: asyncio.Queue[Agent]
+    # Picks the agent that takes the next step
+    scheduler: AgentScheduler
 
     class Config:
         arbitrary_types_allowed = True
@@ -35,15 +37,17 @@ class World(BaseModel):
         locations=list[Location],
         agents=list[Agent],
         id: Optional[UUID] = None,
+        scheduler: Optional[AgentScheduler] = None,
     ):
         if id is None:
             id = uuid4()
 
-        queue = asyncio.Queue()
+        if scheduler is None:
+            scheduler = get_agent_scheduler(context.events_manager)
 
-        # Add all agents to the queue
+        # Add all agents to the scheduler
         for agent in agents:
-            queue.put_nowait(agent)
+            scheduler.add(agent)
 
         super().__init__(
             id=id,
@@ -51,7 +55,7 @@ class World(BaseModel):
             locations=locations,
             agents=agents,
             context=context,
-            agent_queue=queue,
+            scheduler=scheduler,
         )
 
     @classmethod
@@ -92,9 +96,11 @@ class World(BaseModel):
         await asyncio.gather(*tasks)
 
     async def run_next_agent(self):
-        agent = await self.agent_queue.get()
-        await agent.run_for_one_step()
-        self.agent_queue.put_nowait(agent)
+        agent = await self.scheduler.next()
+        try:
+            await agent.run_for_one_step()
+        finally:
+            self.scheduler.done(agent)
 
     async def run_agent_loop(self):
         while True:
@@ -108,6 +114,8 @@ class World(BaseModel):
         for agent in os.listdir(agents_folder):
             os.remove(os.path.join(agents_folder, agent))
 
-        concurrency = min(os.cpu_count(), len(self.agents))
+        # a few agents run at once, picked by the scheduler, and the LLM
+        # scheduler keeps their API calls within the rate limits
+        concurrency = min(AGENT_CONCURRENCY, len(self.agents))
         tasks = [self.run_agent_loop() for _ in range(concurrency)]
-        await asyncio.gather(*tasks)
+        await asyncio.gather(self.context.events_manager.listen(), *tasks)
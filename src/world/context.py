@@ -6,6 +6,7 @@ from src.utils.database.base import Tables
 from src.utils.database.client import get_database
 
 from ..event.base import Event, EventsManager
+from ..utils.bus import Topic, get_event_bus
 from ..utils.colors import NUM_AGENT_COLORS, LogColor
 
 
@@ -70,11 +71,20 @@ class WorldContext(BaseModel):
         database = await get_database()
         await database.insert(Tables.Events, event.db_dict())
 
-        # add event to local events list
-        self.events_manager.recent_events.append(event)
+        # inside a transaction, nobody hears of the event until it's committed
+        database.after_commit(lambda: self._announce_event(event))
 
         return event
 
+    def _announce_event(self, event: Event) -> None:
+        # add event to local events list
+        self.events_manager.add_event(event)
+
+        # let the other processes know without them polling the db
+        get_event_bus().publish(
+            Topic.EVENT, {**event.db_dict(), "world_id": self.world.id}
+        )
+
     def get_agent_dict_from_id(self, agent_id: UUID | str) -> dict:
         # get agent
         try:
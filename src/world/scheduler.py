@@ -0,0 +1,184 @@
+import abc
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, Optional
+
+from ..event.base import EventsManager, EventType
+
+if TYPE_CHECKING:
+    from ..agent.base import Agent
+
+# Which AgentScheduler World uses, "priority" or "round_robin"
+AGENT_SCHEDULER = os.getenv("AGENT_SCHEDULER", "priority")
+
+# How many agents take a step at once. With fewer than there are agents, the
+# scheduler decides which ones go next
+AGENT_CONCURRENCY = int(os.getenv("AGENT_CONCURRENCY", "3"))
+
+# An agent that's waiting on something with nothing new to observe sits out
+# this long, doubling every step it spends waiting, up to the max
+WAIT_BACKOFF_SECONDS = 5
+MAX_WAIT_BACKOFF_SECONDS = 120
+
+
+class AgentScheduler(abc.ABC):
+    """Decides which agent takes the next step.
+
+    World's agent loops each call next for an agent to run, and done once
+    its step is over. An agent is only handed to one loop at a time.
+    """
+
+    @abc.abstractmethod
+    def add(self, agent: "Agent") -> None:
+        """add an agent to be scheduled"""
+        pass
+
+    @abc.abstractmethod
+    async def next(self) -> "Agent":
+        """wait for the next agent to run"""
+        pass
+
+    @abc.abstractmethod
+    def done(self, agent: "Agent") -> None:
+        """return an agent whose step is over"""
+        pass
+
+
+class RoundRobinScheduler(AgentScheduler):
+    """Every agent in turn, whatever is happening"""
+
+    def __init__(self):
+        self.queue: asyncio.Queue["Agent"] = asyncio.Queue()
+
+    def add(self, agent: "Agent") -> None:
+        self.queue.put_nowait(agent)
+
+    async def next(self) -> "Agent":
+        return await self.queue.get()
+
+    def done(self, agent: "Agent") -> None:
+        self.queue.put_nowait(agent)
+
+
+class AgentState:
+    def __init__(self, agent: "Agent"):
+        self.agent = agent
+        self.running = False
+        self.last_run = 0.0
+        self.backoff = 0.0
+        self.ready_at = 0.0
+
+
+class PriorityScheduler(AgentScheduler):
+    """Runs agents with something to respond to first.
+
+    Agents are picked in this order:
+    1. Agents with unread messages, the one waiting longest first.
+    2. Agents with other unread events.
+    3. Everyone else, the one that ran longest ago first. An agent whose
+       plan is waiting for something is skipped for a backoff that grows
+       every step it keeps waiting, until it witnesses a new event.
+
+    An agent parked by the wait tool isn't run at all until an event it's
+    waiting for wakes it, see EventsManager.subscribe_wait.
+    """
+
+    def __init__(
+        self,
+        events_manager: EventsManager,
+        wait_backoff: float = WAIT_BACKOFF_SECONDS,
+        max_wait_backoff: float = MAX_WAIT_BACKOFF_SECONDS,
+    ):
+        self.events_manager = events_manager
+        self.wait_backoff = wait_backoff
+        self.max_wait_backoff = max_wait_backoff
+        self.states: dict[str, AgentState] = {}
+
+    def add(self, agent: "Agent") -> None:
+        self.states[str(agent.id)] = AgentState(agent)
+
+    def _unread(self, agent: "Agent") -> tuple[Optional[datetime], int]:
+        """The oldest unread message's timestamp and the number of unread events"""
+        events = [
+            event
+            for event in self.events_manager.event_store.query(
+                after=agent.last_checked_events, witness_ids=[agent.id]
+            )
+            if str(event.agent_id) != str(agent.id)
+        ]
+        oldest_message = next(
+            (event.timestamp for event in events if event.type == EventType.MESSAGE),
+            None,
+        )
+        return oldest_message, len(events)
+
+    def _pick(self, now: float) -> tuple[Optional[AgentState], Optional[float]]:
+        """The agent to run next, or the seconds until one is ready"""
+        best, best_key = None, None
+        ready_in = None
+
+        for state in self.states.values():
+            if state.running:
+                continue
+
+            wait = self.events_manager.get_wait(state.agent.id)
+            if (
+                wait is not None
+                and wait.parked
+                and getattr(state.agent, "is_waiting", False)
+            ):
+                if ready_in is None or wait.expires_at - now < ready_in:
+                    ready_in = wait.expires_at - now
+                continue
+
+            oldest_message, unread = self._unread(state.agent)
+            if oldest_message is not None:
+                key = (0, oldest_message.timestamp())
+            elif unread > 0:
+                key = (1, state.last_run)
+            elif now >= state.ready_at:
+                key = (2, state.last_run)
+            else:
+                if ready_in is None or state.ready_at - now < ready_in:
+                    ready_in = state.ready_at - now
+                continue
+
+            if best_key is None or key < best_key:
+                best, best_key = state, key
+
+        return best, ready_in
+
+    async def next(self) -> "Agent":
+        while True:
+            # catch up on events when the bus isn't pushing them
+            await self.events_manager.refresh_if_stale()
+
+            state, ready_in = self._pick(time.monotonic())
+            if state is not None:
+                state.running = True
+                return state.agent
+
+            # every agent is running, backing off or parked, wait for a new
+            # event or for one to be woken
+            await self.events_manager.wait_for_new_events(ready_in)
+
+    def done(self, agent: "Agent") -> None:
+        state = self.states[str(agent.id)]
+        state.running = False
+        state.last_run = time.monotonic()
+
+        if getattr(agent, "is_waiting", False):
+            state.backoff = min(
+                max(state.backoff * 2, self.wait_backoff), self.max_wait_backoff
+            )
+        else:
+            state.backoff = 0.0
+        state.ready_at = state.last_run + state.backoff
+
+
+def get_agent_scheduler(events_manager: EventsManager) -> AgentScheduler:
+    if AGENT_SCHEDULER == "round_robin":
+        return RoundRobinScheduler()
+    return PriorityScheduler(events_manager)
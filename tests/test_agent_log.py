@@ -0,0 +1,114 @@
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+import pytz
+
+from src.utils.logging import (
+    AGENT_LOG_INDEX_FILE,
+    AgentLogHandler,
+    agent_log_end,
+    find_agent_log_offset,
+    list_segments,
+    read_agent_records,
+)
+
+START = datetime(2023, 5, 1, 12, tzinfo=pytz.utc)
+
+
+def log(handler: AgentLogHandler, minute: int, description: str = ""):
+    handler.emit(
+        logging.makeLogRecord(
+            {
+                "msg": description or f"record {minute}",
+                "created": (START + timedelta(minutes=minute)).timestamp(),
+                "agent_id": "agent",
+                "agent_name": "Ada",
+                "color": "AGENT_0",
+                "title": "Observed",
+            }
+        )
+    )
+
+
+def test_records_are_read_back_with_their_offsets(tmp_path):
+    handler = AgentLogHandler(directory=str(tmp_path))
+    for minute in range(3):
+        log(handler, minute)
+    handler.close()
+
+    records, end = read_agent_records(0, directory=str(tmp_path))
+    assert [record["description"] for record in records] == [
+        "record 0",
+        "record 1",
+        "record 2",
+    ]
+    assert records[0]["agentName"] == "Ada"
+    assert end == agent_log_end(str(tmp_path))
+
+    # reading from a record's offset starts at that record
+    later, _ = read_agent_records(records[1]["offset"], directory=str(tmp_path))
+    assert later == records[1:]
+
+
+def test_a_line_still_being_written_is_left_for_later(tmp_path):
+    handler = AgentLogHandler(directory=str(tmp_path))
+    log(handler, 0)
+    handler.segment.write(b'{"timestamp": ')
+    handler.segment.flush()
+
+    records, end = read_agent_records(0, directory=str(tmp_path))
+    handler.close()
+    assert len(records) == 1
+    assert end == agent_log_end(str(tmp_path)) - len(b'{"timestamp": ')
+
+
+def test_old_segments_are_deleted_and_offsets_stay_valid(tmp_path):
+    directory = str(tmp_path)
+    handler = AgentLogHandler(directory=directory, segment_bytes=400, max_segments=2)
+    for minute in range(20):
+        log(handler, minute)
+    handler.close()
+
+    segments = list_segments(directory)
+    assert len(segments) == 2
+    # segments are named after the offset of their first byte
+    assert segments[1] == segments[0] + os.path.getsize(
+        os.path.join(directory, f"{segments[0]:020d}.jsonl")
+    )
+
+    # reading from before the oldest segment starts at its beginning
+    records, end = read_agent_records(0, directory=directory)
+    assert records[0]["offset"] == segments[0]
+    assert records[-1]["description"] == "record 19"
+    assert end == agent_log_end(directory)
+
+    # the index only points into segments that are still there
+    with open(os.path.join(directory, AGENT_LOG_INDEX_FILE)) as index_file:
+        index = [json.loads(line) for line in index_file]
+    assert index[0]["offset"] >= segments[0]
+
+
+def test_seeking_by_time_finds_the_first_record_at_or_after_it(tmp_path):
+    directory = str(tmp_path)
+    handler = AgentLogHandler(directory=directory, segment_bytes=400)
+    for minute in range(0, 40, 2):
+        log(handler, minute)
+    handler.close()
+
+    records, end = read_agent_records(0, directory=directory)
+    offsets = {record["description"]: record["offset"] for record in records}
+
+    assert find_agent_log_offset(START, directory) == 0
+    assert find_agent_log_offset(START + timedelta(minutes=21), directory) == (
+        offsets["record 22"]
+    )
+    assert find_agent_log_offset(START + timedelta(minutes=22), directory) == (
+        offsets["record 22"]
+    )
+    # naive timestamps are taken as UTC
+    assert find_agent_log_offset(datetime(2023, 5, 1, 12, 10), directory) == (
+        offsets["record 10"]
+    )
+    assert find_agent_log_offset(START + timedelta(hours=1), directory) == end
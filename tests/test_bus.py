@@ -0,0 +1,53 @@
+import asyncio
+
+from src.utils.bus import Topic, encode_frame, get_event_bus
+
+
+def test_subscribers_only_get_their_topics():
+    async def run():
+        bus = get_event_bus()
+        with bus.subscribe(Topic.EVENT) as events, bus.subscribe(
+            Topic.EVENT, Topic.AGENT
+        ) as everything:
+            bus.publish(Topic.AGENT, {"id": "agent"})
+            bus.publish(Topic.EVENT, {"id": "event"})
+
+            assert await events.get() == (Topic.EVENT, {"id": "event"})
+            assert events.queue.empty()
+            assert [everything.get_nowait() for _ in range(2)] == [
+                (Topic.AGENT, {"id": "agent"}),
+                (Topic.EVENT, {"id": "event"}),
+            ]
+
+        # closed subscriptions get nothing
+        bus.publish(Topic.EVENT, {"id": "later"})
+        assert events.queue.empty()
+        assert bus.subscriptions == set()
+
+    asyncio.run(run())
+
+
+def test_full_subscriptions_drop_the_oldest_messages():
+    async def run():
+        bus = get_event_bus()
+        with bus.subscribe(Topic.LOG, maxsize=2) as logs:
+            for i in range(5):
+                bus.publish(Topic.LOG, i)
+            return logs.dropped, [logs.get_nowait() for _ in range(2)]
+
+    dropped, kept = asyncio.run(run())
+    assert dropped == 3
+    assert kept == [(Topic.LOG, 3), (Topic.LOG, 4)]
+
+
+def test_each_event_loop_gets_its_own_bus():
+    async def bus():
+        return get_event_bus()
+
+    assert asyncio.run(bus()) is not asyncio.run(bus())
+
+
+def test_frames_are_one_json_line():
+    frame = encode_frame(Topic.EVENT, {"id": 1})
+    assert frame.endswith(b"\n")
+    assert frame.count(b"\n") == 1
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from src.utils import cache as cache_module
+from src.utils.cache import DerivedCache, LLMCache, chat_json_cache
+
+
+def test_entries_survive_reopening_the_store(tmp_path):
+    path = str(tmp_path / "cache.db")
+    LLMCache(path).set("key", {"text": "answer"})
+
+    assert LLMCache(path).get("key") == {"text": "answer"}
+    assert LLMCache(path).get("missing") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "EVICTION_INTERVAL", 1)
+    store = LLMCache(str(tmp_path / "cache.db"), max_entries=2)
+
+    store.set("old", 1)
+    time.sleep(0.01)
+    store.set("used", 2)
+    time.sleep(0.01)
+    store.get("old")
+    time.sleep(0.01)
+    store.set("new", 3)
+
+    assert [store.get(key) for key in ["old", "used", "new"]] == [1, None, 3]
+
+
+def test_the_old_json_cache_is_imported_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("cache.json", "w") as f:
+        json.dump({"key": "answer"}, f)
+
+    assert LLMCache("cache.db").get("key") == "answer"
+
+    # entries set after the import aren't overwritten by it again
+    LLMCache("cache.db").set("key", "newer answer")
+    assert LLMCache("cache.db").get("key") == "newer answer"
+
+
+@pytest.fixture
+def llm_cache(tmp_path, monkeypatch):
+    llm_cache = LLMCache(str(tmp_path / "cache.db"))
+    monkeypatch.setattr(cache_module, "cache", llm_cache)
+    return llm_cache
+
+
+def counting_completion(calls: list, fail: bool = False):
+    @chat_json_cache()
+    async def complete(prompt):
+        calls.append(prompt)
+        await asyncio.sleep(0.02)
+        if fail:
+            raise RuntimeError("API error")
+        return f"answer to {prompt}"
+
+    return complete
+
+
+def test_identical_requests_share_one_call(llm_cache):
+    calls = []
+    complete = counting_completion(calls)
+
+    async def run():
+        return await asyncio.gather(complete("hi"), complete("hi"), complete("hi"))
+
+    assert asyncio.run(run()) == ["answer to hi"] * 3
+    assert calls == ["hi"]
+    # and the next one is served from the cache
+    assert asyncio.run(complete("hi")) == "answer to hi"
+    assert calls == ["hi"]
+    assert cache_module.in_flight == {}
+
+
+def test_waiters_get_the_failure_instead_of_hanging(llm_cache):
+    calls = []
+    complete = counting_completion(calls, fail=True)
+
+    async def run():
+        return await asyncio.wait_for(
+            asyncio.gather(complete("hi"), complete("hi"), return_exceptions=True),
+            timeout=1,
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert calls == ["hi"]
+    assert cache_module.in_flight == {}
+
+
+class FailingCache(LLMCache):
+    def set(self, key, value):
+        raise OSError("disk full")
+
+
+def test_waiters_get_the_result_when_caching_it_fails(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "cache", FailingCache(str(tmp_path / "cache.db")))
+    complete = counting_completion([])
+
+    async def run():
+        return await asyncio.wait_for(
+            asyncio.gather(complete("hi"), complete("hi"), return_exceptions=True),
+            timeout=1,
+        )
+
+    leader, waiter = asyncio.run(run())
+    assert isinstance(leader, OSError)
+    assert waiter == "answer to hi"
+    assert cache_module.in_flight == {}
+
+
+def test_waiters_retry_when_the_leader_is_cancelled(llm_cache):
+    calls = []
+    complete = counting_completion(calls)
+
+    async def run():
+        leader = asyncio.ensure_future(complete("hi"))
+        await asyncio.sleep(0.005)
+        waiter = asyncio.ensure_future(complete("hi"))
+        await asyncio.sleep(0.005)
+        leader.cancel()
+        return await asyncio.wait_for(waiter, timeout=1)
+
+    assert asyncio.run(run()) == "answer to hi"
+    # the waiter made the request again instead of being cancelled
+    assert calls == ["hi", "hi"]
+    assert cache_module.in_flight == {}
+
+
+def test_derived_values_are_kept_until_the_version_changes():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    async def run():
+        derived = DerivedCache()
+        first = await asyncio.gather(
+            derived.get("summary", "agent", 1, compute),
+            derived.get("summary", "agent", 1, compute),
+        )
+        again = await derived.get("summary", "agent", 1, compute)
+        changed = await derived.get("summary", "agent", 2, compute)
+        other_key = await derived.get("summary", "other agent", 2, compute)
+        return first, again, changed, other_key
+
+    assert asyncio.run(run()) == ([1, 1], 1, 2, 3)
+
+
+def test_failed_derived_values_are_computed_again():
+    attempts = []
+
+    async def compute():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("failed")
+        return "value"
+
+    async def run():
+        derived = DerivedCache()
+        with pytest.raises(RuntimeError):
+            await derived.get("summary", "agent", 1, compute)
+        return await derived.get("summary", "agent", 1, compute)
+
+    assert asyncio.run(run()) == "value"
+    assert len(attempts) == 2
@@ -0,0 +1,63 @@
+import time
+
+from src.utils.colors import LogColor
+from src.utils.console import ConsoleMode, ConsoleRenderer
+
+
+def test_lines_are_printed_in_order_off_the_calling_thread(capsys):
+    renderer = ConsoleRenderer(ConsoleMode.FAST)
+    for i in range(3):
+        renderer.print(f"Agent {i}", LogColor.GENERAL, f"line {i}", 0, 0)
+    renderer.flush()
+
+    assert capsys.readouterr().out.splitlines() == [
+        f"{LogColor.GENERAL.value}Agent {i} \x1b[0mline {i}" for i in range(3)
+    ]
+
+
+def test_printing_doesnt_wait_for_the_typing_effect(capsys):
+    renderer = ConsoleRenderer(ConsoleMode.TYPING)
+
+    started = time.monotonic()
+    renderer.print("Agent", LogColor.GENERAL, "one two three four", 0.05, 0.05)
+    queued = time.monotonic() - started
+    renderer.flush()
+    typed = time.monotonic() - started
+
+    assert queued < 0.05
+    assert typed >= 0.15
+    assert capsys.readouterr().out.endswith("one two three four\n")
+
+
+def test_waiting_lines_are_printed_whole(capsys):
+    renderer = ConsoleRenderer(ConsoleMode.TYPING)
+    words = " ".join(["word"] * 20)
+
+    started = time.monotonic()
+    for _ in range(3):
+        renderer.print("Agent", LogColor.GENERAL, words, 0.05, 0.05)
+    renderer.flush()
+
+    # typing all three would take 3 seconds, only the last one is typed
+    assert time.monotonic() - started < 2
+    assert capsys.readouterr().out.count(words) == 3
+
+
+def test_flush_gives_up_after_its_timeout(capsys):
+    renderer = ConsoleRenderer(ConsoleMode.TYPING)
+    renderer.print("Agent", LogColor.GENERAL, " ".join(["word"] * 20), 0.05, 0.05)
+
+    started = time.monotonic()
+    renderer.flush(timeout=0.1)
+    assert time.monotonic() - started < 0.5
+    renderer.flush()
+
+
+def test_headless_mode_prints_nothing(capsys):
+    renderer = ConsoleRenderer(ConsoleMode.HEADLESS)
+    renderer.print("Agent", LogColor.GENERAL, "hello", 0, 0)
+    renderer.start_status("Thinking...")
+    renderer.flush()
+
+    assert capsys.readouterr().out == ""
+    assert renderer.pending == 0
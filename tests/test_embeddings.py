@@ -0,0 +1,82 @@
+import asyncio
+
+import numpy as np
+
+from src.utils.embeddings import EmbeddingBatcher
+
+
+class FakeBatcher(EmbeddingBatcher):
+    def __init__(self, fail: bool = False, **kwargs):
+        super().__init__(window=0.01, **kwargs)
+        self.batches: list[list[str]] = []
+        self.fail = fail
+
+    async def _request(self, texts: list[str]) -> list[np.ndarray]:
+        self.batches.append(texts)
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise RuntimeError("API down")
+        return [np.array([len(text)], dtype=np.float32) for text in texts]
+
+
+def test_concurrent_texts_are_sent_in_one_request():
+    async def run():
+        batcher = FakeBatcher()
+        embeddings = await asyncio.gather(
+            batcher.embed("a"), batcher.embed("bb"), batcher.embed("a")
+        )
+        return batcher, embeddings
+
+    batcher, embeddings = asyncio.run(run())
+
+    assert batcher.batches == [["a", "bb"]]
+    assert [embedding[0] for embedding in embeddings] == [1, 2, 1]
+    assert batcher.stats.coalesced == 1
+    assert batcher.stats.requests == 1
+
+
+def test_full_batches_are_sent_right_away():
+    async def run():
+        batcher = FakeBatcher(max_batch_size=2)
+        await asyncio.gather(*[batcher.embed(str(i)) for i in range(5)])
+        return batcher
+
+    batcher = asyncio.run(run())
+    assert [len(batch) for batch in batcher.batches] == [2, 2, 1]
+
+
+def test_batches_stay_under_the_token_limit():
+    async def run():
+        # each text is estimated at 26 tokens
+        batcher = FakeBatcher(max_batch_tokens=60)
+        await asyncio.gather(*[batcher.embed(str(i) * 100) for i in range(5)])
+        return batcher
+
+    batcher = asyncio.run(run())
+    assert [len(batch) for batch in batcher.batches] == [2, 2, 1]
+
+
+def test_a_failed_request_fails_every_caller_in_the_batch():
+    async def run():
+        batcher = FakeBatcher(fail=True)
+        return await asyncio.wait_for(
+            asyncio.gather(
+                batcher.embed("a"), batcher.embed("b"), return_exceptions=True
+            ),
+            timeout=1,
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_a_cancelled_caller_doesnt_cancel_the_batch():
+    async def run():
+        batcher = FakeBatcher()
+        cancelled = asyncio.ensure_future(batcher.embed("a"))
+        waiting = asyncio.ensure_future(batcher.embed("a"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        return await waiting
+
+    assert asyncio.run(run())[0] == 1
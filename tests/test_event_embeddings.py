@@ -0,0 +1,77 @@
+import asyncio
+from uuid import uuid4
+
+import numpy as np
+import pytest
+
+from src.event import base as event_module
+from src.event.base import Event, EventsManager, EventType
+
+
+def event(description: str) -> Event:
+    return Event(
+        type=EventType.NON_MESSAGE, description=description, location_id=uuid4()
+    )
+
+
+@pytest.fixture
+def embedded(monkeypatch):
+    """The descriptions that were sent to be embedded"""
+    embedded = []
+
+    async def get_embedding(text: str) -> np.ndarray:
+        embedded.append(text)
+        await asyncio.sleep(0.01)
+        if text == "fails":
+            raise RuntimeError("API error")
+        return np.array([len(text)], dtype=np.float32)
+
+    monkeypatch.setattr(event_module, "get_embedding", get_embedding)
+    return embedded
+
+
+def test_witnesses_share_each_event_embedding(embedded):
+    rain, thunder = event("it rains"), event("thunder")
+
+    async def run():
+        events_manager = EventsManager(world_id="test", recent_events=[])
+        # two agents observe at the same time, a third one later
+        first, second = await asyncio.gather(
+            events_manager.get_event_embeddings([rain, thunder]),
+            events_manager.get_event_embeddings([thunder]),
+        )
+        later = await events_manager.get_event_embeddings([rain])
+        return first, second, later
+
+    first, second, later = asyncio.run(run())
+    assert sorted(embedded) == ["it rains", "thunder"]
+    assert [embedding[0] for embedding in first] == [8, 7]
+    assert second[0] is first[1]
+    assert later[0] is first[0]
+
+
+def test_failed_embeddings_are_requested_again(embedded):
+    failing = event("fails")
+
+    async def run():
+        events_manager = EventsManager(world_id="test", recent_events=[])
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await events_manager.get_event_embeddings([event("ok"), failing])
+        return events_manager
+
+    events_manager = asyncio.run(run())
+    assert embedded.count("fails") == 2
+    assert failing.id not in events_manager.event_embeddings
+
+
+def test_only_recent_events_are_kept(embedded, monkeypatch):
+    monkeypatch.setattr(event_module, "DERIVED_EVENTS_BUFFER", 2)
+    events = [event(str(i)) for i in range(3)]
+
+    async def run():
+        events_manager = EventsManager(world_id="test", recent_events=[])
+        await events_manager.get_event_embeddings(events)
+        return events_manager
+
+    assert list(asyncio.run(run()).event_embeddings) == [e.id for e in events[1:]]
@@ -0,0 +1,108 @@
+import asyncio
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytz
+
+from src.event import base as event_module
+from src.event.base import REFRESH_OVERLAP_SECONDS, Event, EventsManager, EventType
+
+START = datetime(2023, 5, 1, 12, tzinfo=pytz.utc)
+
+
+def event(seconds: int) -> Event:
+    return Event(
+        type=EventType.NON_MESSAGE,
+        description=f"event at {seconds}",
+        location_id=uuid4(),
+        agent_id=uuid4(),
+        timestamp=START + timedelta(seconds=seconds),
+    )
+
+
+class FakeDatabase:
+    """Has the rows committed so far, and the queries it was asked"""
+
+    def __init__(self):
+        self.events: list[Event] = []
+        self.queries: list[tuple] = []
+
+    async def get_recent_events(self, world_id: str, limit: int) -> list[dict]:
+        self.queries.append(("recent",))
+        await asyncio.sleep(0.01)
+        return [event.db_dict() for event in self.events]
+
+    async def get_events_since(
+        self, world_id: str, timestamp: datetime, limit: int
+    ) -> list[dict]:
+        self.queries.append(("since", timestamp))
+        await asyncio.sleep(0.01)
+        return [
+            event.db_dict() for event in self.events if event.timestamp >= timestamp
+        ]
+
+
+def events_manager_with(database: FakeDatabase, monkeypatch) -> EventsManager:
+    async def get_database():
+        return database
+
+    monkeypatch.setattr(event_module, "get_database", get_database)
+    return EventsManager(world_id="test", recent_events=[])
+
+
+def descriptions(events_manager: EventsManager) -> list[str]:
+    return sorted(event.description for event in events_manager.recent_events)
+
+
+def test_refreshes_only_ask_for_events_since_the_newest_one(monkeypatch):
+    database = FakeDatabase()
+    events_manager = events_manager_with(database, monkeypatch)
+
+    async def run():
+        database.events = [event(0), event(30)]
+        await events_manager.refresh_events()
+
+        # committed after the newest event, but timestamped before it
+        database.events += [event(25), event(40)]
+        await events_manager.refresh_events()
+
+    asyncio.run(run())
+    assert database.queries == [
+        ("recent",),
+        ("since", START + timedelta(seconds=30 - REFRESH_OVERLAP_SECONDS)),
+    ]
+    # the overlap brought event 30 back, it's only added once
+    assert descriptions(events_manager) == [
+        "event at 0",
+        "event at 25",
+        "event at 30",
+        "event at 40",
+    ]
+    assert events_manager.high_water_mark == START + timedelta(seconds=40)
+
+
+def test_concurrent_refreshes_share_one_query(monkeypatch):
+    database = FakeDatabase()
+    database.events = [event(0)]
+    events_manager = events_manager_with(database, monkeypatch)
+
+    async def run():
+        await asyncio.gather(*[events_manager.refresh_events() for _ in range(5)])
+        # a refresh after that one is done queries again
+        await events_manager.refresh_events()
+
+    asyncio.run(run())
+    assert [query[0] for query in database.queries] == ["recent", "since"]
+    assert descriptions(events_manager) == ["event at 0"]
+
+
+def test_events_added_locally_arent_added_again(monkeypatch):
+    database = FakeDatabase()
+    events_manager = events_manager_with(database, monkeypatch)
+    written = event(0)
+    events_manager.add_event(written)
+
+    database.events = [written]
+    asyncio.run(events_manager.refresh_events())
+
+    assert descriptions(events_manager) == ["event at 0"]
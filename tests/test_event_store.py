@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytz
+
+from src.event.base import Event, EventType
+from src.event.store import EventStore
+
+START = datetime(2023, 5, 1, 12, tzinfo=pytz.utc)
+
+
+def event(minutes: int, agent_id=None, location_id=None, witness_ids=(), **kwargs):
+    return Event(
+        type=kwargs.pop("type", EventType.NON_MESSAGE),
+        description=kwargs.pop("description", f"event at {minutes}"),
+        location_id=location_id or uuid4(),
+        agent_id=agent_id,
+        timestamp=START + timedelta(minutes=minutes),
+        witness_ids=list(witness_ids),
+        **kwargs,
+    )
+
+
+def test_query_filters_and_orders_by_timestamp():
+    store = EventStore(capacity=100)
+    alice, bob, kitchen = uuid4(), uuid4(), uuid4()
+
+    late = event(3, agent_id=alice, location_id=kitchen, witness_ids=[alice, bob])
+    early = event(1, agent_id=bob, location_id=kitchen, witness_ids=[alice, bob])
+    elsewhere = event(2, agent_id=alice, witness_ids=[alice])
+    for added in [late, early, elsewhere]:
+        assert store.add(added)
+
+    assert list(store) == [early, elsewhere, late]
+    assert store.query(location_id=kitchen) == [early, late]
+    assert store.query(agent_id=str(alice)) == [elsewhere, late]
+    assert store.query(witness_ids=[bob]) == [early, late]
+    assert store.query(witness_ids=[alice, bob], agent_id=alice) == [late]
+    assert store.query(after=START + timedelta(minutes=1)) == [elsewhere, late]
+    assert store.query(location_id=kitchen, after=START + timedelta(minutes=2)) == [
+        late
+    ]
+    assert store.query(description="event at 2") == [elsewhere]
+
+
+def test_duplicates_are_ignored():
+    store = EventStore(capacity=10)
+    added = event(1)
+    assert store.add(added)
+    assert not store.add(added)
+    assert len(store) == 1
+
+
+def test_oldest_events_are_evicted_over_capacity():
+    store = EventStore(capacity=3)
+    location = uuid4()
+    events = [event(minutes, location_id=location) for minutes in [5, 1, 4, 2, 3]]
+    for added in events:
+        store.add(added)
+
+    assert [e.timestamp.minute for e in store] == [3, 4, 5]
+    assert [e.timestamp.minute for e in store.query(location_id=location)] == [3, 4, 5]
+    assert events[1].id not in store
+
+
+def test_witness_versions_change_with_their_events():
+    store = EventStore(capacity=10)
+    alice, bob = uuid4(), uuid4()
+
+    alice_version = store.witness_version(alice)
+    bob_version = store.witness_version(bob)
+    seen = event(1, witness_ids=[alice])
+    store.add(seen)
+
+    assert store.witness_version(alice) != alice_version
+    assert store.witness_version(bob) == bob_version
+
+    alice_version = store.witness_version(str(alice))
+    store.remove(seen.id)
+    assert store.witness_version(alice) != alice_version
+    assert store.query(witness_ids=[alice]) == []
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+
+import pytest
+
+from src.utils.bus import Topic, get_event_bus
+from src.utils.logging import AgentLogHandler
+from src.web import follower as follower_module
+from src.web.follower import CLIENT_QUEUE_SIZE, LogFollower
+
+
+@pytest.fixture
+def handler(tmp_path):
+    handler = AgentLogHandler(directory=str(tmp_path))
+    yield handler
+    handler.close()
+
+
+def log(handler: AgentLogHandler, *descriptions: str):
+    for description in descriptions:
+        handler.emit(
+            logging.makeLogRecord(
+                {
+                    "msg": description,
+                    "agent_id": "agent",
+                    "agent_name": "Ada",
+                    "color": "AGENT_0",
+                    "title": "Observed",
+                }
+            )
+        )
+
+
+def descriptions(batch: dict) -> list[str]:
+    return [record["description"] for record in batch["records"]]
+
+
+def test_a_reconnecting_client_resumes_from_its_offset(handler, tmp_path):
+    log(handler, "a", "b", "c")
+
+    async def run():
+        follower = LogFollower(str(tmp_path))
+        first = await (await follower.subscribe()).get()
+        resumed = await follower.subscribe(first["records"][1]["offset"])
+        up_to_date = await follower.subscribe(first["offset"])
+        return first, await resumed.get(), await up_to_date.get()
+
+    first, resumed, up_to_date = asyncio.run(run())
+    assert descriptions(first) == ["a", "b", "c"]
+    assert descriptions(resumed) == ["b", "c"]
+    assert descriptions(up_to_date) == []
+    assert resumed["offset"] == up_to_date["offset"] == first["offset"]
+
+
+def test_records_older_than_the_history_are_read_from_disk(
+    handler, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(follower_module, "LOG_HISTORY_SIZE", 2)
+    log(handler, "a", "b", "c", "d")
+
+    async def run():
+        follower = LogFollower(str(tmp_path))
+        latest = await (await follower.subscribe()).get()
+        from_start = await (await follower.subscribe(0)).get()
+        return latest, from_start
+
+    latest, from_start = asyncio.run(run())
+    assert descriptions(latest) == ["c", "d"]
+    assert descriptions(from_start) == ["a", "b", "c", "d"]
+
+
+def test_new_records_are_sent_to_every_client(handler, tmp_path):
+    log(handler, "a")
+
+    async def run():
+        follower = LogFollower(str(tmp_path))
+        clients = [await follower.subscribe() for _ in range(2)]
+        for client in clients:
+            await client.get()
+
+        # the world announces new records on the bus
+        log(handler, "b", "c")
+        get_event_bus().publish(Topic.LOG, None)
+        return [await asyncio.wait_for(client.get(), 1) for client in clients]
+
+    first, second = asyncio.run(run())
+    assert descriptions(first) == descriptions(second) == ["b", "c"]
+
+
+def test_a_slow_client_is_caught_up_in_one_batch(handler, tmp_path):
+    log(handler, "a")
+
+    async def run():
+        follower = LogFollower(str(tmp_path))
+        client = await follower.subscribe()
+        await client.get()
+
+        for i in range(CLIENT_QUEUE_SIZE + 1):
+            log(handler, str(i))
+            records = follower.read_new_records()
+            follower.history.extend(records)
+            client.send({"records": records, "offset": follower.position})
+
+        return client.queue.qsize(), await client.get(), follower.position
+
+    backlog, batch, position = asyncio.run(run())
+    assert backlog == 1
+    assert descriptions(batch) == [str(i) for i in range(CLIENT_QUEUE_SIZE + 1)]
+    assert batch["offset"] == position
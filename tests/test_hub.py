@@ -0,0 +1,73 @@
+import asyncio
+
+from src.web import hub as hub_module
+from src.web.hub import CLIENT_QUEUE_SIZE, WorldClient, WorldHub, diff_world_states
+
+
+def world(name: str = "World", **locations) -> dict:
+    return {
+        "name": name,
+        "agents": [
+            {"full_name": agent, "location": location}
+            for agent, location in sorted(locations.items())
+        ],
+    }
+
+
+def test_diffs_only_have_the_agents_that_changed():
+    old = world(Ada="Kitchen", Bob="Garden", Cy="Hall")
+    new = world(Ada="Kitchen", Bob="Hall", Dee="Garden")
+
+    assert diff_world_states(old, new) == {
+        "type": "diff",
+        "updated": [
+            {"full_name": "Bob", "location": "Hall"},
+            {"full_name": "Dee", "location": "Garden"},
+        ],
+        "removed": ["Cy"],
+    }
+    assert diff_world_states(old, world("Renamed", Ada="Kitchen"))["name"] == "Renamed"
+    assert diff_world_states(old, old) is None
+
+
+def test_a_slow_client_is_sent_a_snapshot_instead_of_its_backlog():
+    async def run():
+        hub = WorldHub()
+        hub.state = world(Ada="Kitchen")
+        slow, fast = WorldClient(hub), WorldClient(hub)
+
+        for i in range(CLIENT_QUEUE_SIZE + 1):
+            diff = {"type": "diff", "updated": [], "removed": [str(i)]}
+            slow.send(diff)
+            fast.send(diff)
+            await fast.queue.get()
+
+        return slow.queue
+
+    backlog = asyncio.run(run())
+    assert backlog.qsize() == 1
+    assert backlog.get_nowait() == {"type": "snapshot", **world(Ada="Kitchen")}
+
+
+def test_every_client_gets_the_same_diff(monkeypatch):
+    states = [world(Ada="Kitchen"), world(Ada="Garden"), world(Ada="Garden")]
+
+    async def load_world_state():
+        return states.pop(0)
+
+    monkeypatch.setattr(hub_module, "load_world_state", load_world_state)
+
+    async def run():
+        hub = WorldHub()
+        # the run loop isn't needed to test the updates
+        hub._task = asyncio.get_running_loop().create_future()
+        clients = [await hub.subscribe() for _ in range(2)]
+        await hub.update()
+        # nothing changed, nothing is sent
+        await hub.update()
+        return [[client.queue.get_nowait() for _ in range(2)] for client in clients]
+
+    first, second = asyncio.run(run())
+    assert first == second
+    assert first[0]["type"] == "snapshot"
+    assert first[1]["updated"] == [{"full_name": "Ada", "location": "Garden"}]
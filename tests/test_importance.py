@@ -0,0 +1,64 @@
+import asyncio
+
+from langchain.llms.fake import FakeListLLM
+
+from src.agent import base as agent_module
+from src.agent.base import Agent
+
+
+class FakeChatModel:
+    """Answers with the next of its responses, and keeps the prompts it was sent"""
+
+    responses: list[str] = []
+    prompts: list = []
+
+    def __init__(self, *args, **kwargs):
+        self.defaultModel = FakeListLLM(responses=["{}"])
+
+    async def get_chat_completion(self, messages, **kwargs) -> str:
+        FakeChatModel.prompts.append(messages[0].content)
+        return FakeChatModel.responses.pop(0)
+
+
+class Rater:
+    full_name = "Bob Smith"
+    private_bio = "Bob is a plumber"
+
+    _calculate_importance = Agent._calculate_importance
+    _calculate_importances = Agent._calculate_importances
+
+
+def rate(monkeypatch, descriptions: list[str], responses: list[str]):
+    monkeypatch.setattr(agent_module, "ChatModel", FakeChatModel)
+    monkeypatch.setattr(FakeChatModel, "responses", list(responses))
+    monkeypatch.setattr(FakeChatModel, "prompts", [])
+    return asyncio.run(Rater()._calculate_importances(descriptions))
+
+
+def test_observations_are_rated_in_one_request(monkeypatch):
+    descriptions = ["Bob sees a cat", "Bob's pipe bursts", "Bob eats lunch"]
+    ratings = rate(monkeypatch, descriptions, ['{"ratings": [2, 8, 1]}'])
+
+    assert ratings == [2, 8, 1]
+    assert len(FakeChatModel.prompts) == 1
+    assert "1. Bob sees a cat\n2. Bob's pipe bursts\n3. Bob eats lunch" in (
+        FakeChatModel.prompts[0]
+    )
+
+
+def test_a_single_observation_uses_the_single_prompt(monkeypatch):
+    ratings = rate(monkeypatch, ["Bob sees a cat"], ['{"rating": 3}'])
+
+    assert ratings == [3]
+    assert "Memory:Bob sees a cat" in FakeChatModel.prompts[0]
+
+
+def test_the_wrong_number_of_ratings_falls_back_to_one_request_each(monkeypatch):
+    ratings = rate(
+        monkeypatch,
+        ["Bob sees a cat", "Bob's pipe bursts"],
+        ['{"ratings": [4]}', '{"rating": 5}', '{"rating": 5}'],
+    )
+
+    assert ratings == [5, 5]
+    assert len(FakeChatModel.prompts) == 3
@@ -0,0 +1,172 @@
+import asyncio
+import time
+
+import pytest
+
+from src.utils import models as models_module
+from src.utils.model_name import ChatModelName
+from src.utils.models import (
+    RATE_CUT,
+    RATE_RECOVERY,
+    ChatModel,
+    LLMScheduler,
+    ModelLimiter,
+    Priority,
+    TokenBucket,
+    llm_priority,
+)
+
+
+class RateLimitError(Exception):
+    http_status = 429
+
+
+class ServerError(Exception):
+    http_status = 503
+
+
+def test_token_bucket_wait_times():
+    bucket = TokenBucket(per_minute=60)
+    bucket.level = 0
+    bucket.updated = 100.0
+
+    # refills one per second
+    assert bucket.wait_time(30, now=100.0, scale=1.0) == pytest.approx(30)
+    assert bucket.wait_time(30, now=110.0, scale=1.0) == pytest.approx(20)
+    # at half the rate it takes twice as long
+    assert bucket.wait_time(30, now=110.0, scale=0.5) == pytest.approx(40)
+    # more than the bucket holds only needs it full
+    assert bucket.wait_time(1000, now=110.0, scale=1.0) == pytest.approx(50)
+
+    bucket.level = 60
+    assert bucket.wait_time(60, now=110.0, scale=1.0) == 0
+
+
+def test_waiting_calls_are_admitted_by_priority():
+    async def run():
+        # a request every 10ms, and none available to start with
+        limiter = ModelLimiter(requests_per_minute=6000, tokens_per_minute=10**9)
+        limiter.requests.level = 0
+        admitted = []
+
+        async def call(name, priority):
+            await limiter.acquire(1, priority)
+            admitted.append(name)
+
+        await asyncio.gather(
+            call("low", Priority.LOW),
+            call("normal", Priority.NORMAL),
+            call("first high", Priority.HIGH),
+            call("second high", Priority.HIGH),
+        )
+        return admitted, limiter.stats
+
+    admitted, stats = asyncio.run(run())
+    assert admitted == ["first high", "second high", "normal", "low"]
+    assert stats.calls[Priority.HIGH] == 2
+    assert stats.max_queue_depth == 4
+
+
+def test_calls_wait_for_tokens():
+    async def run():
+        # 600 tokens a second
+        limiter = ModelLimiter(requests_per_minute=10**6, tokens_per_minute=36000)
+        limiter.tokens.level = 0
+        started = time.monotonic()
+        await limiter.acquire(60, Priority.NORMAL)
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) == pytest.approx(0.1, abs=0.05)
+
+
+def test_rate_limited_calls_back_off_and_retry():
+    async def run():
+        scheduler = LLMScheduler()
+        limiter = scheduler.limiter("model")
+        limiter.backoff = 0.05
+        attempts = []
+
+        async def call():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise RateLimitError()
+            return "completion"
+
+        with llm_priority(Priority.LOW):
+            result = await scheduler.run("model", 10, call)
+        return result, attempts, limiter
+
+    result, attempts, limiter = asyncio.run(run())
+    assert result == "completion"
+    assert attempts[1] - attempts[0] >= 0.05
+    assert limiter.stats.rate_limited == 1
+    assert limiter.stats.calls[Priority.LOW] == 2
+    # the budget was cut, and grows back with the success
+    assert limiter.rate_scale == pytest.approx(RATE_CUT + RATE_RECOVERY)
+
+
+def test_other_errors_are_not_retried():
+    async def run():
+        scheduler = LLMScheduler()
+        attempts = []
+
+        async def call():
+            attempts.append(1)
+            raise ValueError("bad request")
+
+        with pytest.raises(ValueError):
+            await scheduler.run("model", 10, call)
+        return attempts, scheduler.limiter("model").stats.rate_limited
+
+    assert asyncio.run(run()) == ([1], 0)
+
+
+def test_server_errors_are_retried_without_cutting_the_budget(monkeypatch):
+    monkeypatch.setattr(models_module, "MIN_BACKOFF_SECONDS", 0.05)
+
+    async def run():
+        scheduler = LLMScheduler()
+        attempts = []
+
+        async def call():
+            attempts.append(time.monotonic())
+            if len(attempts) < 3:
+                raise ServerError()
+            return "completion"
+
+        result = await scheduler.run("model", 10, call)
+        return result, attempts, scheduler.limiter("model")
+
+    result, attempts, limiter = asyncio.run(run())
+    assert result == "completion"
+    # the backoff doubles between attempts
+    assert attempts[1] - attempts[0] >= 0.05
+    assert attempts[2] - attempts[1] >= 0.1
+    assert limiter.stats.rate_limited == 0
+    assert limiter.rate_scale == 1.0
+
+
+def test_only_scheduled_calls_skip_langchains_retries(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    chat_model = ChatModel(ChatModelName.GPT4, ChatModelName.TURBO)
+
+    # chains and parsers call the models directly, and the scheduler can't retry
+    assert chat_model.defaultModel.max_retries > 1
+    assert chat_model.backupModel.max_retries > 1
+    assert chat_model._scheduled_default.max_retries == 1
+    assert chat_model._scheduled_default.model_name == ChatModelName.GPT4.value
+    assert chat_model._scheduled_backup.max_retries == 1
+
+
+def test_cancelled_waiters_are_skipped():
+    async def run():
+        limiter = ModelLimiter(requests_per_minute=6000, tokens_per_minute=10**9)
+        limiter.requests.level = 0
+        cancelled = asyncio.ensure_future(limiter.acquire(1, Priority.HIGH))
+        waiting = asyncio.ensure_future(limiter.acquire(1, Priority.LOW))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.wait_for(waiting, timeout=1)
+        return limiter.queue_depth
+
+    assert asyncio.run(run()) == 0
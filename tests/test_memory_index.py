@@ -0,0 +1,113 @@
+import asyncio
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import numpy as np
+import pytz
+
+from src.memory.ann import IVFIndex
+from src.memory.index import MemoryIndex
+
+
+class Memory:
+    def __init__(self, embedding: np.ndarray, importance: float = 0.5, age_hours=0):
+        self.id = uuid4()
+        self.embedding = embedding
+        self.importance = importance
+        self.created_at = datetime.now(pytz.utc) - timedelta(hours=age_hours)
+        self.last_accessed = None
+
+    def update_last_accessed(self):
+        self.last_accessed = datetime.now(pytz.utc)
+
+
+def random_memories(count: int, dimensions: int = 32, seed: int = 0) -> list[Memory]:
+    rng = np.random.default_rng(seed)
+    return [
+        Memory(rng.standard_normal(dimensions).astype(np.float32), rng.random())
+        for _ in range(count)
+    ]
+
+
+def test_top_k_matches_scoring_every_memory():
+    memories = random_memories(500)
+    index = MemoryIndex(memories, ann_threshold=None)
+    query = np.random.default_rng(1).standard_normal(32)
+
+    relevance = index.relevance(query)
+    expected = set(np.argsort(-relevance)[:10])
+
+    assert set(index.top_k(query, 10)) == expected
+    assert len(index.top_k(query, 1000)) == 500
+
+
+def test_shared_embeddings_are_views_into_the_index():
+    memories = random_memories(100)
+    index = MemoryIndex(memories, capacity=4)
+
+    # the arrays grew several times, every memory still points at its row
+    for row, memory in enumerate(index.memories):
+        assert np.shares_memory(memory.embedding, index.embeddings)
+        assert np.array_equal(memory.embedding, index.embeddings[row])
+
+
+def test_version_changes_with_every_memory():
+    index = MemoryIndex(random_memories(3))
+    version = index.version
+    index.add(random_memories(1, seed=2)[0])
+    assert index.version != version
+
+
+def test_ivf_search_finds_the_nearest_cluster():
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((20, 32))
+    vectors = np.concatenate(
+        [center + 0.05 * rng.standard_normal((50, 32)) for center in centers]
+    ).astype(np.float32)
+
+    ann = IVFIndex(n_lists=20, n_probe=2)
+    ann.train(vectors)
+
+    rows = ann.search(centers[3])
+    assert set(range(150, 200)) <= set(rows)
+    assert len(rows) < len(vectors)
+
+
+def test_index_is_trained_inline_without_an_event_loop():
+    index = MemoryIndex(random_memories(200), ann_threshold=100)
+    assert index.ann is not None
+    assert sum(len(rows) for rows in index.ann.lists) == 200
+
+
+def test_index_is_trained_off_the_loop_and_swapped_in():
+    async def run():
+        index = MemoryIndex(ann_threshold=100)
+        for memory in random_memories(100):
+            index.add(memory)
+
+        # training has started, until it's done every row is scored
+        assert index.ann is None
+        assert index._training is not None
+        query = np.ones(32)
+        assert set(index.top_k(query, 5)) == set(index.top_k(query, 5, exact=True))
+
+        # rows added while it trains are bucketed when it's swapped in
+        for memory in random_memories(10, seed=1):
+            index.add(memory)
+        await index.wait_for_ann()
+
+        assert index.ann is not None
+        assert sorted(row for rows in index.ann.lists for row in rows) == list(
+            range(110)
+        )
+
+        # a retrain keeps the old index until the new one is ready
+        old = index.ann
+        for memory in random_memories(400, seed=2):
+            index.add(memory)
+        assert index.ann is old
+        await index.wait_for_ann()
+        assert index.ann is not old
+        assert sum(len(rows) for rows in index.ann.lists) == 510
+
+    asyncio.run(run())
@@ -0,0 +1,247 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import numpy as np
+import pytz
+
+from src.event.base import (
+    Event,
+    EventsManager,
+    EventType,
+    MessageEventSubtype,
+    WaitSubscription,
+)
+from src.world.scheduler import PriorityScheduler, RoundRobinScheduler
+
+
+class LocalEventsManager(EventsManager):
+    """Only has the events added to it, there's no database to refresh from"""
+
+    async def refresh_events(self) -> None:
+        return
+
+
+class FakeAgent:
+    def __init__(self, name: str, waiting: bool = False):
+        self.name = name
+        self.id = uuid4()
+        self.last_checked_events = datetime.now(pytz.utc) - timedelta(minutes=1)
+        self.is_waiting = waiting
+
+
+LOCATION_ID = uuid4()
+
+
+def message(recipient: FakeAgent, seconds_ago: float = 0, sender=None) -> Event:
+    return Event(
+        type=EventType.MESSAGE,
+        subtype=MessageEventSubtype.HUMAN_AGENT_REPLY,
+        description="hello",
+        location_id=LOCATION_ID,
+        agent_id=sender.id if sender else None,
+        witness_ids=[recipient.id] + ([sender.id] if sender else []),
+        timestamp=datetime.now(pytz.utc) - timedelta(seconds=seconds_ago),
+    )
+
+
+def observation(witness: FakeAgent, description: str = "it started raining") -> Event:
+    return Event(
+        type=EventType.NON_MESSAGE,
+        description=description,
+        location_id=LOCATION_ID,
+        witness_ids=[witness.id],
+    )
+
+
+def scheduler_for(*agents, **kwargs) -> tuple[PriorityScheduler, EventsManager]:
+    events_manager = LocalEventsManager(world_id="test", recent_events=[])
+    scheduler = PriorityScheduler(events_manager, **kwargs)
+    for agent in agents:
+        scheduler.add(agent)
+    return scheduler, events_manager
+
+
+async def next_agent(scheduler, timeout: float = 1) -> FakeAgent:
+    return await asyncio.wait_for(scheduler.next(), timeout)
+
+
+def test_round_robin_runs_every_agent_in_turn():
+    async def run():
+        scheduler = RoundRobinScheduler()
+        agents = [FakeAgent(name) for name in "abc"]
+        for agent in agents:
+            scheduler.add(agent)
+
+        picked = []
+        for _ in range(6):
+            agent = await scheduler.next()
+            picked.append(agent.name)
+            scheduler.done(agent)
+        return picked
+
+    assert asyncio.run(run()) == list("abcabc")
+
+
+def test_unread_messages_go_first_then_unread_events():
+    async def run():
+        idle, observer, newer, older = (
+            FakeAgent(name) for name in ["idle", "observer", "newer", "older"]
+        )
+        scheduler, events_manager = scheduler_for(idle, observer, newer, older)
+        events_manager.add_event(observation(observer))
+        events_manager.add_event(message(newer, seconds_ago=1))
+        events_manager.add_event(message(older, seconds_ago=5))
+
+        return [(await next_agent(scheduler)).name for _ in range(4)]
+
+    assert asyncio.run(run()) == ["older", "newer", "observer", "idle"]
+
+
+def test_an_agent_only_runs_in_one_loop_at_a_time():
+    async def run():
+        only = FakeAgent("only")
+        scheduler, _ = scheduler_for(only)
+        assert await next_agent(scheduler) is only
+
+        second = asyncio.ensure_future(scheduler.next())
+        await asyncio.sleep(0.02)
+        assert not second.done()
+
+        scheduler.done(only)
+        second.cancel()
+        return await next_agent(scheduler)
+
+    assert asyncio.run(run()).name == "only"
+
+
+def test_waiting_agents_back_off_until_something_happens():
+    async def run():
+        waiting = FakeAgent("waiting", waiting=True)
+        scheduler, events_manager = scheduler_for(
+            waiting, wait_backoff=0.05, max_wait_backoff=0.1
+        )
+
+        assert await next_agent(scheduler) is waiting
+        scheduler.done(waiting)
+        started = time.monotonic()
+        await next_agent(scheduler)
+        first_backoff = time.monotonic() - started
+
+        # the backoff doubles for every step it keeps waiting
+        scheduler.done(waiting)
+        started = time.monotonic()
+        await next_agent(scheduler)
+        second_backoff = time.monotonic() - started
+
+        # a message wakes it right away
+        scheduler.done(waiting)
+        asyncio.get_running_loop().call_later(
+            0.01, events_manager.add_event, message(waiting)
+        )
+        started = time.monotonic()
+        await next_agent(scheduler)
+        return first_backoff, second_backoff, time.monotonic() - started
+
+    first_backoff, second_backoff, woken = asyncio.run(run())
+    assert first_backoff >= 0.04
+    assert second_backoff >= 0.09
+    assert woken < 0.05
+
+
+def test_parked_agents_are_skipped_until_a_message_wakes_them():
+    async def run():
+        parked, other = FakeAgent("parked", waiting=True), FakeAgent("other")
+        scheduler, events_manager = scheduler_for(parked, other)
+        events_manager.subscribe_wait(WaitSubscription(parked.id, "a reply", None))
+
+        assert await next_agent(scheduler) is other
+        scheduler.done(other)
+        assert await next_agent(scheduler) is other
+
+        # an event that doesn't match keeps it parked
+        events_manager.add_event(observation(parked))
+        assert events_manager.get_wait(parked.id).parked
+
+        # a message doesn't need to match
+        asyncio.get_running_loop().call_later(
+            0.01, events_manager.add_event, message(parked, sender=other)
+        )
+        woken = await next_agent(scheduler)
+        return woken, events_manager.get_wait(parked.id)
+
+    woken, subscription = asyncio.run(run())
+    assert woken.name == "parked"
+    assert not subscription.parked
+    assert subscription.woken_by.description == "hello"
+
+
+def test_parked_waits_time_out():
+    async def run():
+        parked = FakeAgent("parked", waiting=True)
+        scheduler, events_manager = scheduler_for(parked)
+        events_manager.subscribe_wait(
+            WaitSubscription(parked.id, "a reply", None, timeout=0.05)
+        )
+
+        started = time.monotonic()
+        agent = await next_agent(scheduler)
+        return agent, time.monotonic() - started, events_manager.get_wait(parked.id)
+
+    agent, waited, subscription = asyncio.run(run())
+    assert agent.name == "parked"
+    assert waited >= 0.04
+    assert not subscription.parked
+    assert subscription.woken_by is None
+
+
+def test_a_parked_agent_that_stopped_waiting_is_scheduled():
+    async def run():
+        agent = FakeAgent("agent", waiting=False)
+        scheduler, events_manager = scheduler_for(agent)
+        events_manager.subscribe_wait(WaitSubscription(agent.id, "a reply", None))
+        return await next_agent(scheduler)
+
+    assert asyncio.run(run()).name == "agent"
+
+
+def test_similar_events_wake_a_parked_agent():
+    async def embeddings(events):
+        return [
+            np.array([1.0, 0.0] if "meeting" in event.description else [0.0, 1.0])
+            for event in events
+        ]
+
+    async def run():
+        parked = FakeAgent("parked", waiting=True)
+        _, events_manager = scheduler_for(parked)
+        # pydantic models don't take new attributes
+        object.__setattr__(events_manager, "get_event_embeddings", embeddings)
+        events_manager.subscribe_wait(
+            WaitSubscription(parked.id, "the meeting to start", np.array([1.0, 0.1]))
+        )
+
+        events_manager.add_event(observation(parked, "it started raining"))
+        await asyncio.sleep(0.01)
+        still_parked = events_manager.get_wait(parked.id).parked
+
+        events_manager.add_event(observation(parked, "the meeting started"))
+        woke = await events_manager.wait_for_new_events(1)
+        return still_parked, woke, events_manager.get_wait(parked.id)
+
+    still_parked, woke, subscription = asyncio.run(run())
+    assert still_parked
+    assert woke
+    assert subscription.woken_by.description == "the meeting started"
+
+
+def test_agents_arent_woken_by_their_own_events():
+    async def run():
+        parked = FakeAgent("parked", waiting=True)
+        _, events_manager = scheduler_for(parked)
+        events_manager.subscribe_wait(WaitSubscription(parked.id, "a reply", None))
+        events_manager.add_event(message(FakeAgent("someone"), sender=parked))
+        return events_manager.get_wait(parked.id)
+
+    assert asyncio.run(run()).parked
@@ -0,0 +1,156 @@
+import asyncio
+import json
+
+import aiosqlite
+import numpy as np
+import pytest
+
+from src.utils.database.base import Tables
+from src.utils.database.codecs import COLUMN_DECODERS, decode_embedding, encode_value
+from src.utils.database.migrations import (
+    SCHEMA_VERSION,
+    configure,
+    get_schema_version,
+    migrate,
+)
+from src.utils.database.sqlite import SqliteDatabase
+
+
+@pytest.fixture
+def database_dir(tmp_path, monkeypatch):
+    # the database is opened from the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+async def committed_world_ids(path) -> list[str]:
+    """Reads through a second connection, so only committed rows are seen"""
+    async with aiosqlite.connect(path) as connection:
+        async with connection.execute("SELECT id FROM worlds ORDER BY id") as cursor:
+            return [row[0] for row in await cursor.fetchall()]
+
+
+def world(id: str) -> dict:
+    return {"id": id, "name": id}
+
+
+def test_transaction_commits_together_or_rolls_back(database_dir):
+    async def run():
+        database = await SqliteDatabase.create()
+        announced = []
+        try:
+            with pytest.raises(RuntimeError):
+                async with database.transaction():
+                    await database.insert(Tables.Worlds, world("rolled-back"))
+                    database.after_commit(lambda: announced.append("rolled-back"))
+                    raise RuntimeError("step failed")
+
+            async with database.transaction():
+                await database.insert(Tables.Worlds, world("a"))
+                # nested blocks join the outer transaction
+                async with database.transaction():
+                    await database.insert(Tables.Worlds, world("b"))
+                database.after_commit(lambda: announced.append("a and b"))
+                assert announced == []
+                assert await committed_world_ids(database_dir / "database.db") == []
+
+            # outside a transaction callbacks run right away
+            database.after_commit(lambda: announced.append("now"))
+
+            return announced, await committed_world_ids(database_dir / "database.db")
+        finally:
+            await database.client.close()
+
+    announced, committed = asyncio.run(run())
+    assert announced == ["a and b", "now"]
+    assert committed == ["a", "b"]
+
+
+def test_tasks_started_in_a_transaction_commit_on_their_own(database_dir):
+    async def run():
+        database = await SqliteDatabase.create()
+        try:
+            async with database.transaction():
+                await database.insert(Tables.Worlds, world("outer"))
+
+                async def outlives_the_block():
+                    await asyncio.sleep(0.02)
+                    await database.insert(Tables.Worlds, world("late"))
+
+                task = asyncio.ensure_future(outlives_the_block())
+            await task
+            return await committed_world_ids(database_dir / "database.db")
+        finally:
+            await database.client.close()
+
+    assert asyncio.run(run()) == ["late", "outer"]
+
+
+def test_migrations_step_through_every_version(tmp_path):
+    async def run():
+        async with aiosqlite.connect(tmp_path / "database.db") as connection:
+            await configure(connection)
+            assert await get_schema_version(connection) == 0
+
+            # a database from before embeddings were stored as BLOBs
+            assert await migrate(connection, target=SCHEMA_VERSION - 1) == (
+                SCHEMA_VERSION - 1
+            )
+            await connection.execute(
+                "INSERT INTO memories (id, description, embedding) VALUES (?, ?, ?)",
+                ("memory", "a memory", json.dumps([0.5, 0.25])),
+            )
+            await connection.commit()
+
+            assert await migrate(connection) == SCHEMA_VERSION
+            # already up to date
+            assert await migrate(connection) == SCHEMA_VERSION
+
+            async with connection.execute(
+                "SELECT typeof(embedding), embedding FROM memories"
+            ) as cursor:
+                return await cursor.fetchone()
+
+    storage, embedding = asyncio.run(run())
+    assert storage == "blob"
+    assert decode_embedding(embedding).tolist() == [0.5, 0.25]
+
+
+def test_values_round_trip_through_the_codecs():
+    embedding = np.array([0.1, 0.2, 0.3], dtype=np.float32)
+
+    assert np.array_equal(
+        COLUMN_DECODERS["embedding"](encode_value(embedding)), embedding
+    )
+    assert COLUMN_DECODERS["witness_ids"](encode_value(["a", "b"])) == ["a", "b"]
+    assert COLUMN_DECODERS["metadata"](encode_value({"turns": 2})) == {"turns": 2}
+    # JSON text embeddings from old rows still decode
+    assert decode_embedding("[0.5, 0.25]").tolist() == [0.5, 0.25]
+    assert encode_value("text") == "text"
+    # undeclared columns are left as SQLite returned them
+    assert "description" not in COLUMN_DECODERS
+
+
+def test_embeddings_are_stored_as_float32_blobs(database_dir):
+    embedding = np.array([0.1, -2.5, 3.0], dtype=np.float64)
+
+    async def run():
+        database = await SqliteDatabase.create()
+        try:
+            await database.insert(
+                Tables.Memories,
+                {"id": "memory", "description": "a memory", "embedding": embedding},
+            )
+            async with database.client.execute(
+                "SELECT typeof(embedding) AS storage, length(embedding) AS size"
+                " FROM memories"
+            ) as cursor:
+                storage = await cursor.fetchone()
+            return storage, await database.get_by_id(Tables.Memories, "memory")
+        finally:
+            await database.client.close()
+
+    storage, rows = asyncio.run(run())
+    assert storage == {"storage": "blob", "size": 12}
+    assert rows[0]["embedding"].dtype == np.float32
+    assert np.array_equal(rows[0]["embedding"], embedding.astype(np.float32))
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from src.agent.step import StepGraph
+
+
+def test_stages_run_after_their_requirements():
+    order = []
+
+    async def stage(name, result):
+        order.append(f"{name} started")
+        await asyncio.sleep(0.01)
+        order.append(f"{name} done")
+        return result
+
+    async def combine(a, b):
+        order.append("combine")
+        return a + b
+
+    graph = StepGraph()
+    graph.add("a", lambda: stage("a", 1))
+    graph.add("b", lambda: stage("b", 2))
+    graph.add("combine", combine, "a", "b")
+
+    assert asyncio.run(graph.run("combine")) == [3]
+    # a and b run concurrently, combine only once both are done
+    assert order[:2] == ["a started", "b started"]
+    assert order[-1] == "combine"
+    assert set(graph.timings) == {"a", "b", "combine"}
+
+
+def test_shared_requirement_runs_once():
+    calls = []
+
+    async def observe():
+        calls.append("observe")
+        return "events"
+
+    async def plan(events):
+        return f"plan for {events}"
+
+    async def react(events):
+        return f"reaction to {events}"
+
+    graph = StepGraph()
+    graph.add("observe", observe)
+    graph.add("plan", plan, "observe")
+    graph.add("react", react, "observe")
+
+    assert asyncio.run(graph.run("plan", "react")) == [
+        "plan for events",
+        "reaction to events",
+    ]
+    assert calls == ["observe"]
+
+
+def test_after_waits_without_taking_the_result():
+    order = []
+
+    async def write():
+        await asyncio.sleep(0.01)
+        order.append("write")
+
+    async def reflect():
+        order.append("reflect")
+        return "reflected"
+
+    graph = StepGraph()
+    graph.add("write", write)
+    graph.add("reflect", reflect, after=["write"])
+
+    assert asyncio.run(graph.run("reflect")) == ["reflected"]
+    assert order == ["write", "reflect"]
+
+
+def test_unknown_and_cyclic_requirements_are_rejected():
+    async def stage(*_):
+        return None
+
+    graph = StepGraph()
+    graph.add("a", stage)
+
+    with pytest.raises(ValueError):
+        graph.add("b", stage, "missing")
+    with pytest.raises(ValueError):
+        graph.add("c", stage, after=["missing"])
+    # a stage can only require stages added before it, so there are no cycles
+    with pytest.raises(ValueError):
+        graph.add("d", stage, "d")
+
+
+def test_failed_stage_cancels_the_rest():
+    cancelled = []
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("stage failed")
+
+    async def slow():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append("slow")
+            raise
+
+    async def run():
+        graph = StepGraph()
+        graph.add("fail", fail)
+        graph.add("slow", slow)
+        with pytest.raises(RuntimeError):
+            await graph.run("fail", "slow")
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert cancelled == ["slow"]
@@ -0,0 +1,71 @@
+import asyncio
+import json
+import os
+
+import numpy as np
+
+# the client module connects on import, a well-formed placeholder is enough
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "header.payload.signature")
+
+from src.utils.database import supabase as supabase_module  # noqa: E402
+from src.utils.database.base import Tables  # noqa: E402
+from src.utils.database.supabase import SupabaseDatabase  # noqa: E402
+
+
+class FakeRequest:
+    def __init__(self, sent: list, payload):
+        # postgrest sends every payload as JSON
+        sent.append(json.loads(json.dumps(payload)))
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    async def execute(self):
+        return self
+
+
+class FakeClient:
+    def __init__(self):
+        self.sent = []
+
+    def table(self, name: str):
+        client = self
+
+        class Table:
+            def insert(self, data, upsert=False):
+                return FakeRequest(client.sent, data)
+
+            def update(self, data):
+                return FakeRequest(client.sent, data)
+
+        return Table()
+
+    async def rpc(self, name: str, params: dict):
+        request = FakeRequest(self.sent, params)
+        request.data = []
+        return request
+
+
+def test_cached_float32_embeddings_are_sent_as_json(monkeypatch):
+    async def get_embedding(text: str) -> np.ndarray:
+        # the embedding cache hands back float32 arrays
+        return np.array([0.25, 0.5], dtype=np.float32)
+
+    monkeypatch.setattr(supabase_module, "get_embedding", get_embedding)
+    client = FakeClient()
+    database = SupabaseDatabase(client)
+
+    async def run():
+        await database.search_document_embeddings("a question", limit=3)
+        await database.insert_document_with_embedding({"id": "doc"}, "a document")
+        await database.update(
+            Tables.Memories, "memory", {"embedding": await get_embedding("memory")}
+        )
+
+    asyncio.run(run())
+    search, document, memory = client.sent
+    assert search["query_embedding"] == [0.25, 0.5]
+    assert search["match_count"] == 3
+    assert document == {"id": "doc", "embedding": "[0.25, 0.5]"}
+    assert memory == {"embedding": "[0.25, 0.5]"}